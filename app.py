@@ -1,18 +1,31 @@
 # app.py
 import io
-import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import shutil
+import tempfile
+import uuid
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Tuple
 
 import pandas as pd
 import streamlit as st
-from lxml import etree
-from openpyxl.utils import get_column_letter  # p/ formatar colunas no Excel
 
 # parsers/__init__.py deve expor: NFe, NFCe, NFSe ABRASF, Evento NFe, NFSe RN (Prestado/Tomado), CT-e (se tiver)
-from parsers import ALL_PARSERS, get_parser_by_name
-from utils.io import iter_xml_paths_from_dir
+from parsers import ALL_PARSERS
+from utils.aggregates import GROUP_COLS, VALUE_COLS, Aggregates
+from utils.blobs import BlobStore, read_original
+from utils.diff import diff_frames, diff_summary
+from utils.events import EventIndex
+from utils.reconcile import read_key_list, reconcile
+from utils.textindex import TextIndex
+from utils.xsd import XsdValidator, schema_dir
+from utils.io import iter_xml_entries
+from utils.postprocess import EXCEL_COLUMNS, read_frame, strip_tz_for_excel
+from utils.spill import SpillWriter, export_parts
+from utils.autotune import ConcurrencyTuner
+from utils.checkpoint import RunCheckpoint, pending_inputs, valid_run_id
+from utils.store import DB_PATH, DocStore
+from utils.jobs import CANCELED, DONE, FINAL_STATES, QUEUED, ResultSink, get_manager
+from utils.memory import MemoryGuard, format_peaks
 
 # ---------------------------
 # Config da página
@@ -25,6 +38,16 @@ if "df" not in st.session_state:
     st.session_state.df_view = None
     st.session_state.erros = None
     st.session_state.paths = []
+    st.session_state.run_stats = None
+    st.session_state.spill = None
+    st.session_state.job_id = None
+    st.session_state.job_msg = None
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.blobs = None
+    st.session_state.text_index = None
+    st.session_state.aggregates = None
+    st.session_state.events = None
+    st.session_state.cte_links = None
 
 # --- CSS/Estilo ---
 st.markdown("""
@@ -99,215 +122,111 @@ with colB:
 
 colC, colD = st.columns([1,1])
 with colC:
+    auto_workers = st.checkbox(
+        "Paralelismo automático", value=True,
+        help="Mede arquivos/s e tempo de I/O x CPU nos primeiros segundos e escolhe o nº de threads."
+    )
     max_workers = st.slider(
-        "Paralelismo (threads)",
+        "Paralelismo (threads)" + (" — máximo" if auto_workers else ""),
         min_value=4, max_value=64, value=64,step=4,
-        help="Ajuste conforme CPU e armazenamento."
+        help="Máximo de arquivos desta execução em paralelo. O servidor tem um pool único, "
+             "dividido entre todas as sessões."
     )
 with colD:
     inclui_eventos = st.checkbox("Incluir eventos (procEventoNFe) na tabela principal", value=True)
 
-processar = st.button("Processar")
-st.markdown('</div>', unsafe_allow_html=True)
+with st.expander("Avançado: leitura de disco"):
+    colE, colF = st.columns(2)
+    with colE:
+        io_workers = st.slider(
+            "Threads de leitura (I/O)", min_value=1, max_value=32, value=8,
+            help="Leem os arquivos à frente do parse. Aumente para compartilhamentos de rede lentos."
+        )
+    with colF:
+        readahead_mb = st.number_input(
+            "Read-ahead máximo (MB)", min_value=8, max_value=4096, value=256, step=32,
+            help="Bytes lidos e ainda não parseados. Limita a memória da fila entre leitura e parse."
+        )
+    colE2, colF2 = st.columns(2)
+    with colE2:
+        max_arquivo_mb = st.number_input(
+            "Tamanho máximo por arquivo (MB, 0 = sem limite)", min_value=0, max_value=4096, value=0, step=10,
+            help="Arquivos maiores são lidos à parte, na quarentena (processo isolado com prazo próprio)."
+        )
+    with colF2:
+        timeout_arquivo = st.number_input(
+            "Prazo por arquivo (s, 0 = sem prazo)", min_value=0, max_value=3600, value=0, step=5,
+            help="Arquivo que passa do prazo sai do lote principal e vai para a quarentena; "
+                 "se falhar lá também, aparece na aba Erros com o motivo."
+        )
+    guardar_xml = st.checkbox(
+        "Guardar cópia dos XMLs do diretório", value=False,
+        help="Permite abrir o XML original de qualquer linha mesmo que o arquivo mude de lugar. "
+             "Uploads são sempre guardados (em disco, fora da memória)."
+    )
+    colX1, colX2 = st.columns([1, 2])
+    with colX1:
+        validar_xsd = st.checkbox(
+            "Validar contra o XSD", value=False,
+            help="Cada XML é validado no parse contra os esquemas oficiais (pacotes de liberação da SEFAZ). "
+                 "Os inválidos vão para a aba Erros com a mensagem do esquema."
+        )
+    with colX2:
+        xsd_dir = st.text_input("Pasta dos esquemas XSD", value=str(schema_dir()),
+                                disabled=not validar_xsd).strip()
+
+with st.expander("Avançado: resultados maiores que a memória"):
+    colG, colH = st.columns(2)
+    with colG:
+        out_of_core = st.checkbox(
+            "Modo disco (out-of-core)", value=False,
+            help="As linhas vão para partes Parquet em disco; cancelamento e exportação rodam parte a parte."
+        )
+    with colH:
+        mem_budget_mb = st.number_input(
+            "Orçamento de memória (MB)", min_value=64, max_value=65536, value=1024, step=64,
+            disabled=not out_of_core,
+        )
+    limite_memoria_mb = st.number_input(
+        "Limite de memória do processo (MB, 0 = sem limite)", min_value=0, max_value=262144, value=0, step=256,
+        help="Perto do limite, paralelismo e read-ahead encolhem e os resultados passam para o modo disco "
+             "no meio da execução, em vez de o servidor ser encerrado por falta de memória."
+    )
 
-# ---------------------------
-# Helpers
-# ---------------------------
-NFE_NS = "http://www.portalfiscal.inf.br/nfe"
-CTE_NS = "http://www.portalfiscal.inf.br/cte"
-ABRASF_NS = "http://www.abrasf.org.br/ABRASF/arquivos/nfse.xsd"
-
-def cnpj_from_chave(chave_norm: Optional[str]) -> Optional[str]:
-    """Extrai o CNPJ do emitente da chave NF-e (44 dígitos)."""
-    if not chave_norm:
-        return None
-    s = normalize_key(chave_norm)
-    if s and len(s) == 44:
-        # cUF(2) + AAMM(4) = 6; próximos 14 dígitos = CNPJ emitente
-        return s[6:20]
-    return None
-
-
-def normalize_key(val) -> Optional[str]:
-    """Mantém apenas dígitos e retorna os últimos 44. Se não der, retorna None."""
-    if val is None or (isinstance(val, float) and pd.isna(val)):
-        return None
-    s = re.sub(r"\D", "", str(val))
-    if len(s) < 44:
-        return None
-    return s[-44:]
-
-def detect_parser(root: etree._Element):
-    for p in ALL_PARSERS:
-        try:
-            if p.matches(root):
-                return p
-        except Exception:
-            pass
-    return None
-
-def parse_with_selected_or_auto(root: etree._Element, nome_arquivo_hint: str, tipo_ui: str) -> Dict[str, Any]:
-    """
-    Tenta usar o parser selecionado. Se não casar, faz fallback para detecção automática.
-    Assim, mesmo que o usuário escolha 'NF-e' e o arquivo seja 'Evento', o arquivo é lido.
-    """
-    parser_local = None
-    if tipo_ui != "Auto (detectar)":
-        sel = get_parser_by_name(tipo_ui)
-        try:
-            if sel.matches(root):
-                parser_local = sel
-            else:
-                parser_local = detect_parser(root)
-        except Exception:
-            parser_local = detect_parser(root)
-    else:
-        parser_local = detect_parser(root)
-
-    if not parser_local:
-        raise ValueError("Nenhum parser reconheceu este XML.")
-
-    data = parser_local.parse_header(root)
-    data["_arquivo"] = nome_arquivo_hint
-    data["_parser"] = parser_local.name
-    return data
-
-def parse_path(p: Path, tipo_ui: str) -> Dict[str, Any]:
-    with open(p, "rb") as f:
-        tree = etree.parse(f)
-    root = tree.getroot()
-    return parse_with_selected_or_auto(root, str(p), tipo_ui)
-
-def parse_buffer_bytes(raw: bytes, name: str, tipo_ui: str) -> Dict[str, Any]:
-    tree = etree.parse(io.BytesIO(raw))
-    root = tree.getroot()
-    return parse_with_selected_or_auto(root, name, tipo_ui)
-
-def infer_movimento(row: Dict[str, Any]) -> str:
-    tp = row.get("tpNF")
-    if tp is None:
-        return "Desconhecido"
-    tp = str(tp).strip()
-    if tp == "1":
-        return "Saída"
-    if tp == "0":
-        return "Entrada"
-    return "Desconhecido"
-
-def to_number_maybe_br(x):
-    if pd.isna(x):
-        return pd.NA
-    s = str(x).strip()
-    if s == "":
-        return pd.NA
-    if "," in s and "." in s:
-        s = s.replace(".", "").replace(",", ".")
-    elif "," in s and "." not in s:
-        s = s.replace(",", ".")
-    return pd.to_numeric(s, errors="coerce")
-
-def to_percent_decimal(x):
-    v = to_number_maybe_br(x)
-    if pd.isna(v):
-        return pd.NA
-    try:
-        v = float(v)
-    except Exception:
-        return pd.NA
-    return v / 100.0 if v > 1.0 else v
-
-def to_datetime_col(x):
-    return pd.to_datetime(x, errors="coerce")
-
-def strip_tz_for_excel(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    tz_cols = out.select_dtypes(include=["datetimetz"]).columns
-    for c in tz_cols:
-        try:
-            out[c] = out[c].dt.tz_convert("America/Fortaleza").dt.tz_localize(None)
-        except Exception:
-            out[c] = out[c].dt.tz_localize(None)
-    return out
-
-def text_or_none(node: Optional[etree._Element], tag: str, ns: str) -> Optional[str]:
-    if node is None:
-        return None
-    el = node.find(f"{{{ns}}}{tag}")
-    if el is not None and el.text:
-        return el.text.strip()
-    return None
-
-def sniff_minimal_from_bytes(raw: bytes) -> Dict[str, Any]:
-    info: Dict[str, Any] = {}
-    try:
-        root = etree.fromstring(raw)
-    except Exception as e:
-        return {"_sniff_ok": False, "_sniff_erro": f"XML inválido: {e}"}
-
-    try:
-        nfe = root.find(f".//{{{NFE_NS}}}NFe")
-        if nfe is None:
-            nfe = root
-        infNFe = nfe.find(f".//{{{NFE_NS}}}infNFe")
-        if infNFe is not None:
-            ide = infNFe.find(f".//{{{NFE_NS}}}ide")
-            info["chave"] = (infNFe.get("Id") or "").replace("NFe", "") or None
-            info["modelo"] = text_or_none(ide, "mod", NFE_NS)
-            info["tpAmb"] = text_or_none(ide, "tpAmb", NFE_NS)
-            info["nNF"] = text_or_none(ide, "nNF", NFE_NS)
-            info["emissao"] = text_or_none(ide, "dhEmi", NFE_NS) or text_or_none(ide, "dEmi", NFE_NS)
-            info["_sniff_tipo"] = "NFe/NFCe"
-            info["_sniff_ok"] = True
-            return info
-    except Exception:
-        pass
-
-    try:
-        cte = root.find(f".//{{{CTE_NS}}}CTe")
-        if cte is None:
-            cte = root
-        infCte = cte.find(f".//{{{CTE_NS}}}infCte")
-        if infCte is not None:
-            ide = infCte.find(f".//{{{CTE_NS}}}ide")
-            info["chave"] = (infCte.get("Id") or "").replace("CTe", "") or None
-            info["modelo"] = text_or_none(ide, "mod", CTE_NS)
-            info["tpAmb"] = text_or_none(ide, "tpAmb", CTE_NS)
-            info["nCT"] = text_or_none(ide, "nCT", CTE_NS)
-            info["emissao"] = text_or_none(ide, "dhEmi", CTE_NS)
-            info["_sniff_tipo"] = "CTe"
-            info["_sniff_ok"] = True
-            return info
-    except Exception:
-        pass
-
-    try:
-        inf = root.find(f".//{{{ABRASF_NS}}}InfNfse")
-        if inf is not None:
-            info["numero"] = text_or_none(inf, "Numero", ABRASF_NS)
-            info["emissao"] = text_or_none(inf, "DataEmissao", ABRASF_NS)
-            info["competencia"] = text_or_none(inf, "Competencia", ABRASF_NS)
-            info["_sniff_tipo"] = "NFSe"
-            info["_sniff_ok"] = True
-            return info
-    except Exception:
-        pass
-
-    return {"_sniff_ok": False}
+with st.expander("Base local (SQLite)"):
+    salvar_db = st.checkbox(
+        "Gravar resultados na base local", value=False,
+        help="Notas, eventos e erros acumulam num arquivo SQLite (upsert por chave) e podem ser "
+             "consultados depois sem reprocessar os XMLs."
+    )
+    db_path = st.text_input("Arquivo da base", value=DB_PATH).strip() or DB_PATH
+
+run_id = st.text_input(
+    "ID da execução (opcional)",
+    help="Com um ID, o progresso é gravado em disco. Se a página recarregar ou o servidor cair, "
+         "rode de novo com o mesmo ID para continuar de onde parou."
+).strip()
+
+processar = st.button("Processar", disabled=bool(st.session_state.get("job_id")))
+st.markdown('</div>', unsafe_allow_html=True)
 
 # ---------------------------
 # Processamento (somente se clicou)
 # ---------------------------
 if processar:
     # Coletar arquivos
-    paths: List[Path] = []
+    paths: List[Tuple[Path, int]] = []
     if dir_path.strip():
         try:
             base = Path(dir_path.strip())
             if not base.exists():
                 st.error("O diretório informado não existe.")
                 st.stop()
-            paths = list(iter_xml_paths_from_dir(str(base)))
-            paths = list(dict.fromkeys([Path(p).resolve() for p in paths]))  # dedup
+            # (caminho, tamanho): o tamanho vem do scan e orienta o escalonamento
+            found = {}
+            for p, size in iter_xml_entries(str(base)):
+                found.setdefault(p.resolve(), size)  # dedup
+            paths = list(found.items())
         except Exception as e:
             st.error(f"Erro ao varrer o diretório: {e}")
             st.stop()
@@ -319,200 +238,150 @@ if processar:
         st.stop()
 
     st.info(f"Arquivos estimados: **{total_estimado}**")
-    progress = st.progress(0)
-    status_area = st.empty()
 
-    results: List[Dict[str, Any]] = []
-    erros: List[Dict[str, Any]] = []
-    processed = 0
-    future_ctx: Dict[Any, Dict[str, Any]] = {}
+    validator = None
+    if validar_xsd:
+        try:
+            validator = XsdValidator(xsd_dir or None)
+        except FileNotFoundError as e:
+            st.error(str(e))
+            st.stop()
 
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        for p in paths:
-            fut = ex.submit(parse_path, p, tipo)
-            future_ctx[fut] = {"src_type": "path", "name": str(p), "raw": None, "tipo_ui": tipo}
+    # Execução retomável: pula o que já consta no diário e grava blocos periodicamente
+    ckpt = None
+    pending_paths, pending_uploads = paths, mem_buffers
+    processed = 0
+    if run_id:
+        if not valid_run_id(run_id):
+            st.error("ID de execução inválido (use letras, números, '.', '_' ou '-').")
+            st.stop()
+        try:
+            ckpt = RunCheckpoint(run_id, params={"tipo": tipo, "dir": dir_path.strip()})
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
+        pending_paths = pending_inputs(paths, ckpt)
+        pending_uploads = [b for b in mem_buffers if getattr(b, "name", "uploaded.xml") not in ckpt.completed]
+        processed = total_estimado - len(pending_paths) - len(pending_uploads)
+        if processed:
+            st.info(f"Retomando execução **{run_id}**: {processed} arquivo(s) já processado(s).")
+
+    # tuplas por schema + strings internadas (ver utils/rows.py); no modo disco, partes Parquet
+    spill = SpillWriter(int(mem_budget_mb) * 1024 * 1024) if out_of_core else None
+    store = DocStore(db_path) if salvar_db else None
+    # índice de texto (nomes, discriminação) montado durante a ingestão; no modo disco não há
+    text_index = None if out_of_core else TextIndex()
+    # resumo por mês/CFOP/emitente/movimento, somado durante o parse (utils/aggregates.py)
+    aggregates = Aggregates()
+    events = EventIndex()  # todos os eventos por chave (CC-e, manifestação, EPEC, cancelamento)
+    # RSS por etapa e contrapressão perto do limite (utils/memory.py)
+    memory = MemoryGuard(int(limite_memoria_mb) * 1024 * 1024 or None)
+    sink = ResultSink(ckpt=ckpt, store=store, spill=spill, text_index=text_index,
+                      aggregates=aggregates, events=events, memory=memory)
+
+    # O job entra na fila compartilhada do servidor (utils/jobs.py):
+    # leitura com read-ahead limitado em bytes; parse no pool único, em rodízio entre sessões.
+    tuner = ConcurrencyTuner(max_workers=max_workers) if auto_workers else None
+    # XMLs originais em disco (utils/blobs.py): com ID, junto do diário; sem ID, pasta temporária da sessão
+    old_blobs = st.session_state.blobs
+    if old_blobs is not None:
+        old_blobs.close()
+        if old_blobs.dir.name.startswith("leitor_xml_"):
+            shutil.rmtree(old_blobs.dir, ignore_errors=True)
+    blobs = BlobStore(ckpt.dir / "xml" if ckpt else tempfile.mkdtemp(prefix="leitor_xml_"))
+    st.session_state.blobs = blobs
+    # uploads vão para o arquivo de blobs e o job lê fatias do mmap (a memória não cresce com o lote)
+    # chave única por upload: nomes repetidos (pastas ou zips diferentes) continuam sendo dois documentos
+    uploads = []
+    for b in pending_uploads:
+        name = getattr(b, "name", "uploaded.xml")
+        key = f"upload:{uuid.uuid4().hex}"
+        blobs.put(key, b.getvalue(), name=name)
+        uploads.append((name, key))
+    uploads = [(name, blobs.view(key)) for name, key in uploads]
+    job = get_manager().submit(
+        st.session_state.session_id, run_id or dir_path.strip() or "upload", tipo,
+        pending_paths, uploads=uploads, sink=sink, max_inflight=max_workers, tuner=tuner,
+        io_workers=io_workers, read_ahead_bytes=int(readahead_mb) * 1024 * 1024,
+        max_file_bytes=int(max_arquivo_mb) * 1024 * 1024 or None, timeout_s=timeout_arquivo or None,
+        blobs=blobs if guardar_xml else None, validator=validator, memory=memory,
+    )
+    del uploads
+    st.session_state.job_id = job.id
+    st.session_state.job_msg = None
+    st.session_state.job_meta = {
+        "paths": paths, "total": total_estimado, "antes": processed,
+        "io_threads": io_workers, "read_ahead_mb": int(readahead_mb),
+        "db": db_path if salvar_db else None, "text_index": text_index,
+        "aggregates": aggregates, "events": events, "sink": sink,
+    }
+
+
+def collect_job(job) -> None:
+    """Leva o resultado de um job terminado para o estado da sessão."""
+    meta = st.session_state.job_meta
+    if job.state == DONE:
+        df, erros, spill_result = job.result
+        run_stats = job.stats()
+        run_stats.update({"io_threads": meta["io_threads"], "read_ahead_mb": meta["read_ahead_mb"]})
+        if meta["db"]:
+            run_stats["db"] = meta["db"]
+        st.session_state.df = df
+        st.session_state.df_view = None  # será montado abaixo
+        st.session_state.erros = erros
+        st.session_state.paths = meta["paths"]
+        st.session_state.run_stats = run_stats
+        st.session_state.text_index = meta["sink"].text_index  # None se passou para o modo disco
+        st.session_state.aggregates = meta["aggregates"]
+        st.session_state.events = meta["events"]
+        st.session_state.cte_links = meta["sink"].links
+        old_spill = st.session_state.get("spill")
+        if old_spill is not None:
+            shutil.rmtree(old_spill.dir.parent, ignore_errors=True)
+        st.session_state.spill = spill_result
+        st.session_state.diff = None
+        st.session_state.conciliacao = None
+    elif job.state == CANCELED:
+        st.session_state.job_msg = ("warning", f"Processamento cancelado após {job.done} arquivo(s). "
+                                    "Com um ID de execução, rode de novo para continuar.")
+    else:
+        st.session_state.job_msg = ("error", f"Falha no processamento: {job.error}")
+    st.session_state.job_id = None
+    get_manager().forget(job.id)
+
+
+@st.fragment(run_every=1.0)
+def job_panel() -> None:
+    """Acompanha o job da sessão sem bloquear a página."""
+    job = get_manager().get(st.session_state.job_id or "")
+    if job is None:
+        st.session_state.job_id = None
+        return
+    if job.state in FINAL_STATES:
+        collect_job(job)
+        st.rerun()
+    meta = st.session_state.job_meta
+    feitos = meta["antes"] + job.done
+    pct = int(feitos / meta["total"] * 100) if meta["total"] else 100
+    st.progress(min(pct, 100))
+    ativos = get_manager().active()
+    if job.state == QUEUED:
+        st.info(f"Na fila • {ativos} execução(ões) ativa(s) no servidor")
+    else:
+        st.info(f"{job.state.capitalize()}: {feitos}/{meta['total']} ({pct}%) • "
+                f"{ativos} execução(ões) ativa(s) no servidor")
+    parcial = meta["aggregates"].totals()
+    st.caption(f"Parcial: {parcial['notas']} nota(s) • vNF R$ {parcial['vNF']:,.2f} • "
+               f"ICMS R$ {parcial['vICMS']:,.2f} • ICMS ST R$ {parcial['vICMS_ST']:,.2f}")
+    if st.button("Cancelar processamento", key="cancelar_job"):
+        get_manager().cancel(job.id)
 
-        for b in mem_buffers:
-            name = getattr(b, "name", "uploaded.xml")
-            raw = b.getvalue()
-            fut = ex.submit(parse_buffer_bytes, raw, name, tipo)
-            future_ctx[fut] = {"src_type": "upload", "name": name, "raw": raw, "tipo_ui": tipo}
 
-        for fut in as_completed(list(future_ctx.keys())):
-            meta = future_ctx[fut]
-            try:
-                row = fut.result()
-                results.append(row)
-            except Exception as e:
-                try:
-                    if meta["raw"] is not None:
-                        sniff = sniff_minimal_from_bytes(meta["raw"])
-                    else:
-                        raw_path = Path(meta["name"]).read_bytes()
-                        sniff = sniff_minimal_from_bytes(raw_path)
-                except Exception as e2:
-                    sniff = {"_sniff_ok": False, "_sniff_erro": f"Falha ao ler/inspecionar: {e2}"}
-
-                errrow = {"_arquivo": meta["name"], "_parser_ui": meta["tipo_ui"], "_erro": str(e)}
-                errrow.update(sniff)
-                erros.append(errrow)
-            finally:
-                processed += 1
-                pct = int(processed / total_estimado * 100)
-                progress.progress(pct)
-                status_area.info(f"Processados: {processed}/{total_estimado} ({pct}%)")
-
-    df = pd.DataFrame(results)
-
-    # --- Normalizações gerais / enriquecimento antes do cancelamento ---
-    if not df.empty:
-        # Moedas
-        if "vNF" in df.columns: df["vNF"] = df["vNF"].map(to_number_maybe_br)
-        if "valor_iss" in df.columns: df["valor_iss"] = df["valor_iss"].map(to_number_maybe_br)
-        for col in ["vTPrest", "vRec", "vCarga"]:
-            if col in df.columns: df[col] = df[col].map(to_number_maybe_br)
-
-        # Datas
-        for dcol in ["emissao", "competencia", "cancelado_em"]:
-            if dcol in df.columns: df[dcol] = df[dcol].map(to_datetime_col)
-
-        # Alíquota base 1
-        if "aliquota" in df.columns: df["aliquota"] = df["aliquota"].map(to_percent_decimal)
-
-        # Movimento (NF-e/NFC-e)
-        if "tpNF" in df.columns:
-            df["movimento"] = df.apply(lambda r: infer_movimento(r.to_dict()), axis=1)
-        else:
-            df["movimento"] = df.get("movimento", "Desconhecido")
-
-    # --- CANCELAMENTO 110111 ⇒ ENVIAR PARA "ERROS" e EXCLUIR DA TABELA PRINCIPAL ---
-    if len(df) > 0:
-        # 0) __key (chave normalizada) p/ todos
-        df["__key"] = None
-        if "chave" in df.columns:
-            df.loc[df["_parser"].isin(["NF-e", "NFC-e"]), "__key"] = df.loc[df["_parser"].isin(["NF-e", "NFC-e"]), "chave"].map(normalize_key)
-        if "chNFe" in df.columns:
-            mask_ev = df["_parser"].eq("Evento NF-e")
-            df.loc[mask_ev & df["__key"].isna(), "__key"] = df.loc[mask_ev, "chNFe"].map(normalize_key)
-
-        # 1) lookup do último evento de cancelamento por chave
-        ev = df[df["_parser"] == "Evento NF-e"].copy()
-        cancel_info = pd.DataFrame(columns=["__key", "cancelado_em", "cancel_nProt", "_arquivo_evento"])
-        if not ev.empty:
-            if "tpEvento" in ev.columns:
-                ev["tpEvento"] = ev["tpEvento"].astype(str).str.strip()
-            if "descEvento" in ev.columns:
-                ev["descEvento"] = ev["descEvento"].astype(str).str.strip().str.lower()
-            if "dhEvento" in ev.columns:
-                ev["dhEvento"] = pd.to_datetime(ev["dhEvento"], errors="coerce")
-
-
-            cancel_mask = pd.Series(False, index=ev.index)
-            if "tpEvento" in ev.columns:
-                cancel_mask |= ev["tpEvento"].eq("110111")
-            if "descEvento" in ev.columns:
-                cancel_mask |= ev["descEvento"].str.contains("cancel", na=False)
-            ev_cancel = ev[cancel_mask].copy()
-
-            if not ev_cancel.empty:
-                ev_cancel = ev_cancel.sort_values(["__key", "dhEvento"], ascending=[True, True])
-                last = ev_cancel.groupby("__key", as_index=False).tail(1)
-
-                # montar lookup com arquivo do evento também
-                keep_cols = ["__key", "_arquivo"]
-                if "dhEvento" in last.columns:
-                    keep_cols.append("dhEvento")
-                if "nProt_retEvento" in last.columns:
-                    keep_cols.append("nProt_retEvento")
-                if "emit_CNPJ" in last.columns:   # <--- NOVO
-                    keep_cols.append("emit_CNPJ")
-
-                cancel_info = last[keep_cols].rename(columns={
-                    "dhEvento": "cancelado_em",
-                    "nProt_retEvento": "cancel_nProt",
-                    "_arquivo": "_arquivo_evento"
-                })
-
-        # 2) Mover canceladas para "Erros"
-        if not cancel_info.empty:
-            # keys canceladas
-            keys_cancel = set(cancel_info["__key"].dropna().astype(str))
-
-            # a) NF reais canceladas (NF-e/NFC-e)
-            mask_nf = df["_parser"].isin(["NF-e", "NFC-e"])
-            nf_canceladas = df[mask_nf & df["__key"].isin(keys_cancel)].copy()
-
-            if not nf_canceladas.empty:
-                nf_canceladas = nf_canceladas.merge(cancel_info, on="__key", how="left")
-
-                # normaliza tipos (garante que vão “inteiros” para o Excel)
-                if "emissao" in nf_canceladas.columns:
-                    nf_canceladas["emissao"] = pd.to_datetime(nf_canceladas["emissao"], errors="coerce")
-                if "vNF" in nf_canceladas.columns:
-                    nf_canceladas["vNF"] = nf_canceladas["vNF"].map(to_number_maybe_br)
-
-                for _, r in nf_canceladas.iterrows():
-                    erros.append({
-                        "tipo": "NF cancelada",
-                        "chave": r.get("chave") or normalize_key(r.get("chave")),
-                        "nNF": r.get("nNF"),
-                        "serie": r.get("serie"),
-                        "emissao": r.get("emissao"),
-                        "vNF": r.get("vNF"),
-                        "emit_CNPJ": r.get("emit_CNPJ"),
-                        "emit_xNome": r.get("emit_xNome"),
-                        "dest_CNPJ": r.get("dest_CNPJ"),
-                        "dest_xNome": r.get("dest_xNome"),
-                        "cancelado_em": r.get("cancelado_em"),
-                        "cancel_nProt": r.get("cancel_nProt"),
-                        "_arquivo_nota": r.get("_arquivo"),
-                        "_arquivo_evento": r.get("_arquivo_evento"),
-                    })
-
-                # remove da tabela principal
-                df = df.drop(index=nf_canceladas.index, errors="ignore")
-          
-            # b) Cancelada SEM XML da NF (apenas evento)
-            keys_nf = set(df.loc[df["_parser"].isin(["NF-e", "NFC-e"]), "__key"].dropna().astype(str))
-            apenas_evento = sorted(keys_cancel - keys_nf)
-            if apenas_evento:
-                lk = cancel_info.set_index("__key")
-                for k in apenas_evento:
-                    emit_do_evento = lk.at[k, "emit_CNPJ"] if ("emit_CNPJ" in lk.columns and k in lk.index) else None
-                    emit_da_chave  = cnpj_from_chave(k)
-                    erros.append({
-                        "tipo": "NF cancelada (sem XML da nota)",
-                        "chave": k,
-                        "nNF": None,
-                        "serie": None,
-                        "emissao": None,
-                        "vNF": None,
-                        "emit_CNPJ": emit_do_evento or emit_da_chave,  # << NOVO
-                        "emit_xNome": None,  # evento não traz nome
-                        "dest_CNPJ": None,
-                        "dest_xNome": None,
-                        "cancelado_em": lk.at[k, "cancelado_em"] if ("cancelado_em" in lk.columns and k in lk.index) else None,
-                        "cancel_nProt": lk.at[k, "cancel_nProt"] if ("cancel_nProt" in lk.columns and k in lk.index) else None,
-                        "_arquivo_nota": None,
-                        "_arquivo_evento": lk.at[k, "_arquivo_evento"] if ("_arquivo_evento" in lk.columns and k in lk.index) else None,
-                    })
-
-
-            # c) opcional: remover eventos da tabela principal quando não quiser exibir
-            # Remover eventos da tabela principal sempre (independente do checkbox)
-            if df is not None and not df.empty and "_parser" in df.columns:
-                df = df[df["_parser"] != "Evento NF-e"]
-
-
-        # limpar coluna técnica
-        if "__key" in df.columns:
-            df.drop(columns=["__key"], inplace=True)
-
-    # Salva no estado
-    st.session_state.df = df
-    st.session_state.df_view = None  # será montado abaixo
-    st.session_state.erros = erros
-    st.session_state.paths = paths
+if st.session_state.get("job_id"):
+    job_panel()
+if st.session_state.get("job_msg"):
+    kind, msg = st.session_state.job_msg
+    getattr(st, kind)(msg)
 
 # ---------------------------
 # Renderização usando o estado (sem reprocessar)
@@ -520,6 +389,11 @@ if processar:
 df = st.session_state.df
 erros = st.session_state.erros
 paths = st.session_state.paths
+run_stats = st.session_state.get("run_stats")
+spill_result = st.session_state.get("spill")
+aggregates = st.session_state.get("aggregates")
+events = st.session_state.get("events")
+cte_links = st.session_state.get("cte_links")
 
 
 # Monta df_view (SEM canceladas e SEM eventos)
@@ -536,7 +410,7 @@ if df is not None and not df.empty:
         df_view = df_view[df_view["status_nota"].ne("Cancelada")]
 
     # 3) (Opcional) limitar aos tipos de documento principais
-    tipos_nota = {"NF-e","NFC-e","NFSe","NFSe RN (Prestado)","NFSe RN (Tomado)","CT-e","NF-e (sintético por evento)"}
+    tipos_nota = {"NF-e","NFC-e","NFSe","NFS-e (ABRASF)","NFSe RN (Prestado)","NFSe RN (Tomado)","CT-e","NF-e (sintético por evento)"}
     if "_parser" in df_view.columns:
         df_view = df_view[df_view["_parser"].isin(tipos_nota)]
 
@@ -555,33 +429,77 @@ if df is not None and not df.empty:
 st.session_state.df_view = df_view
 
 # Caso ainda não tenha rodado nada:
-if df is None and (uploaded_files or dir_path.strip()) and not processar:
+if df is None and st.session_state.get("job_id"):
+    pass  # acompanhamento no painel do job
+elif df is None and (uploaded_files or dir_path.strip()) and not processar:
     st.info("Clique em **Processar** para iniciar a leitura.")
 elif df is None:
     st.info("Envie arquivos ou informe o diretório e clique em **Processar**.")
 else:
     # Saída em abas
     st.markdown("### 📊 Resultados")
-    tabs = st.tabs(["Visualização", "Erros", "Exportar"])
+    tabs = st.tabs(["Visualização", "Erros", "Exportar", "XML original", "Resumo", "Eventos", "CT-e × NF-e", "Comparar", "Conciliação"])
 
     with tabs[0]:
         st.markdown(
             f"""
             <div class="az-card">
-              <div>Arquivos únicos: <b>{len(paths)}</b> • Linhas totais: <b>{len(df)}</b> • Exibidas: <b>{0 if df_view is None else len(df_view)}</b> • Erros: <b>{0 if not erros else len(erros)}</b></div>
+              <div>Arquivos únicos: <b>{len(paths)}</b> • Linhas totais: <b>{len(df) if spill_result is None else spill_result.total}</b> • Exibidas: <b>{0 if df_view is None else len(df_view)}</b> • Erros: <b>{0 if not erros else len(erros)}</b></div>
             </div>
             """,
             unsafe_allow_html=True
         )
-
-        if df_view is not None and not df_view.empty:
+        if run_stats:
+            if run_stats.get("modo") == "auto":
+                st.caption(
+                    f"Paralelismo automático: **{run_stats['threads']} threads** • "
+                    f"{run_stats['arquivos_s_media']} arquivos/s (pico {run_stats['arquivos_s_pico']}) • "
+                    f"I/O {run_stats['io_wait_pct']}% do tempo das tarefas"
+                )
+            else:
+                st.caption(f"Paralelismo manual: **{run_stats['threads']} threads**")
+            if "io_threads" in run_stats:
+                st.caption(
+                    f"Leitura: {run_stats['io_threads']} threads de I/O • read-ahead {run_stats['read_ahead_mb']} MB"
+                )
+            if "xsd_validados" in run_stats:
+                st.caption(
+                    f"Validação XSD: {run_stats['xsd_validados']} validados • {run_stats['xsd_invalidos']} inválidos • "
+                    f"{run_stats['xsd_sem_esquema']} sem esquema • {run_stats['xsd_s']}s "
+                    f"({run_stats['xsd_ms_doc']} ms/doc)"
+                )
+            if run_stats.get("memoria_pico_mb"):
+                st.caption(f"Memória (pico RSS por etapa): {format_peaks(run_stats)}")
+            if run_stats.get("db"):
+                st.caption(f"Gravado na base local: `{run_stats['db']}`")
+
+        df_show = df_view  # a busca filtra só a visualização (exportação segue completa)
+        text_index = st.session_state.get("text_index")
+        if text_index is not None and df_view is not None and not df_view.empty:
+            colS1, colS2 = st.columns([3, 1])
+            with colS1:
+                busca = st.text_input(
+                    "Buscar nos nomes e descrições", key="busca_texto",
+                    help='Sem acento e sem diferenciar maiúsculas; todos os termos precisam aparecer. '
+                         'O último termo vale como prefixo ("manut" acha "Manutenção").'
+                )
+            with colS2:
+                campo_busca = st.selectbox("Campo", ["Todos"] + list(text_index.fields), key="busca_campo")
+            if busca.strip():
+                termos = busca.split()
+                termos[-1] += "*"
+                ids = text_index.search(" ".join(termos), fields=None if campo_busca == "Todos" else [campo_busca])
+                df_show = df_view.loc[df_view.index.intersection(ids)]
+                st.caption(f"{len(df_show)} linha(s) com “{busca.strip()}”")
+
+        if df_show is not None and not df_show.empty:
             column_config = {}
-            if "vNF" in df_view.columns:
+            if "vNF" in df_show.columns:
                 column_config["vNF"] = st.column_config.NumberColumn("vNF", help="Valor total da NF", format="R$ %.2f")
-            if "emissao" in df_view.columns:
+            if "emissao" in df_show.columns:
                 column_config["emissao"] = st.column_config.DatetimeColumn("emissao", help="Data/hora de emissão", format="DD/MM/YYYY HH:mm:ss")
 
-            st.dataframe(df_view.head(50), use_container_width=True, column_config=column_config)
+            st.dataframe(df_show.head(50), use_container_width=True, column_config=column_config)
         else:
             st.info("Nenhum registro a exibir.")
 
@@ -613,6 +531,7 @@ else:
                 ws = writer.sheets["Erros"]
 
                 # Formatação BR nas colunas de data
+                from openpyxl.utils import get_column_letter  # só quem exporta Excel paga o import
                 for dcol in ["emissao", "cancelado_em", "dhEvento"]:
                     if dcol in df_err_xl.columns:
                         cidx = list(df_err_xl.columns).index(dcol) + 1
@@ -634,7 +553,22 @@ else:
 
         with tabs[2]:
             st.markdown('<div class="az-card">', unsafe_allow_html=True)
-            if df_view is None or df_view.empty:
+            if spill_result is not None:
+                # Modo disco: exporta lendo as partes em sequência (sem montar a tabela inteira)
+                st.caption(f"Modo disco: {spill_result.total} linhas em {len(spill_result.parts)} parte(s) em `{spill_result.dir}`.")
+                if st.button("Gerar CSV completo", key="gerar_csv_spill"):
+                    csv_path = str(spill_result.dir / "notas.csv")
+                    export_parts(spill_result, csv_path,
+                                 columns=[c for c in COLS_MIN if c in spill_result.columns])
+                    with open(csv_path, "rb") as fh:
+                        st.download_button(
+                            "⬇️ Baixar CSV",
+                            data=fh,
+                            file_name="notas.csv",
+                            mime="text/csv",
+                            key="download_notas_csv_spill",
+                        )
+            elif df_view is None or df_view.empty:
                 st.info("Nada para exportar.")
             else:
                 # ===== Exportação Excel (único botão) =====
@@ -646,24 +580,7 @@ else:
                     if "aliquota" in df_xl.columns:
                         df_xl["aliquota"] = pd.to_numeric(df_xl["aliquota"], errors="coerce")
 
-                    colunas_novas = {
-                        "vNF": "Valor",
-                        "emissao": "Data de Emissão",
-                        "emit_CNPJ": "CNPJ Emitente",
-                        "emit_xNome": "Nome Emitente",
-                        "dest_CNPJ": "CNPJ Destinatário",
-                        "dest_xNome": "Nome Destinatário",
-                        "nNF": "Número NF",
-                        "serie": "Série",
-                        "movimento": "Tipo (Entrada/Saída)",
-                        "CFOPs_itens": "CFOP(s) da Nota",
-                        "CFOP_predominante": "CFOP Predominante",
-                        "vBC_ICMS": "BC ICMS",
-                        "vICMS": "Valor ICMS",
-                        "vBC_ST": "BC ICMS ST",
-                        "vICMS_ST": "Valor ICMS ST",
-                    }
-                    df_xl = df_xl.rename(columns=colunas_novas)
+                    df_xl = df_xl.rename(columns=EXCEL_COLUMNS)
                     df_xl.to_excel(writer, index=False, sheet_name="Notas")
                     ws = writer.sheets["Notas"]
 
@@ -682,6 +599,9 @@ else:
                     fmt_col("BC ICMS ST", 'R$ #,##0.00')
                     fmt_col("Valor ICMS ST", 'R$ #,##0.00')
 
+                    if aggregates is not None and len(aggregates):
+                        aggregates.to_frame().to_excel(writer, index=False, sheet_name="Resumo")
+
                 st.download_button(
                     "⬇️ Baixar Excel",
                     data=out.getvalue(),
@@ -693,6 +613,193 @@ else:
 
         st.markdown('</div>', unsafe_allow_html=True)
 
+    with tabs[3]:
+        # Documento de uma linha: cópia guardada (mmap) ou o próprio arquivo em disco
+        nomes = []
+        if df is not None and "_arquivo" in df.columns:
+            nomes.extend(df["_arquivo"].dropna().astype(str).unique())
+        if erros:
+            nomes.extend(str(e["_arquivo"]) for e in erros if e.get("_arquivo"))
+        nomes = list(dict.fromkeys(nomes))
+        filtro = st.text_input("Filtrar por nome do arquivo", key="xml_filtro").strip().lower()
+        opcoes = [n for n in nomes if filtro in n.lower()][:500] if filtro else nomes[:500]
+        escolhido = st.selectbox("Arquivo (_arquivo)", opcoes, index=None, key="xml_escolhido")
+        if escolhido:
+            raw = read_original(escolhido, st.session_state.blobs)
+            if raw is None:
+                st.warning("XML não disponível: o arquivo saiu do lugar e não há cópia guardada.")
+            else:
+                st.download_button(
+                    "⬇️ Baixar XML", data=raw, file_name=Path(escolhido).name,
+                    mime="application/xml", key="download_xml_original",
+                )
+                st.code(raw.decode("utf-8", errors="replace")[:200_000], language="xml")
+
+    with tabs[4]:
+        # Somado durante o parse: não depende da tabela de detalhe (vale também no modo disco)
+        if aggregates is None or not len(aggregates):
+            st.info("Nenhum resumo disponível.")
+        else:
+            dims = st.multiselect("Agrupar por", GROUP_COLS, default=["mes", "movimento"], key="resumo_dims")
+            df_res = aggregates.to_frame(by=dims or None)
+            st.dataframe(
+                df_res, use_container_width=True,
+                column_config={c: st.column_config.NumberColumn(c, format="R$ %.2f") for c in VALUE_COLS},
+            )
+            colR1, colR2 = st.columns(2)
+            with colR1:
+                out_res = io.BytesIO()
+                with pd.ExcelWriter(out_res, engine="openpyxl") as writer:
+                    df_res.to_excel(writer, index=False, sheet_name="Resumo")
+                st.download_button(
+                    "⬇️ Baixar resumo (Excel)", data=out_res.getvalue(), file_name="resumo.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key="download_resumo_excel",
+                )
+            with colR2:
+                st.download_button(
+                    "⬇️ Baixar resumo (Parquet)", data=df_res.to_parquet(index=False), file_name="resumo.parquet",
+                    mime="application/octet-stream", key="download_resumo_parquet",
+                )
+
+    with tabs[5]:
+        if events is None or not len(events):
+            st.info("Nenhum evento de NF-e neste lote.")
+        else:
+            contagem = events.counts()
+            st.caption(" • ".join(f"{k}: **{v}**" for k, v in sorted(contagem.items())))
+            chave_q = st.text_input("Chave da NF-e (44 dígitos)", key="evento_chave").strip()
+            if chave_q:
+                situacao = events.status(chave_q)
+                if situacao is None:
+                    st.warning("Nenhum evento ou nota com essa chave no lote.")
+                else:
+                    st.markdown(
+                        f"**{situacao['situacao']}** • manifestação: {situacao['manifestacao'] or '—'} • "
+                        f"CC-e: {situacao['cartas_correcao']} • EPEC: {'sim' if situacao['epec'] else 'não'}"
+                    )
+                    st.dataframe(pd.DataFrame(events.timeline(chave_q)), use_container_width=True)
+            pendentes = events.pending_manifestacao()
+            st.markdown(f"**NF-e com manifestação pendente:** {len(pendentes)}")
+            if pendentes:
+                st.dataframe(events.status_frame(pendentes).head(500), use_container_width=True)
+            st.download_button(
+                "⬇️ Baixar eventos (CSV)",
+                data=events.events_frame().to_csv(index=False).encode("utf-8"),
+                file_name="eventos.csv", mime="text/csv", key="download_eventos_csv",
+            )
+
+    with tabs[6]:
+        if cte_links is None or cte_links.empty:
+            st.info("Nenhum CT-e com NF-e vinculada neste lote.")
+        else:
+            ausentes = cte_links[~cte_links["nota_no_lote"]]
+            st.caption(
+                f"CT-e: **{cte_links['cte_chave'].nunique()}** • vínculos: **{len(cte_links)}** • "
+                f"NF-e fora do lote: **{len(ausentes)}** • frete rateado: **{cte_links['frete_rateado'].sum():,.2f}**"
+            )
+            st.caption("Rateio: vTPrest × vNF / vCarga; sem vCarga ou sem a nota no lote, divisão igual entre as notas do CT-e.")
+            if not ausentes.empty:
+                st.markdown("**CT-e com NF-e que não veio no lote (ou foi cancelada):**")
+                st.dataframe(ausentes.head(500), use_container_width=True)
+            st.dataframe(cte_links.head(1000), use_container_width=True)
+            st.download_button(
+                "⬇️ Baixar vínculos CT-e × NF-e (CSV)",
+                data=cte_links.to_csv(index=False).encode("utf-8"),
+                file_name="cte_nfe.csv", mime="text/csv", key="download_cte_links_csv",
+            )
+
+    with tabs[7]:
+        st.caption("Compara este resultado com uma exportação anterior (planilha do app, CSV ou Parquet), "
+                   "casando as notas pela chave. Para grandes volumes, use `cli.py diff`.")
+        colD1, colD2 = st.columns(2)
+        with colD1:
+            anterior = st.file_uploader("Resultado anterior", type=["xlsx", "csv", "parquet"], key="diff_anterior")
+        with colD2:
+            erros_ant = st.file_uploader("Erros do resultado anterior (opcional, reconhece canceladas)",
+                                         type=["xlsx", "csv", "parquet"], key="diff_erros")
+        if spill_result is not None:
+            st.info("Modo disco: compare pela linha de comando (`cli.py diff`).")
+        elif anterior is not None and st.button("Comparar", key="diff_btn"):
+            old_erros = read_frame(erros_ant).to_dict("records") if erros_ant is not None else None
+            st.session_state.diff = diff_frames(read_frame(anterior), df, old_erros, erros)
+        changes = st.session_state.get("diff")
+        if changes is not None and spill_result is None:
+            st.dataframe(diff_summary(changes), use_container_width=True)
+            status_sel = st.multiselect("Status", ["incluída", "removida", "cancelada", "alterada"], key="diff_status")
+            show = changes[changes["status"].isin(status_sel)] if status_sel else changes
+            st.dataframe(show.head(1000), use_container_width=True)
+            st.download_button(
+                "⬇️ Baixar diferenças (CSV)",
+                data=changes.to_csv(index=False).encode("utf-8"),
+                file_name="diferencas.csv", mime="text/csv", key="download_diff_csv",
+            )
+
+    with tabs[8]:
+        st.caption("Confere o lote contra uma lista de chaves (SEFAZ, ERP): chaves sem XML, XMLs fora da lista "
+                   "e linhas com chave inválida (dígito verificador).")
+        lista_up = st.file_uploader("Lista de chaves", type=["txt", "csv", "xlsx"], key="lista_chaves")
+        if spill_result is not None:
+            st.info("Modo disco: concilie pela linha de comando (`cli.py conciliar`).")
+        elif lista_up is not None and st.button("Conciliar", key="conciliar_btn"):
+            try:
+                st.session_state.conciliacao = reconcile(read_key_list(lista_up), df, erros)
+            except ValueError as e:
+                st.error(str(e))
+        conc = st.session_state.get("conciliacao")
+        if conc is not None and spill_result is None:
+            c = conc.counts()
+            st.markdown(
+                f"Lista: **{c['lista']}** chaves ({c['repetidas']} repetidas) • lote: **{c['lote']}** • "
+                f"faltando: **{c['faltando']}** • fora da lista: **{c['extras']}** • inválidas: **{c['invalidas']}**"
+            )
+            for titulo, frame, nome in (("Na lista, sem XML", conc.faltando, "faltando"),
+                                        ("XML fora da lista", conc.extras, "extras"),
+                                        ("Chaves inválidas na lista", conc.invalidas, "invalidas")):
+                if frame.empty:
+                    continue
+                st.markdown(f"**{titulo}**")
+                st.dataframe(frame.head(500), use_container_width=True)
+                st.download_button(
+                    f"⬇️ Baixar {nome} (CSV)",
+                    data=frame.to_csv(index=False).encode("utf-8"),
+                    file_name=f"conciliacao_{nome}.csv", mime="text/csv", key=f"download_conc_{nome}",
+                )
+
     st.caption(
         "Entrada/Saída por tpNF; eventos de cancelamento (110111) são enviados para a aba **Erros** e removidos da tabela principal."
     )
+
+# ---------------------------
+# Consulta à base local (sem reprocessar)
+# ---------------------------
+with st.expander("🔎 Consultar base local"):
+    q_db = st.text_input("Arquivo da base", value=db_path, key="q_db").strip()
+    colQ1, colQ2, colQ3, colQ4 = st.columns(4)
+    with colQ1:
+        q_cnpj = st.text_input("CNPJ/CPF (emitente ou destinatário)", key="q_cnpj")
+    with colQ2:
+        q_periodo = st.date_input("Período de emissão", value=(), key="q_periodo")
+    with colQ3:
+        q_cfop = st.text_input("CFOP", key="q_cfop")
+    with colQ4:
+        q_canc = st.checkbox("Incluir canceladas", value=False, key="q_canc")
+    if st.button("Consultar", key="q_btn"):
+        if not Path(q_db).exists():
+            st.warning("Base não encontrada. Processe com **Gravar resultados na base local** primeiro.")
+        else:
+            inicio = q_periodo[0] if len(q_periodo) > 0 else None
+            fim = q_periodo[1] if len(q_periodo) > 1 else inicio
+            with DocStore(q_db) as store_q:
+                df_q = store_q.notas(cnpj=q_cnpj.strip() or None, inicio=inicio, fim=fim,
+                                     cfop=q_cfop.strip() or None, canceladas=q_canc)
+            df_q = df_q.drop(columns=["dados"])
+            st.caption(f"{len(df_q)} nota(s)")
+            st.dataframe(df_q.head(500), use_container_width=True)
+            st.download_button(
+                "⬇️ Baixar consulta (CSV)",
+                data=df_q.to_csv(index=False).encode("utf-8"),
+                file_name="consulta_notas.csv",
+                mime="text/csv",
+                key="download_consulta_csv",
+            )
@@ -0,0 +1,111 @@
+# bench/bench_schedule.py
+"""
+Makespan do lote: ordem do sistema de arquivos x LPT (maiores primeiro) + lotes de pequenos.
+
+Gera um corpus sintético de NF-e (muitas notas pequenas e poucas enormes, com as
+enormes por último na ordem dos nomes, como costuma sair de um export do ERP)
+e mede o tempo total de `iter_parse` nas duas ordens. Também imprime o makespan
+simulado (escalonamento guloso em P threads) a partir do custo medido de cada
+arquivo, que mostra o ganho sem o ruído do GIL.
+
+    python bench/bench_schedule.py
+    python bench/bench_schedule.py --pequenos 5000 --grandes 6 --itens 40000 --threads 8
+"""
+import argparse
+import heapq
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.io import iter_xml_entries  # noqa: E402
+from utils.pipeline import iter_parse, parse_path  # noqa: E402
+from utils.schedule import order_lpt  # noqa: E402
+
+TIPO = "Auto (detectar)"
+
+DET = ('<det nItem="{n}"><prod><CFOP>5102</CFOP><vProd>10.00</vProd></prod><imposto><ICMS><ICMS00>'
+       '<vBC>10.00</vBC><vICMS>1.80</vICMS></ICMS00></ICMS></imposto></det>')
+
+
+def nfe_xml(num: int, itens: int) -> str:
+    chave = f"2424031122233300014455001{num:09d}1123456784"
+    return (
+        '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe"><NFe>'
+        f'<infNFe Id="NFe{chave}"><ide><mod>55</mod><serie>1</serie><nNF>{num}</nNF>'
+        '<dhEmi>2024-03-02T10:00:00-03:00</dhEmi><tpNF>1</tpNF></ide>'
+        '<emit><CNPJ>11222333000144</CNPJ><xNome>ACME LTDA</xNome></emit>'
+        f'<dest><CNPJ>99888777000161</CNPJ><xNome>Cliente {num}</xNome></dest>'
+        + "".join(DET.format(n=i + 1) for i in range(itens))
+        + '<total><ICMSTot><vBC>10.00</vBC><vICMS>1.80</vICMS><vBCST>0</vBCST><vST>0</vST>'
+        '<vNF>10.00</vNF></ICMSTot></total></infNFe></NFe>'
+        f'<protNFe><infProt><chNFe>{chave}</chNFe><cStat>100</cStat></infProt></protNFe></nfeProc>'
+    )
+
+
+def make_corpus(base: Path, pequenos: int, grandes: int, itens: int) -> None:
+    for i in range(pequenos):
+        (base / f"a_{i:06d}.xml").write_text(nfe_xml(i + 1, 1 + i % 3), encoding="utf-8")
+    for j in range(grandes):
+        (base / f"z_{j:03d}.xml").write_text(nfe_xml(900000 + j, itens), encoding="utf-8")
+
+
+def greedy_makespan(costs, workers: int) -> float:
+    """List scheduling: cada tarefa vai para a thread que fica livre primeiro."""
+    free = [0.0] * workers
+    for c in costs:
+        heapq.heappush(free, heapq.heappop(free) + c)
+    return max(free)
+
+
+def run(paths, threads: int, **kw) -> float:
+    t0 = time.perf_counter()
+    n = 0
+    for _name, rows, _err in iter_parse(paths, TIPO, max_workers=threads, **kw):
+        n += 1
+    assert n == len(paths)
+    return time.perf_counter() - t0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--pequenos", type=int, default=3000)
+    ap.add_argument("--grandes", type=int, default=4)
+    ap.add_argument("--itens", type=int, default=30000, help="Itens (det) por nota grande.")
+    ap.add_argument("--threads", type=int, default=min(8, os.cpu_count() or 1))
+    ap.add_argument("--repeticoes", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_schedule_") as tmp:
+        base = Path(tmp)
+        make_corpus(base, args.pequenos, args.grandes, args.itens)
+        fs_order = sorted(iter_xml_entries(tmp))  # ordem dos nomes: grandes por último
+        total_mb = sum(s for _, s in fs_order) / (1024 * 1024)
+        print(f"{len(fs_order)} arquivos ({total_mb:.1f} MB), {args.threads} threads")
+
+        # custo de cada arquivo, medido em série
+        cost = {}
+        for p, _ in fs_order:
+            t0 = time.perf_counter()
+            parse_path(p, TIPO)
+            cost[str(p)] = time.perf_counter() - t0
+        serial = sum(cost.values())
+        fifo = greedy_makespan([cost[str(p)] for p, _ in fs_order], args.threads)
+        lpt = greedy_makespan([cost[p] for p, _ in order_lpt(fs_order)], args.threads)
+        print(f"simulado  série={serial:.2f}s  ordem-fs={fifo:.2f}s  LPT={lpt:.2f}s  "
+              f"(limite inferior {max(serial / args.threads, max(cost.values())):.2f}s)")
+
+        best = {"ordem-fs": float("inf"), "LPT+lotes": float("inf")}
+        for _ in range(args.repeticoes):
+            best["ordem-fs"] = min(best["ordem-fs"], run(fs_order, args.threads, lpt=False, batch_bytes=0))
+            best["LPT+lotes"] = min(best["LPT+lotes"], run(fs_order, args.threads))
+        print("medido    " + "  ".join(f"{k}={v:.2f}s" for k, v in best.items())
+              + f"  ganho={best['ordem-fs'] / best['LPT+lotes']:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
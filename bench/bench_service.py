@@ -0,0 +1,138 @@
+# bench/bench_service.py
+"""
+Carga no serviço HTTP de parse (cli.py servir): C clientes simultâneos enviam
+lotes multipart (ou um XML por requisição) e leem o NDJSON até o resumo.
+
+Sem --url, sobe o serviço neste processo numa porta livre. O relatório traz
+documentos/s, latência p50/p95 por requisição, tempo até a primeira linha e
+quantas respostas 503 (acima de --max-requisicoes) voltaram.
+
+    python bench/bench_service.py
+    python bench/bench_service.py --clientes 16 --requisicoes 400 --docs 1 --processos 4
+    python bench/bench_service.py --url http://127.0.0.1:8765 --clientes 8 --docs 50
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_schedule import nfe_xml  # noqa: E402
+
+
+def multipart(docs):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, raw in docs:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="xml"; filename="{name}"\r\n'
+                     f'Content-Type: application/xml\r\n\r\n'.encode("utf-8") + raw + b"\r\n")
+    return b"".join(parts) + f"--{boundary}--\r\n".encode("utf-8"), f"multipart/form-data; boundary={boundary}"
+
+
+def post(url: str, body: bytes, ctype: str):
+    """(status, segundos até a 1ª linha, segundos totais, resumo)."""
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": ctype}, method="POST")
+    t0 = time.perf_counter()
+    first = None
+    resumo = None
+    try:
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            for line in resp:
+                if first is None:
+                    first = time.perf_counter() - t0
+                if line.startswith(b'{"_resumo"'):
+                    resumo = json.loads(line)["_resumo"]
+            return resp.status, first, time.perf_counter() - t0, resumo
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, None, time.perf_counter() - t0, None
+    except (urllib.error.URLError, ConnectionError):
+        # recusa (503) fecha a conexão sem ler o corpo: o envio pode cair antes da resposta chegar
+        return 0, None, time.perf_counter() - t0, None
+
+
+def pct(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--url", help="Serviço já em execução (padrão: sobe um neste processo).")
+    ap.add_argument("--clientes", type=int, default=8)
+    ap.add_argument("--requisicoes", type=int, default=200, help="Total de requisições.")
+    ap.add_argument("--docs", type=int, default=20, help="XMLs por requisição (1 = corpo XML simples).")
+    ap.add_argument("--itens", type=int, default=3, help="Itens por nota.")
+    ap.add_argument("--processos", type=int, default=0, help="Processos do serviço local (0 = CPUs).")
+    ap.add_argument("--max-requisicoes", type=int, default=8, help="Limite de requisições do serviço local.")
+    args = ap.parse_args()
+
+    service = httpd = None
+    if args.url:
+        base = args.url.rstrip("/")
+    else:
+        from utils.service import ParseService, make_server
+        service = ParseService(processes=args.processos or None, max_requests=args.max_requisicoes)
+        service.warm()
+        httpd = make_server(service, "127.0.0.1", 0)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    docs = [(f"n{i:06d}.xml", nfe_xml(i + 1, args.itens).encode("utf-8")) for i in range(args.docs)]
+    if args.docs == 1:
+        body, ctype, url = docs[0][1], "application/xml", f"{base}/parse?nome={docs[0][0]}"
+    else:
+        (body, ctype), url = multipart(docs), f"{base}/parse"
+
+    lock = threading.Lock()
+    results = []
+    todo = iter(range(args.requisicoes))
+
+    def client():
+        while True:
+            with lock:
+                if next(todo, None) is None:
+                    return
+            r = post(url, body, ctype)
+            with lock:
+                results.append(r)
+            if r[0] in (0, 503):
+                time.sleep(0.05)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    ok = [r for r in results if r[0] == 200 and r[3]]
+    n_docs = sum(r[3]["documentos"] for r in ok)
+    print(f"{len(results)} requisições em {wall:.2f} s • {args.clientes} clientes • {args.docs} XMLs/requisição "
+          f"({len(body) // 1024} KB)")
+    busy = sum(r[0] == 503 for r in results)
+    reset = sum(r[0] == 0 for r in results)
+    print(f"ok {len(ok)} • 503 {busy} • conexão fechada no envio {reset} • "
+          f"outros {len(results) - len(ok) - busy - reset}")
+    if ok:
+        lat = [r[2] for r in ok]
+        first = [r[1] for r in ok if r[1] is not None]
+        print(f"{n_docs / wall:,.0f} documentos/s • latência p50 {statistics.median(lat) * 1000:.1f} ms, "
+              f"p95 {pct(lat, 0.95) * 1000:.1f} ms • 1ª linha p50 {statistics.median(first) * 1000:.1f} ms")
+    if service is not None:
+        httpd.shutdown()
+        httpd.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
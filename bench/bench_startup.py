@@ -0,0 +1,98 @@
+# bench/bench_startup.py
+"""
+Tempo de import (partida a frio) dos pontos de entrada: CLI, worker de parse,
+shard-run, ingestão do job e app.
+
+Cada ponto roda num interpretador novo, várias vezes (fica a mediana), e o
+relatório diz quais bibliotecas pesadas (pandas, numpy, openpyxl, pyarrow)
+entraram. Workers e CLI não devem carregar nenhuma: com --verificar, o script
+sai com código 1 se carregarem. O app importa o que app.py importa no topo
+(pacotes ausentes, como streamlit num servidor de lote, são pulados).
+
+    python bench/bench_startup.py
+    python bench/bench_startup.py --repeticoes 9 --verificar --saida bench/startup.jsonl
+"""
+import argparse
+import ast
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ("pandas", "numpy", "openpyxl", "pyarrow")
+
+# nome -> (código importado, deve ficar sem bibliotecas pesadas)
+ENTRY_POINTS = {
+    "python": ("pass", True),
+    "cli": ("import cli", True),
+    "worker": ("import utils.pipeline", True),
+    "shard-run": ("import utils.shards, utils.pipeline, utils.aggregates", True),
+    "ingestão": ("import utils.jobs, utils.rows, utils.events, utils.aggregates, utils.textindex", True),
+}
+
+PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+{code}
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({{"ms": ms, "pesados": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def app_imports() -> str:
+    """Imports de topo do app.py (pacotes não instalados ficam de fora)."""
+    tree = ast.parse((ROOT / "app.py").read_text(encoding="utf-8"))
+    lines = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            lines.append("try:\n    " + ast.unparse(node) + "\nexcept ImportError:\n    pass")
+    return "\n".join(lines)
+
+
+def measure(code: str, repeticoes: int):
+    src = PROBE.format(code=code, heavy=HEAVY)
+    runs = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", src], cwd=ROOT, capture_output=True, text=True, check=True)
+        wall = (time.perf_counter() - t0) * 1000
+        runs.append((json.loads(out.stdout.strip().splitlines()[-1]), wall))
+    return {
+        "import_ms": round(statistics.median(r["ms"] for r, _ in runs), 1),
+        "processo_ms": round(statistics.median(w for _, w in runs), 1),
+        "pesados": runs[-1][0]["pesados"],
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--verificar", action="store_true",
+                    help="Sai com código 1 se CLI/workers carregarem pandas, numpy, openpyxl ou pyarrow.")
+    ap.add_argument("--saida", help="Acrescenta o resultado (uma linha JSON) neste arquivo, para acompanhar.")
+    args = ap.parse_args()
+
+    points = dict(ENTRY_POINTS, app=(app_imports(), False))
+    result = {}
+    falhas = []
+    print(f"{'ponto':<10} {'import':>9} {'processo':>9}  pesados")
+    for name, (code, slim) in points.items():
+        r = result[name] = measure(code, args.repeticoes)
+        print(f"{name:<10} {r['import_ms']:>7.1f}ms {r['processo_ms']:>7.1f}ms  {', '.join(r['pesados']) or '-'}")
+        if slim and r["pesados"]:
+            falhas.append(name)
+    if args.saida:
+        with open(args.saida, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"quando": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                                "pontos": result}, ensure_ascii=False) + "\n")
+    if falhas:
+        print(f"Bibliotecas pesadas carregadas em: {', '.join(falhas)}", file=sys.stderr)
+        return 1 if args.verificar else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
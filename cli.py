@@ -0,0 +1,607 @@
+# cli.py
+"""
+Linha de comando (sem Streamlit) para lotes grandes.
+
+    python cli.py run /dados/notas -o notas.xlsx --erros erros.xlsx --run-id clienteA-2024-03
+    python cli.py shard-plan /dados/clienteA /dados/clienteB -n 16 -w /trabalho/ano2024
+    python cli.py shard-run -w /trabalho/ano2024 --shard 3
+    python cli.py shard-merge -w /trabalho/ano2024 -o notas.parquet --erros erros.csv
+    python cli.py watch /erp/saida --run-id erp-entrada -o notas.parquet --exportar-cada 60
+    python cli.py consulta --db notas.sqlite --cnpj 11222333000144 --de 2024-03-01 --ate 2024-03-31
+    python cli.py busca --indice notas.idx.gz --dados notas.parquet "manutenc* predial"
+    python cli.py eventos --indice eventos.json.gz --pendentes
+    python cli.py xml --guardados .xmls /dados/notas/nfe1.xml -o nfe1.xml
+    python cli.py servir --porta 8765 --processos 4
+"""
+import argparse
+import sys
+
+
+def _add_parse_args(sp: argparse.ArgumentParser) -> None:
+    sp.add_argument("--tipo", default="Auto (detectar)", help="Nome do parser (padrão: detecção automática).")
+    sp.add_argument("--threads", type=int, default=0,
+                    help="Threads de parse (0 = automático, até 64).")
+    sp.add_argument("--io-threads", type=int, default=8, help="Threads de leitura de disco.")
+    sp.add_argument("--read-ahead-mb", type=int, default=256, help="Read-ahead máximo em MB.")
+    sp.add_argument("--max-arquivo-mb", type=float, default=0,
+                    help="Arquivos maiores vão direto para a quarentena (0 = sem limite).")
+    sp.add_argument("--timeout-arquivo", type=float, default=0,
+                    help="Prazo por arquivo no lote principal em segundos; estourou, vai para a quarentena (0 = sem prazo).")
+    sp.add_argument("--xsd", nargs="?", const="", default=None, metavar="PASTA",
+                    help="Valida cada XML contra os XSD da SEFAZ (pasta com os pacotes; sem valor, "
+                         "LEITOR_XML_XSD ou schemas/). Inválidos vão para os erros.")
+    sp.add_argument("--metricas-porta", type=int, default=0,
+                    help="Expõe métricas OpenMetrics em http://127.0.0.1:PORTA/metrics (0 = desligado).")
+    sp.add_argument("--metricas-arquivo", help="Reescreve as métricas OpenMetrics neste arquivo periodicamente.")
+    sp.add_argument("--metricas-intervalo", type=float, default=10.0,
+                    help="Intervalo de gravação do --metricas-arquivo em segundos.")
+    sp.add_argument("--limite-memoria-mb", type=int, default=0,
+                    help="Limite de RSS do processo: perto dele, paralelismo, read-ahead e lotes encolhem "
+                         "e o run passa a despejar resultados em disco (0 = sem limite).")
+    sp.add_argument("--tracemalloc", action="store_true",
+                    help="Registra também o pico do tracemalloc por etapa (mais lento; diagnóstico).")
+
+
+def _parse_kwargs(args) -> dict:
+    from utils.autotune import ConcurrencyTuner
+    from utils.memory import MemoryGuard
+
+    tuner = ConcurrencyTuner(max_workers=64) if args.threads <= 0 else None
+    validator = None
+    if args.xsd is not None:
+        from utils.xsd import XsdValidator
+        try:
+            validator = XsdValidator(args.xsd or None)
+        except FileNotFoundError as e:
+            raise SystemExit(str(e))
+    metrics = None
+    if args.metricas_porta or args.metricas_arquivo:
+        from utils.metrics import Metrics, MetricsFile, MetricsServer
+        metrics = Metrics()
+        if args.metricas_porta:
+            try:
+                server = MetricsServer(metrics, args.metricas_porta)
+            except OSError as e:
+                raise SystemExit(f"Porta de métricas indisponível: {e}")
+            print(f"Métricas em {server.url}", file=sys.stderr)
+        if args.metricas_arquivo:
+            MetricsFile(metrics, args.metricas_arquivo, args.metricas_intervalo)  # grava também na saída
+    return {
+        "max_workers": args.threads if args.threads > 0 else 64,
+        "io_workers": args.io_threads,
+        "read_ahead_bytes": args.read_ahead_mb * 1024 * 1024,
+        "tuner": tuner,
+        "max_file_bytes": int(args.max_arquivo_mb * 1024 * 1024) or None,
+        "timeout_s": args.timeout_arquivo or None,
+        "validator": validator,
+        "metrics": metrics,
+        "memory": MemoryGuard(args.limite_memoria_mb * 1024 * 1024 or None, trace=args.tracemalloc),
+    }
+
+
+def collect_paths(pastas):
+    """(caminho, tamanho) dos XMLs das pastas (recursivo), sem duplicatas, como o app faz."""
+    from pathlib import Path
+    from utils.io import iter_xml_entries
+
+    paths = {}
+    for pasta in pastas:
+        if not Path(pasta).exists():
+            raise SystemExit(f"Pasta não encontrada: {pasta}")
+        for p, size in iter_xml_entries(pasta):
+            paths.setdefault(p.resolve(), size)
+    return list(paths.items())
+
+
+def cmd_run(args) -> int:
+    import pandas as pd
+    from utils.checkpoint import RunCheckpoint, pending_inputs
+    from utils.jobs import ResultSink
+    from utils.pipeline import iter_parse
+    from utils.postprocess import export_frame
+
+    paths = collect_paths(args.pastas)
+    spill = None
+    if args.memoria_mb:
+        from utils.spill import SpillWriter
+        spill = SpillWriter(args.memoria_mb * 1024 * 1024, spill_dir=args.spill_dir)
+    ckpt = None
+    pending = paths
+    if args.run_id:
+        try:
+            ckpt = RunCheckpoint(args.run_id, runs_dir=args.runs_dir,
+                                 params={"tipo": args.tipo, "pastas": [str(p) for p in args.pastas]})
+        except ValueError as e:
+            raise SystemExit(str(e))
+        pending = pending_inputs(paths, ckpt)
+        if len(pending) < len(paths):
+            print(f"Retomando {args.run_id}: {len(paths) - len(pending)} já processados.", file=sys.stderr)
+    store = None
+    if args.db:
+        from utils.store import DocStore
+        store = DocStore(args.db)
+    text_index = None
+    if args.indice:
+        if spill is not None:
+            raise SystemExit("--indice não funciona com --memoria-mb (modo disco).")
+        from utils.textindex import TextIndex
+        text_index = TextIndex()
+    aggregates = None
+    if args.resumo:
+        from utils.aggregates import Aggregates
+        aggregates = Aggregates()
+    events = None
+    if args.eventos:
+        from utils.events import EventIndex
+        events = EventIndex()
+    kw = _parse_kwargs(args)
+    memory = kw["memory"]
+    sink = ResultSink(ckpt=ckpt, store=store, spill=spill, text_index=text_index,
+                      aggregates=aggregates, events=events, memory=memory)
+    blobs = None
+    if args.guardar_xml:
+        from utils.blobs import BlobStore
+        blobs = BlobStore(args.guardar_xml)
+
+    total = len(paths)
+    done = total - len(pending)
+    try:
+        with memory.stage("parse"):
+            for name, rows, errrow in iter_parse(pending, args.tipo, blobs=blobs, **kw):
+                sink.record(name, rows, errrow)
+                done += 1
+                if done % 1000 == 0:
+                    print(f"{done}/{total}", file=sys.stderr)
+    finally:
+        if blobs is not None:
+            blobs.close()
+
+    with memory.stage("consolidação"):
+        df, erros, res = sink.finish()
+    if store is not None:
+        print(f"Base local atualizada: {args.db}", file=sys.stderr)
+    if res is not None and spill is None:
+        print("Memória perto do limite: resultados gravados por partes (modo disco).", file=sys.stderr)
+    with memory.stage("exportação"):
+        if res is not None:
+            from utils.spill import export_parts
+            export_parts(res, args.saida)
+            if not args.spill_dir:
+                sink.spill.cleanup()
+            n_linhas = res.total
+        else:
+            export_frame(df, args.saida)
+            n_linhas = len(df)
+            if text_index is not None:
+                # ids viram posições das linhas no arquivo exportado
+                text_index.remap(df.index).save(args.indice)
+                print(f"Índice de texto -> {args.indice}", file=sys.stderr)
+    print(f"{total} arquivos • {n_linhas} linhas -> {args.saida}")
+    if kw["validator"] is not None:
+        print(f"Validação XSD: {kw['validator'].summary()}", file=sys.stderr)
+    if res is not None and text_index is not None and spill is None:
+        print("--indice ignorado: a execução passou para o modo disco.", file=sys.stderr)
+    if aggregates is not None:
+        export_frame(aggregates.to_frame(), args.resumo, sheet_name="Resumo")
+        print(f"{len(aggregates)} grupos no resumo -> {args.resumo}")
+    if events is not None:
+        events.save(args.eventos)
+        print(f"{len(events)} chaves com eventos -> {args.eventos}")
+    if args.vinculos:
+        if sink.links is None:
+            print("--vinculos ignorado no modo disco (--memoria-mb).", file=sys.stderr)
+        else:
+            export_frame(sink.links, args.vinculos, sheet_name="CT-e x NF-e")
+            print(f"{len(sink.links)} vínculos CT-e × NF-e -> {args.vinculos}")
+    if args.erros:
+        export_frame(pd.DataFrame(erros), args.erros, sheet_name="Erros")
+        print(f"{len(erros)} erros -> {args.erros}")
+    from utils.memory import format_peaks
+    print(f"Memória (pico RSS por etapa): {format_peaks(memory.summary())}", file=sys.stderr)
+    memory.close()
+    return 0
+
+
+def cmd_shard_plan(args) -> int:
+    from utils.shards import plan_shards
+
+    m = plan_shards(args.pastas, args.n, args.work_dir)
+    print(f"{m['total']} arquivos em {m['n']} shards -> {args.work_dir}")
+    for s in m["shards"]:
+        print(f"  shard {s['id']:>4}: {s['arquivos']} arquivos")
+    return 0
+
+
+def cmd_shard_run(args) -> int:
+    from utils.shards import run_shard
+
+    kw = _parse_kwargs(args)
+    stats = run_shard(args.work_dir, args.shard, args.tipo, bases=args.base or None, **kw)
+    if kw["tuner"] is not None:
+        stats["paralelismo"] = kw["tuner"].summary()
+    if kw["validator"] is not None:
+        stats["validacao"] = kw["validator"].summary()
+    stats["memoria"] = kw["memory"].summary()
+    print(stats)
+    return 0
+
+
+def cmd_shard_merge(args) -> int:
+    import pandas as pd
+    from utils.postprocess import export_frame
+    from utils.shards import merge_aggregates, merge_shards
+
+    if not (args.saida or args.resumo):
+        raise SystemExit("Informe -o e/ou --resumo.")
+    if args.resumo:
+        resumo = merge_aggregates(args.work_dir, allow_partial=args.parcial)
+        export_frame(resumo.to_frame(), args.resumo, sheet_name="Resumo")
+        print(f"{len(resumo)} grupos no resumo -> {args.resumo}")
+    if not args.saida:
+        return 0
+    df, erros = merge_shards(args.work_dir, allow_partial=args.parcial)
+    export_frame(df, args.saida)
+    print(f"{len(df)} linhas -> {args.saida}")
+    if args.erros:
+        export_frame(pd.DataFrame(erros), args.erros, sheet_name="Erros")
+        print(f"{len(erros)} erros -> {args.erros}")
+    return 0
+
+
+def cmd_watch(args) -> int:
+    import time
+    import pandas as pd
+    from utils.postprocess import export_frame
+    from utils.watch import load_store, watch_folder
+
+    state = {"exportado": 0.0, "sujo": False}
+
+    def export(ckpt) -> None:
+        df, erros = load_store(ckpt)
+        export_frame(df, args.saida)
+        if args.erros:
+            export_frame(pd.DataFrame(erros), args.erros, sheet_name="Erros")
+        state["exportado"], state["sujo"] = time.monotonic(), False
+        print(f"{len(df)} linhas -> {args.saida}", file=sys.stderr)
+
+    def on_batch(ckpt, stats) -> None:
+        print(f"+{stats['arquivos']} arquivos ({stats['linhas']} linhas, {stats['erros']} erros) "
+              f"em {stats['segundos']}s • total {stats['total_arquivos']}", file=sys.stderr)
+        for chave in stats["canceladas"]:
+            print(f"  cancelada: {chave}", file=sys.stderr)
+        state["sujo"] = True
+        if args.saida and time.monotonic() - state["exportado"] >= args.exportar_cada:
+            export(ckpt)
+
+    print(f"Vigiando {args.pasta} (Ctrl+C para parar)", file=sys.stderr)
+    store = None
+    if args.db:
+        from utils.store import DocStore
+        store = DocStore(args.db)
+    try:
+        ckpt = watch_folder(args.pasta, args.run_id, args.tipo, runs_dir=args.runs_dir,
+                            poll_s=args.intervalo, settle_s=args.estabilizar, batch_max=args.lote,
+                            on_batch=on_batch, store=store, **_parse_kwargs(args))
+    except ValueError as e:
+        raise SystemExit(str(e))
+    finally:
+        if store is not None:
+            store.close()
+    if args.saida and state["sujo"]:
+        export(ckpt)
+    return 0
+
+
+def cmd_consulta(args) -> int:
+    import time
+    from utils.postprocess import export_frame
+    from utils.store import DocStore, expand_dados
+
+    with DocStore(args.db) as store:
+        t0 = time.perf_counter()
+        df = store.notas(cnpj=args.cnpj, inicio=args.de, fim=args.ate, cfop=args.cfop,
+                         tipo=args.tipo, canceladas=args.canceladas, limit=args.limite)
+        ms = (time.perf_counter() - t0) * 1000
+    print(f"{len(df)} notas em {ms:.1f} ms", file=sys.stderr)
+    if args.saida:
+        export_frame(expand_dados(df) if args.completo else df.drop(columns=["dados"]), args.saida)
+        print(f"-> {args.saida}", file=sys.stderr)
+    else:
+        cols = ["parser", "numero", "emissao", "emit_CNPJ", "dest_CNPJ", "vNF", "cancelada", "chave"]
+        print(df[cols].to_string(index=False, max_rows=50))
+    return 0
+
+
+def cmd_busca(args) -> int:
+    import time
+    from utils.postprocess import export_frame, read_frame
+    from utils.textindex import TextIndex
+
+    index = TextIndex.load(args.indice)
+    t0 = time.perf_counter()
+    ids = index.search(args.consulta, fields=args.campo, prefix=args.prefixo)
+    ms = (time.perf_counter() - t0) * 1000
+    print(f"{len(ids)} linhas em {ms:.1f} ms", file=sys.stderr)
+    if not args.dados:
+        print("\n".join(map(str, ids[:args.limite])))
+        return 0
+    df = read_frame(args.dados).iloc[ids[:args.limite]]
+    if args.saida:
+        export_frame(df, args.saida)
+        print(f"-> {args.saida}", file=sys.stderr)
+    else:
+        cols = [c for c in ("_parser", "numero", "nNF", "emissao", "emit_xNome", "dest_xNome", "discriminacao", "_arquivo")
+                if c in df.columns]
+        print(df[cols].to_string(index=False, max_rows=50, max_colwidth=60))
+    return 0
+
+
+def cmd_eventos(args) -> int:
+    import pandas as pd
+    from utils.events import EventIndex
+    from utils.postprocess import export_frame
+
+    index = EventIndex.load(args.indice)
+    if args.chave:
+        for chave in args.chave:
+            situacao = index.status(chave)
+            if situacao is None:
+                print(f"{chave}: sem eventos nem nota no índice")
+                continue
+            print(f"{situacao['chave']}: {situacao['situacao']} • manifestação: {situacao['manifestacao'] or '-'} • "
+                  f"CC-e: {situacao['cartas_correcao']} • EPEC: {'sim' if situacao['epec'] else 'não'}")
+            tl = pd.DataFrame(index.timeline(chave))
+            print(tl[["dhEvento", "tpEvento", "tipo", "nSeqEvento", "nProt", "arquivo"]].to_string(index=False))
+        return 0
+    df = index.status_frame(index.pending_manifestacao() if args.pendentes else None)
+    print(f"{len(df)} chaves", file=sys.stderr)
+    if args.saida:
+        export_frame(df, args.saida, sheet_name="Eventos")
+        print(f"-> {args.saida}", file=sys.stderr)
+    else:
+        print(df.to_string(index=False, max_rows=50))
+    return 0
+
+
+def cmd_diff(args) -> int:
+    import time
+    from utils.diff import diff_sources, diff_summary
+    from utils.postprocess import export_frame
+
+    t0 = time.perf_counter()
+    try:
+        changes = diff_sources(args.antigo, args.novo, old_erros=args.erros_antigo, new_erros=args.erros_novo,
+                               memoria_bytes=args.memoria_mb * 1024 * 1024, runs_dir=args.runs_dir,
+                               fields=args.campos.split(",") if args.campos else None)
+    except FileNotFoundError as e:
+        raise SystemExit(str(e))
+    print(f"{len(changes)} diferenças em {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    print(diff_summary(changes).to_string(index=False))
+    if args.saida:
+        export_frame(changes, args.saida, sheet_name="Diferenças")
+        print(f"-> {args.saida}", file=sys.stderr)
+    return 0
+
+
+def cmd_conciliar(args) -> int:
+    import time
+    from utils.postprocess import export_frame
+    from utils.reconcile import load_lote, read_key_list, reconcile
+
+    lista = read_key_list(args.lista, column=args.coluna)
+    try:
+        df, erros = load_lote(args.resultado, erros=args.erros, runs_dir=args.runs_dir)
+    except FileNotFoundError as e:
+        raise SystemExit(str(e))
+    t0 = time.perf_counter()
+    res = reconcile(lista, df, erros)
+    print(f"Conciliação em {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    c = res.counts()
+    print(f"Lista: {c['lista']} chaves ({c['repetidas']} repetidas, {c['invalidas']} inválidas) • "
+          f"lote: {c['lote']} • faltando: {c['faltando']} • fora da lista: {c['extras']}")
+    for frame, path, sheet in ((res.faltando, args.faltando, "Faltando"), (res.extras, args.extras, "Extras"),
+                               (res.invalidas, args.invalidas, "Inválidas")):
+        if path:
+            export_frame(frame, path, sheet_name=sheet)
+            print(f"{len(frame)} -> {path}", file=sys.stderr)
+    return 0
+
+
+def cmd_xml(args) -> int:
+    from utils.blobs import BlobStore, read_original
+
+    blobs = BlobStore(args.guardados) if args.guardados else None
+    try:
+        raw = read_original(args.arquivo, blobs)
+    finally:
+        if blobs is not None:
+            blobs.close()
+    if raw is None:
+        print(f"XML não encontrado: {args.arquivo}", file=sys.stderr)
+        return 1
+    if args.saida:
+        with open(args.saida, "wb") as f:
+            f.write(raw)
+    else:
+        sys.stdout.buffer.write(raw)
+    return 0
+
+
+def cmd_servir(args) -> int:
+    import time
+
+    from utils.service import ParseService, make_server
+
+    try:
+        service = ParseService(processes=args.processos or None, tipo_ui=args.tipo, window=args.janela or None,
+                               max_requests=args.max_requisicoes, batch_bytes=args.lote_kb * 1024,
+                               max_body_bytes=int(args.max_mb * 1024 * 1024),
+                               max_doc_bytes=int(args.max_arquivo_mb * 1024 * 1024) or None, xsd=args.xsd)
+    except FileNotFoundError as e:
+        raise SystemExit(str(e))
+    try:
+        httpd = make_server(service, args.host, args.porta)
+    except OSError as e:
+        service.close()
+        raise SystemExit(f"Não foi possível abrir {args.host}:{args.porta}: {e}")
+    t0 = time.perf_counter()
+    n = service.warm()
+    host, port = httpd.server_address[:2]
+    print(f"{n} processos prontos em {time.perf_counter() - t0:.1f} s • POST http://{host}:{port}/parse "
+          f"(até {service.max_requests} requisições, janela {service.window})", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="cli.py", description="Leitor XML de Notas (modo lote).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("run", help="Processa pastas de XMLs e grava notas/erros.")
+    sp.add_argument("pastas", nargs="+", help="Pastas com XMLs (varridas recursivamente).")
+    sp.add_argument("-o", "--saida", required=True, help="Arquivo de notas (.csv, .parquet ou .xlsx).")
+    sp.add_argument("--erros", help="Arquivo de erros/canceladas (.csv, .parquet ou .xlsx).")
+    sp.add_argument("--run-id", help="ID da execução: grava progresso e permite retomar com o mesmo ID.")
+    sp.add_argument("--runs-dir", help="Pasta dos diários de execução (padrão: .runs ou $LEITOR_XML_RUNS).")
+    sp.add_argument("--memoria-mb", type=int, default=0,
+                    help="Modo out-of-core: orçamento de memória em MB; resultados vão para disco em partes.")
+    sp.add_argument("--spill-dir", help="Pasta das partes em disco (padrão: temporária, apagada no final).")
+    sp.add_argument("--db", help="Base local SQLite: grava/atualiza as notas (upsert por chave).")
+    sp.add_argument("--guardar-xml", help="Pasta onde guardar uma cópia dos XMLs lidos (ver subcomando xml).")
+    sp.add_argument("--indice", help="Grava o índice de texto (nomes, discriminação) para o subcomando busca.")
+    sp.add_argument("--resumo", help="Resumo por mês, CFOP, emitente e movimento (.csv, .parquet ou .xlsx).")
+    sp.add_argument("--eventos", help="Grava o índice de eventos por chave para o subcomando eventos.")
+    sp.add_argument("--vinculos", help="Pares CT-e × NF-e com frete rateado (.csv, .parquet ou .xlsx).")
+    _add_parse_args(sp)
+    sp.set_defaults(func=cmd_run)
+
+    sp = sub.add_parser("shard-plan", help="Lista os XMLs e divide em N shards determinísticos.")
+    sp.add_argument("pastas", nargs="+", help="Pastas com XMLs (varridas recursivamente).")
+    sp.add_argument("-n", type=int, required=True, help="Número de shards.")
+    sp.add_argument("-w", "--work-dir", required=True, help="Diretório do manifesto e dos parciais.")
+    sp.set_defaults(func=cmd_shard_plan)
+
+    sp = sub.add_parser("shard-run", help="Processa um shard e grava os parciais.")
+    sp.add_argument("-w", "--work-dir", required=True)
+    sp.add_argument("--shard", type=int, required=True)
+    sp.add_argument("--base", action="append",
+                    help="Remapeia as pastas do manifesto neste host (repetir na mesma ordem).")
+    _add_parse_args(sp)
+    sp.set_defaults(func=cmd_shard_run)
+
+    sp = sub.add_parser("shard-merge", help="Junta os parciais e aplica o cancelamento global.")
+    sp.add_argument("-w", "--work-dir", required=True)
+    sp.add_argument("-o", "--saida", help="Arquivo de notas (.csv, .parquet ou .xlsx).")
+    sp.add_argument("--resumo", help="Resumo global a partir dos resumos parciais, sem ler as notas.")
+    sp.add_argument("--erros", help="Arquivo de erros/canceladas (.csv, .parquet ou .xlsx).")
+    sp.add_argument("--parcial", action="store_true", help="Permite merge com shards pendentes.")
+    sp.set_defaults(func=cmd_shard_merge)
+
+    sp = sub.add_parser("watch", help="Vigia uma pasta e processa os XMLs novos em micro-lotes.")
+    sp.add_argument("pasta", help="Pasta vigiada (recursiva).")
+    sp.add_argument("--run-id", required=True, help="ID do armazenamento: resultados acumulam no diário desse ID.")
+    sp.add_argument("--runs-dir", help="Pasta dos diários de execução (padrão: .runs ou $LEITOR_XML_RUNS).")
+    sp.add_argument("-o", "--saida", help="Exporta o consolidado (.csv, .parquet ou .xlsx) periodicamente.")
+    sp.add_argument("--erros", help="Arquivo de erros/canceladas exportado junto com --saida.")
+    sp.add_argument("--db", help="Base local SQLite atualizada a cada micro-lote.")
+    sp.add_argument("--exportar-cada", type=float, default=60.0, help="Intervalo mínimo entre exportações (s).")
+    sp.add_argument("--intervalo", type=float, default=1.0, help="Intervalo de varredura da pasta (s).")
+    sp.add_argument("--estabilizar", type=float, default=2.0,
+                    help="Segundos sem alteração para considerar um arquivo pronto.")
+    sp.add_argument("--lote", type=int, default=500, help="Máximo de arquivos por micro-lote.")
+    _add_parse_args(sp)
+    sp.set_defaults(func=cmd_watch)
+
+    sp = sub.add_parser("consulta", help="Consulta a base local SQLite (sem reprocessar XMLs).")
+    sp.add_argument("--db", required=True, help="Base local SQLite.")
+    sp.add_argument("--cnpj", help="CNPJ/CPF do emitente ou destinatário.")
+    sp.add_argument("--de", help="Emissão a partir de (AAAA-MM-DD).")
+    sp.add_argument("--ate", help="Emissão até (AAAA-MM-DD, inclusive).")
+    sp.add_argument("--cfop", help="CFOP presente nos itens.")
+    sp.add_argument("--tipo", help="Parser (ex.: NF-e, NFC-e, CT-e).")
+    sp.add_argument("--canceladas", action="store_true", help="Inclui notas canceladas.")
+    sp.add_argument("--limite", type=int, help="Máximo de linhas.")
+    sp.add_argument("-o", "--saida", help="Grava o resultado (.csv, .parquet ou .xlsx) em vez de imprimir.")
+    sp.add_argument("--completo", action="store_true", help="Inclui todas as colunas originais do parser.")
+    sp.set_defaults(func=cmd_consulta)
+
+    sp = sub.add_parser("busca", help="Busca por termos (sem acento) nos nomes e descrições de um resultado.")
+    sp.add_argument("consulta", help='Termos (todos precisam aparecer); "termo*" busca por prefixo.')
+    sp.add_argument("--indice", required=True, help="Índice gravado por run --indice.")
+    sp.add_argument("--dados", help="Arquivo de notas exportado junto com o índice; sem ele, imprime os ids.")
+    sp.add_argument("--campo", action="append", help="Restringe a um campo (ex.: discriminacao); pode repetir.")
+    sp.add_argument("--prefixo", action="store_true", help="Trata todos os termos como prefixo.")
+    sp.add_argument("--limite", type=int, default=1000, help="Máximo de linhas.")
+    sp.add_argument("-o", "--saida", help="Grava as linhas encontradas (.csv, .parquet ou .xlsx).")
+    sp.set_defaults(func=cmd_busca)
+
+    sp = sub.add_parser("eventos", help="Situação e linha do tempo de eventos por chave de NF-e.")
+    sp.add_argument("--indice", required=True, help="Índice gravado por run --eventos.")
+    sp.add_argument("--chave", action="append", help="Mostra a linha do tempo desta chave (pode repetir).")
+    sp.add_argument("--pendentes", action="store_true", help="Só NF-e sem manifestação conclusiva.")
+    sp.add_argument("-o", "--saida", help="Grava a situação das chaves (.csv, .parquet ou .xlsx).")
+    sp.set_defaults(func=cmd_eventos)
+
+    sp = sub.add_parser("diff", help="Compara duas execuções: notas incluídas, removidas, canceladas e alteradas.")
+    sp.add_argument("antigo", help="Resultado anterior: .csv/.parquet/.xlsx, base .sqlite ou run:<ID>.")
+    sp.add_argument("novo", help="Resultado novo (mesmos formatos).")
+    sp.add_argument("--erros-antigo", help="Arquivo de erros do resultado anterior (reconhece as canceladas).")
+    sp.add_argument("--erros-novo", help="Arquivo de erros do resultado novo.")
+    sp.add_argument("--campos", help="Só estes campos, separados por vírgula (padrão: todos em comum).")
+    sp.add_argument("--memoria-mb", type=int, default=0,
+                    help="Orçamento de memória: acima disso, ordena em disco e compara em fluxo.")
+    sp.add_argument("--runs-dir", help="Pasta dos diários, para lados run:<ID>.")
+    sp.add_argument("-o", "--saida", help="Grava as diferenças (.csv, .parquet ou .xlsx).")
+    sp.set_defaults(func=cmd_diff)
+
+    sp = sub.add_parser("conciliar", help="Confere o lote contra uma lista de chaves (SEFAZ/ERP).")
+    sp.add_argument("lista", help="Lista de chaves: .txt (uma por linha), .csv ou .xlsx.")
+    sp.add_argument("resultado", help="Resultado do lote: .csv/.parquet/.xlsx, base .sqlite ou run:<ID>.")
+    sp.add_argument("--coluna", help="Coluna das chaves na lista (padrão: detecta).")
+    sp.add_argument("--erros", help="Arquivo de erros do resultado (canceladas contam como lidas).")
+    sp.add_argument("--runs-dir", help="Pasta dos diários, para run:<ID>.")
+    sp.add_argument("--faltando", help="Grava as chaves da lista sem XML no lote.")
+    sp.add_argument("--extras", help="Grava as notas do lote que não estão na lista.")
+    sp.add_argument("--invalidas", help="Grava as linhas da lista com chave inválida.")
+    sp.set_defaults(func=cmd_conciliar)
+
+    sp = sub.add_parser("xml", help="Mostra o XML original de uma linha (pelo _arquivo).")
+    sp.add_argument("arquivo", help="Valor da coluna _arquivo.")
+    sp.add_argument("--guardados", help="Pasta dos XMLs guardados (--guardar-xml); sem ela, lê do disco.")
+    sp.add_argument("-o", "--saida", help="Grava o XML neste arquivo em vez de imprimir.")
+    sp.set_defaults(func=cmd_xml)
+
+    sp = sub.add_parser("servir", help="Serviço HTTP local: recebe XMLs e devolve as linhas em NDJSON.")
+    sp.add_argument("--host", default="127.0.0.1", help="Endereço de escuta (padrão: só localhost).")
+    sp.add_argument("--porta", type=int, default=8765)
+    sp.add_argument("--processos", type=int, default=0, help="Processos de parse (0 = número de CPUs).")
+    sp.add_argument("--max-requisicoes", type=int, default=8,
+                    help="Requisições atendidas ao mesmo tempo; acima disso, 503 com Retry-After.")
+    sp.add_argument("--janela", type=int, default=0,
+                    help="Tarefas no pool por requisição (0 = 2 x processos).")
+    sp.add_argument("--lote-kb", type=int, default=1024,
+                    help="XMLs pequenos de uma requisição vão juntos até este tamanho por tarefa (0 = um por tarefa).")
+    sp.add_argument("--max-mb", type=float, default=256, help="Tamanho máximo do corpo da requisição.")
+    sp.add_argument("--max-arquivo-mb", type=float, default=0,
+                    help="Documentos maiores voltam como erro sem ir ao pool (0 = sem limite).")
+    sp.add_argument("--tipo", default="Auto (detectar)", help="Parser padrão (a requisição pode mudar com ?tipo=).")
+    sp.add_argument("--xsd", nargs="?", const="", default=None, metavar="PASTA",
+                    help="Valida cada XML contra os XSD nos processos do pool (ver run --xsd).")
+    sp.set_defaults(func=cmd_servir)
+
+    return ap
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
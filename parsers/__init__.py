@@ -6,14 +6,15 @@ from .nfse_rn_prestado import NFSERNPrestadoParser
 from .nfse_rn_tomado import NFSERNTomadoParser
 from .cte import CTeParser
 
+# Ordem = ordem de detecção: parsers específicos (RN) antes do ABRASF genérico
 ALL_PARSERS = [
     NFeParser(),
     NFCeParser(),
-    NFSeABRASFParser(),
     NFeEventParser(),
     NFSERNPrestadoParser(),  # novo
     NFSERNTomadoParser(), 
-    CTeParser()   # novo
+    CTeParser(),  # novo
+    NFSeABRASFParser(),
 ]
 
 def get_parser_by_name(name: str):
@@ -21,3 +22,10 @@ def get_parser_by_name(name: str):
         if p.name == name:
             return p
     raise ValueError(f"Tipo de nota não suportado: {name}")
+
+def parse_all(parser, root):
+    """Linhas do arquivo; parsers sem `parse_all` (NF-e, NFC-e, Evento) geram uma só."""
+    fn = getattr(parser, "parse_all", None)
+    if fn is not None:
+        return fn(root)
+    return [parser.parse_header(root)]
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, List
 from lxml import etree
 
 class XMLParser(ABC):
@@ -14,3 +14,7 @@ class XMLParser(ABC):
     def parse_header(self, root: etree._Element) -> Dict[str, Any]:
         """Extrai os campos principais da nota."""
         raise NotImplementedError
+
+    def parse_all(self, root: etree._Element) -> List[Dict[str, Any]]:
+        """Uma linha por nota do arquivo (padrão: arquivo com nota única)."""
+        return [self.parse_header(root)]
@@ -43,6 +43,10 @@ class CTeParser(XMLParser):
 
         chave = (inf.get("Id") or "").replace("CTe", "") if inf is not None else None
 
+        # NF-e transportadas (infCTeNorm/infDoc/infNFe/chave); a junção com as notas fica em utils/linkage.py
+        chaves_nfe = [_t(el) for el in inf.iterfind(f".//{{{NS}}}infNFe/{{{NS}}}chave")] if inf is not None else []
+        chaves_nfe = [c for c in chaves_nfe if c]
+
         return {
             "tipo": "CT-e",
             "chave": chave,
@@ -63,4 +67,5 @@ class CTeParser(XMLParser):
             "vCarga": _g(infCarga, "vCarga"),
             "status": _g(infProt, "cStat"),
             "autorizacao": _g(infProt, "xMotivo"),
+            "chaves_NFe": "; ".join(dict.fromkeys(chaves_nfe)) or None,
         }
@@ -35,7 +35,7 @@ class NFeEventParser:
     def parse_header(self, root: etree._Element) -> dict:
         """
         Extrai campos padronizados usados pelo app:
-          - chNFe, tpEvento, descEvento, dhEvento, nProt_retEvento, emit_CNPJ
+          - chNFe, tpEvento, descEvento, dhEvento, nProt_retEvento, emit_CNPJ, nSeqEvento
         Aceita tanto <procEventoNFe> (com <retEvento>) quanto <evento> “cru”.
         """
         # tenta encontrar o nó <evento>
@@ -75,4 +75,5 @@ class NFeEventParser:
             "dhEvento": dhEv,
             "nProt_retEvento": nProt,
             "emit_CNPJ": autor,   # ajuda a enriquecer linha sintética no app
+            "nSeqEvento": _txt(inf, "nSeqEvento"),  # ordem dos eventos do mesmo tipo (ex.: CC-e)
         }
\ No newline at end of file
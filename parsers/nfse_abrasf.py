@@ -1,10 +1,63 @@
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional
 from lxml import etree
 from .base import XMLParser
 
 def _t(el: Optional[etree._Element]) -> Optional[str]:
     return el.text.strip() if el is not None and el.text else None
 
+@lru_cache(maxsize=256)
+def _qpath(ns: Optional[str], path: str) -> str:
+    """'A/B' -> '{ns}A/{ns}B' (compilado uma vez por namespace)."""
+    if not ns:
+        return path
+    return "/".join(f"{{{ns}}}{tag}" for tag in path.split("/"))
+
+def _find(node: Optional[etree._Element], ns: Optional[str], *paths: str) -> Optional[etree._Element]:
+    """Primeiro caminho (só filhos diretos) que existir."""
+    if node is None:
+        return None
+    for path in paths:
+        el = node.find(_qpath(ns, path))
+        if el is not None:
+            return el
+    return None
+
+def _g(node: Optional[etree._Element], ns: Optional[str], *paths: str) -> Optional[str]:
+    if node is None:
+        return None
+    for path in paths:
+        v = _t(node.find(_qpath(ns, path)))
+        if v:
+            return v
+    return None
+
+def _first(*els: Optional[etree._Element]) -> Optional[etree._Element]:
+    # não usar `or`: elemento sem filhos é "falso" no lxml
+    return next((el for el in els if el is not None), None)
+
+def detect_namespace(root: etree._Element) -> Optional[str]:
+    """
+    Descobre o namespace real do <InfNfse> uma vez por documento.
+    Tenta o namespace da raiz; se não houver InfNfse nele, faz UMA varredura
+    até o primeiro elemento cujo nome local seja InfNfse.
+    Retorna None se o documento não tiver InfNfse.
+    """
+    ns = etree.QName(root).namespace
+    tag = f"{{{ns}}}InfNfse" if ns else "InfNfse"
+    if root.tag == tag or next(root.iter(tag), None) is not None:
+        return ns or ""
+    for el in root.iter():
+        t = el.tag
+        if isinstance(t, str) and (t == "InfNfse" or t.endswith("}InfNfse")):
+            return etree.QName(el).namespace or ""
+    return None
+
+def iter_inf_nfse(root: etree._Element, ns: Optional[str]) -> Iterator[etree._Element]:
+    """Todos os <InfNfse> do arquivo (um por CompNfse em ListaNfse), em uma passada."""
+    tag = f"{{{ns}}}InfNfse" if ns else "InfNfse"
+    return root.iter(tag)
+
 class NFSeABRASFParser(XMLParser):
     name = "NFS-e (ABRASF)"
 
@@ -13,35 +66,49 @@ class NFSeABRASFParser(XMLParser):
         lname = etree.QName(root).localname
         if lname in {"CompNfse", "Nfse"}:
             return True
-        return root.find(".//*[local-name()='InfNfse']") is not None
+        return detect_namespace(root) is not None
 
     def parse_header(self, root: etree._Element) -> Dict[str, Any]:
-        # Tenta localizar InfNfse independentemente de namespace
-        inf = root.find(".//*[local-name()='InfNfse']")
-        ide = root.find(".//*[local-name()='IdentificacaoRps']") or root
-        emit = root.find(".//*[local-name()='PrestadorServico']") or root
-        dest = root.find(".//*[local-name()='TomadorServico']") or root
-        valores = root.find(".//*[local-name()='Valores']")
-
-        def find_text(xpath: str) -> Optional[str]:
-            el = inf.find(xpath)
-            return _t(el) if el is not None else None
-
-        def any_text(node, tag) -> Optional[str]:
-            if node is None:
-                return None
-            el = node.find(f".//*[local-name()='{tag}']")
-            return _t(el)
+        rows = self.parse_all(root)
+        if not rows:
+            raise ValueError("InfNfse não encontrado.")
+        return rows[0]
+
+    def parse_all(self, root: etree._Element) -> List[Dict[str, Any]]:
+        """Uma linha por <CompNfse>/<InfNfse> (ListaNfse com várias notas)."""
+        ns = detect_namespace(root)
+        if ns is None:
+            return []
+        return [self._parse_inf(inf, ns) for inf in iter_inf_nfse(root, ns)]
+
+    def _parse_inf(self, inf: etree._Element, ns: str) -> Dict[str, Any]:
+        # v1.0: dados do RPS direto em InfNfse; v2.x: dentro de DeclaracaoPrestacaoServico
+        decl = _find(inf, ns, "DeclaracaoPrestacaoServico/InfDeclaracaoPrestacaoServico")
+        ide = _first(_find(inf, ns, "IdentificacaoRps"), _find(decl, ns, "Rps/IdentificacaoRps"))
+        servico = _first(_find(inf, ns, "Servico"), _find(decl, ns, "Servico"))
+        valores = _find(servico, ns, "Valores")
+        emit = _find(inf, ns, "PrestadorServico")
+        emit_decl = _find(decl, ns, "Prestador")
+        dest = _first(_find(inf, ns, "TomadorServico"), _find(decl, ns, "Tomador", "TomadorServico"))
+        org = _find(inf, ns, "OrgaoGerador")
+
+        emit_doc = (
+            _g(emit, ns, "IdentificacaoPrestador/Cnpj", "IdentificacaoPrestador/CpfCnpj/Cnpj",
+               "IdentificacaoPrestador/CpfCnpj/Cpf")
+            or _g(emit_decl, ns, "CpfCnpj/Cnpj", "CpfCnpj/Cpf", "Cnpj")
+        )
+        dest_doc = _g(dest, ns, "IdentificacaoTomador/CpfCnpj/Cnpj", "IdentificacaoTomador/CpfCnpj/Cpf",
+                      "IdentificacaoTomador/Cnpj", "IdentificacaoTomador/Cpf")
 
         return {
             "tipo": "NFSe",
-            "numero": any_text(ide, "Numero"),
-            "serie": any_text(ide, "Serie"),
-            "emissao": any_text(inf, "DataEmissao"),
-            "emit_CNPJ": any_text(emit, "Cnpj") or any_text(emit, "Cpf"),
-            "emit_xNome": any_text(emit, "RazaoSocial"),
-            "dest_CNPJ": any_text(dest, "Cnpj") or any_text(dest, "Cpf"),
-            "dest_xNome": any_text(dest, "RazaoSocial") or any_text(dest, "Nome"),
-            "vNF": any_text(valores, "ValorServicos") or any_text(inf, "OutrasInformacoes"),
-            "municipio": any_text(inf, "CodigoMunicipio"),
+            "numero": _g(inf, ns, "Numero") or _g(ide, ns, "Numero"),
+            "serie": _g(ide, ns, "Serie"),
+            "emissao": _g(inf, ns, "DataEmissao"),
+            "emit_CNPJ": emit_doc,
+            "emit_xNome": _g(emit, ns, "RazaoSocial") or _g(emit_decl, ns, "RazaoSocial"),
+            "dest_CNPJ": dest_doc,
+            "dest_xNome": _g(dest, ns, "RazaoSocial", "Nome"),
+            "vNF": _g(valores, ns, "ValorServicos") or _g(inf, ns, "OutrasInformacoes"),
+            "municipio": _g(servico, ns, "CodigoMunicipio") or _g(org, ns, "CodigoMunicipio"),
         }
@@ -0,0 +1,17 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+DATA = Path(__file__).resolve().parent / "data"
+sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture
+def data_dir() -> Path:
+    """XMLs de exemplo: NF-e (nfe1..3, nfe6), cancelamento de nfe3 (ev0), cancelamento sem
+    XML da nota (ev1), CT-e citando nfe1, nfe2 e uma nota fora do lote (cte1), lista ABRASF
+    com duas CompNfse (lista) e um XML quebrado."""
+    return DATA
@@ -0,0 +1,81 @@
+import csv
+
+import pandas as pd
+
+import cli
+from utils.aggregates import Aggregates
+from utils.pipeline import parse_path
+from utils.postprocess import apply_cancellations, normalize_frame
+
+AUTO = "Auto (detectar)"
+NFE3 = "24240311222333000144550010000000031123456789"  # cancelada por ev0
+NFE7 = "24240311222333000144550010000000071123456788"  # só o cancelamento (ev1), sem XML da nota
+
+
+def _rows(data_dir, names):
+    return [r for n in names for r in parse_path(data_dir / n, AUTO)]
+
+
+def test_apply_cancellations_move_canceladas_para_erros(data_dir):
+    df = pd.DataFrame(_rows(data_dir, ["nfe1.xml", "nfe3.xml", "ev0.xml", "ev1.xml", "cte1.xml"]))
+    normalize_frame(df)
+    erros = []
+    out = apply_cancellations(df, erros)
+
+    assert NFE3 not in set(out["chave"])
+    assert "Evento NF-e" not in set(out["_parser"])
+    assert len(out) == 2  # nfe1 + cte1
+    tipos = {e["chave"]: e["tipo"] for e in erros}
+    assert tipos == {NFE3: "NF cancelada", NFE7: "NF cancelada (sem XML da nota)"}
+
+
+def _totals(rows):
+    agg = Aggregates()
+    agg.add(rows)
+    return agg.totals()
+
+
+def test_resumo_cancelamento_antes_ou_depois_da_nota(data_dir):
+    notas = _rows(data_dir, ["nfe1.xml", "nfe3.xml", "nfe6.xml"])
+    evento = _rows(data_dir, ["ev0.xml"])
+    sem_nfe3 = _totals([r for r in notas if r["chave"] != NFE3])
+
+    assert _totals(notas + evento) == sem_nfe3
+    assert _totals(evento + notas) == sem_nfe3
+    assert _totals(notas)["notas"] == sem_nfe3["notas"] + 1
+
+
+def test_resumo_merge_com_cancelamento_no_outro_shard(data_dir):
+    notas = _rows(data_dir, ["nfe1.xml", "nfe3.xml"])
+    evento = _rows(data_dir, ["ev0.xml"])
+    for a_rows, b_rows in ((notas, evento), (evento, notas)):
+        a, b = Aggregates(), Aggregates()
+        a.add(a_rows)
+        b.add(b_rows)
+        assert a.merge(b).totals() == _totals(notas + evento)
+    # estado salvo e recarregado (parciais de shard) mantém a nota para o cancelamento
+    a, b = Aggregates(), Aggregates()
+    a.add(notas)
+    b.add(evento)
+    assert Aggregates.from_state(a.to_state()).merge(b).totals()["notas"] == 1
+
+
+def _read(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return sorted(tuple(sorted(r.items())) for r in csv.DictReader(f))
+
+
+def test_shards_e_merge_igual_ao_run(data_dir, tmp_path):
+    cli.main(["run", str(data_dir), "-o", str(tmp_path / "run.csv"), "--erros", str(tmp_path / "run_erros.csv"),
+              "--threads", "2"])
+    work = str(tmp_path / "shards")
+    cli.main(["shard-plan", str(data_dir), "-n", "3", "-w", work])
+    for i in range(3):
+        cli.main(["shard-run", "-w", work, "--shard", str(i), "--threads", "2"])
+    cli.main(["shard-merge", "-w", work, "-o", str(tmp_path / "merge.csv"),
+              "--erros", str(tmp_path / "merge_erros.csv")])
+
+    merged = _read(tmp_path / "merge.csv")
+    assert merged and merged == _read(tmp_path / "run.csv")
+    canceladas = [dict(r) for r in _read(tmp_path / "merge_erros.csv") if dict(r).get("tipo", "").startswith("NF cancelada")]
+    assert {r["chave"] for r in canceladas} == {NFE3, NFE7}
@@ -0,0 +1,18 @@
+import pytest
+
+from utils.checkpoint import RunCheckpoint
+
+
+def test_retomada_com_outros_parametros_falha(tmp_path):
+    ckpt = RunCheckpoint("r1", runs_dir=str(tmp_path), params={"tipo": "NF-e", "pastas": ["a"]})
+    ckpt.record("a/1.xml", [{"chave": "1"}], None)
+    ckpt.flush()
+
+    again = RunCheckpoint("r1", runs_dir=str(tmp_path), params={"tipo": "NF-e", "pastas": ["a"]})
+    assert again.completed == {"a/1.xml"}
+    with pytest.raises(ValueError, match="pastas"):
+        RunCheckpoint("r1", runs_dir=str(tmp_path), params={"tipo": "NF-e", "pastas": ["b"]})
+    with pytest.raises(ValueError, match="tipo"):
+        RunCheckpoint("r1", runs_dir=str(tmp_path), params={"tipo": "CT-e", "pastas": ["a"]})
+    # o bloco já gravado continua válido depois da recusa
+    assert RunCheckpoint("r1", runs_dir=str(tmp_path), read_only=True).completed == {"a/1.xml"}
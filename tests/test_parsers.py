@@ -0,0 +1,53 @@
+import pytest
+from lxml import etree
+
+from utils.pipeline import parse_buffer_bytes, parse_path
+
+AUTO = "Auto (detectar)"
+NFE1 = "24240311222333000144550010000000011123456784"
+NFE3 = "24240311222333000144550010000000031123456789"
+
+
+def test_nfse_abrasf_uma_linha_por_compnfse(data_dir):
+    rows = parse_path(data_dir / "lista.xml", AUTO)
+    assert [r["_parser"] for r in rows] == ["NFS-e (ABRASF)"] * 2
+    assert [r["numero"] for r in rows] == ["10", "11"]
+    first, second = rows
+    assert (first["emit_CNPJ"], first["dest_CNPJ"], first["vNF"], first["municipio"]) == \
+        ("11222333000144", "99888777000166", "100.50", "2408102")
+    # CompNfse sem prestador/tomador: campos ausentes não herdam os da nota anterior
+    assert second["vNF"] == "7"
+    assert not second.get("emit_CNPJ") and not second.get("dest_CNPJ")
+
+
+def test_nfe(data_dir):
+    (row,) = parse_path(data_dir / "nfe1.xml", AUTO)
+    assert row["_parser"] == "NF-e"
+    assert row["chave"] == NFE1
+    assert (row["nNF"], row["serie"], row["tpNF"], row["emit_CNPJ"]) == ("1", "1", "1", "11222333000144")
+    assert (row["vNF"], row["vICMS"], row["CFOP_predominante"]) == (10.0, 1.8, "5102")
+
+
+def test_cte_lista_as_nfe_transportadas(data_dir):
+    (row,) = parse_path(data_dir / "cte1.xml", AUTO)
+    assert row["_parser"] == "CT-e"
+    assert row["vTPrest"] == "300.00"
+    assert row["chaves_NFe"].split("; ")[:2] == [NFE1, "24240311222333000144550010000000021123456781"]
+
+
+def test_evento_de_cancelamento(data_dir):
+    (row,) = parse_path(data_dir / "ev0.xml", AUTO)
+    assert row["_parser"] == "Evento NF-e"
+    assert (row["chNFe"], row["tpEvento"]) == (NFE3, "110111")
+
+
+def test_bytes_e_caminho_dao_o_mesmo_resultado(data_dir):
+    for name in ("lista.xml", "nfe1.xml", "cte1.xml", "ev0.xml"):
+        path = data_dir / name
+        rows = parse_buffer_bytes(path.read_bytes(), str(path), AUTO)
+        assert rows == parse_path(path, AUTO)
+
+
+def test_xml_quebrado(data_dir):
+    with pytest.raises(etree.XMLSyntaxError):
+        parse_path(data_dir / "broken.xml", AUTO)
@@ -0,0 +1,53 @@
+# tests/test_reconcile.py
+import pandas as pd
+
+import cli
+from utils.reconcile import load_lote, read_key_list, reconcile
+
+NFE1 = "24240311222333000144550010000000011123456784"
+NFE3 = "24240311222333000144550010000000031123456789"   # cancelada (ev0)
+NFE7 = "24240311222333000144550010000000071123456788"   # só o cancelamento (ev1), sem XML da nota
+NFE2 = "24240311222333000144550010000000021123456781"
+
+
+def _run(data_dir, tmp_path):
+    out, err = tmp_path / "notas.csv", tmp_path / "erros.csv"
+    assert cli.main(["run", str(data_dir), "-o", str(out), "--erros", str(err), "--threads", "2"]) == 0
+    return out, err
+
+
+def test_conciliar_com_erros_lidos_do_disco(data_dir, tmp_path):
+    out, err = _run(data_dir, tmp_path)
+    lista = tmp_path / "lista.txt"
+    lista.write_text(f"{NFE1}\n{NFE3}\n{NFE7}\n", encoding="utf-8")
+
+    df, erros = load_lote(str(out), erros=str(err))
+    assert "_arquivo" in pd.DataFrame(erros).columns  # o caso que quebrava: _arquivo e _arquivo_nota juntos
+    res = reconcile(read_key_list(str(lista)), df, erros)
+
+    c = res.counts()
+    assert list(res.faltando["chave"]) == [NFE7]
+    assert c["lista"] == 3 and c["invalidas"] == 0
+    # lote = achadas + extras: cancelada lida conta, cancelamento sem XML não
+    assert c["lote"] == (c["lista"] - c["faltando"]) + c["extras"]
+    assert NFE2 in set(res.extras["chave"])
+    assert NFE3 not in set(res.extras["chave"])
+
+
+def test_cancelada_fora_da_lista_vai_para_extras(data_dir, tmp_path):
+    out, err = _run(data_dir, tmp_path)
+    df, erros = load_lote(str(out), erros=str(err))
+    res = reconcile(pd.Series([NFE1], index=[1], dtype="string"), df, erros)
+    extras = res.extras.set_index("chave")
+    assert extras.loc[NFE3, "_parser"] == "NF cancelada"
+    assert extras.loc[NFE3, "_arquivo"].endswith("nfe3.xml")
+    assert NFE7 not in extras.index
+    assert res.counts()["lote"] == 1 + len(res.extras)
+
+
+def test_cli_conciliar(data_dir, tmp_path, capsys):
+    out, err = _run(data_dir, tmp_path)
+    lista = tmp_path / "lista.txt"
+    lista.write_text(f"{NFE1}\n{NFE7}\n123\n", encoding="utf-8")
+    assert cli.main(["conciliar", str(lista), str(out), "--erros", str(err)]) == 0
+    assert "faltando: 1" in capsys.readouterr().out
@@ -0,0 +1,56 @@
+import cli
+from utils.pipeline import parse_path
+from utils.store import DocStore
+
+AUTO = "Auto (detectar)"
+NFE1 = "24240311222333000144550010000000011123456784"
+NFE3 = "24240311222333000144550010000000031123456789"
+
+
+def _ingest(store, data_dir, names):
+    for name in names:
+        path = data_dir / name
+        store.record(str(path), parse_path(path, AUTO), None)
+    store.flush()
+
+
+def test_upsert_por_chave_e_cancelamento(data_dir, tmp_path):
+    names = ["nfe1.xml", "nfe3.xml", "nfe6.xml", "cte1.xml", "lista.xml"]
+    with DocStore(str(tmp_path / "notas.sqlite")) as store:
+        _ingest(store, data_dir, names)
+        first = store.counts()
+        # reprocessar a pasta não duplica nada; o evento chega depois e marca a nota
+        _ingest(store, data_dir, names + ["ev0.xml"])
+        counts = store.counts()
+        assert counts["notas"] == first["notas"] == 6  # 3 NF-e + CT-e + 2 NFS-e
+        assert counts["itens"] == first["itens"]
+        assert counts["canceladas"] == 1
+        assert NFE3 not in set(store.notas()["chave"])
+        assert NFE3 in set(store.notas(canceladas=True)["chave"])
+
+
+def test_consulta_por_cnpj_periodo_e_cfop(data_dir, tmp_path):
+    with DocStore(str(tmp_path / "notas.sqlite")) as store:
+        _ingest(store, data_dir, ["nfe1.xml", "nfe6.xml", "cte1.xml"])
+        df = store.notas(cnpj="11.222.333/0001-44", inicio="2024-03-01", fim="2024-03-02", cfop="5102")
+        assert list(df["chave"]) == [NFE1]
+        assert store.notas(cnpj="99888777000160", fim="2024-03-06").empty
+
+
+def test_erro_some_quando_o_arquivo_passa(data_dir, tmp_path):
+    with DocStore(str(tmp_path / "notas.sqlite")) as store:
+        store.record("a.xml", None, {"_arquivo": "a.xml", "_erro": "XML inválido"})
+        store.flush()
+        assert list(store.erros()["arquivo"]) == ["a.xml"]
+        store.record("a.xml", parse_path(data_dir / "nfe1.xml", AUTO), None)
+        store.flush()
+        assert store.erros().empty
+
+
+def test_cli_run_db(data_dir, tmp_path):
+    db = str(tmp_path / "notas.sqlite")
+    for _ in range(2):
+        cli.main(["run", str(data_dir), "-o", str(tmp_path / "notas.csv"), "--db", db, "--threads", "2"])
+    with DocStore(db) as store:
+        counts = store.counts()
+    assert (counts["notas"], counts["canceladas"]) == (7, 1)  # nfe1..3, nfe6, CT-e, 2 NFS-e; nfe3 cancelada
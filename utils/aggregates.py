@@ -0,0 +1,204 @@
+# utils/aggregates.py
+"""
+Resumo por mês, CFOP, emitente e movimento, mantido linha a linha durante o parse.
+
+Cada grupo guarda contagem e somas de vNF, vICMS e vICMS_ST em centavos
+(inteiros), então parciais de threads, processos ou shards se juntam com
+`merge` sem erro de arredondamento e sem montar a tabela de detalhe.
+
+Cancelamento (110111), com a mesma regra do app: a nota NF-e/NFC-e cancelada
+sai do resumo, chegue o evento antes ou depois dela. Para isso cada nota
+guarda só a sua contribuição (grupo + valores) por chave.
+
+Memória: esse mapa por chave cresce com o lote, cerca de 260 bytes por nota
+NF-e/NFC-e (grupos internados), ou ~250 MB por milhão de notas; CT-e, NFS-e e
+eventos não entram nele. Depois de `merge`, o parcial final tem o mapa de todos
+os shards.
+"""
+import gzip
+import json
+import re
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.values import (
+    EVENT_PARSER, NF_PARSERS, infer_movimento, is_cancel_event, is_missing, normalize_key, number_br,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+GROUP_COLS = ["tipo", "mes", "CFOP", "emit_CNPJ", "movimento"]
+VALUE_COLS = ["vNF", "vICMS", "vICMS_ST"]
+
+_ISO_MONTH = re.compile(r"(\d{4})-(\d{2})")
+_BR_MONTH = re.compile(r"\d{2}/(\d{2})/(\d{4})")
+
+Group = Tuple[str, str, str, str, str]
+
+
+def _cents(v) -> int:
+    if v is None or is_missing(v):
+        return 0
+    if not isinstance(v, (int, float)):
+        v = number_br(v)
+        if v is None:
+            return 0
+    return int(round(float(v) * 100))
+
+
+def _month(v) -> str:
+    if v is None or is_missing(v):
+        return ""
+    if hasattr(v, "strftime"):
+        return v.strftime("%Y-%m")
+    s = str(v)
+    m = _ISO_MONTH.match(s)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}"
+    m = _BR_MONTH.match(s)
+    return f"{m.group(2)}-{m.group(1)}" if m else ""
+
+
+def group_of(row: Dict[str, Any]) -> Group:
+    cfop = row.get("CFOP_predominante") or row.get("CFOP") or ""
+    return (
+        str(row.get("_parser") or ""),
+        _month(row.get("emissao") or row.get("competencia")),
+        str(cfop),
+        str(row.get("emit_CNPJ") or ""),
+        infer_movimento(row),
+    )
+
+
+class Aggregates:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups: Dict[Group, List[int]] = {}          # grupo -> [notas, vNF, vICMS, vICMS_ST]
+        self._interned: Dict[Group, Group] = {}
+        self._notes: Dict[str, List[tuple]] = {}          # chave -> [(grupo, vNF, vICMS, vICMS_ST), ...]
+        self._canceled: set = set()
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def _bump(self, g: Group, n: int, vnf: int, vicms: int, vst: int) -> None:
+        acc = self._groups.get(g)
+        if acc is None:
+            acc = self._groups[g] = [0, 0, 0, 0]
+        acc[0] += n
+        acc[1] += vnf
+        acc[2] += vicms
+        acc[3] += vst
+        if not any(acc):
+            del self._groups[g]
+
+    def _drop(self, g: Group, vnf: int, vicms: int, vst: int) -> None:
+        """Retira a contribuição de uma nota cancelada."""
+        self._bump(g, -1, -vnf, -vicms, -vst)
+
+    def _add_note(self, key: Optional[str], contrib: tuple) -> None:
+        if key is not None:
+            self._notes.setdefault(key, []).append(contrib)
+            if key in self._canceled:
+                return
+        self._bump(contrib[0], 1, *contrib[1:])
+
+    def _cancel(self, key: str) -> None:
+        if key in self._canceled:
+            return
+        self._canceled.add(key)
+        for g, *vals in self._notes.get(key, ()):
+            self._drop(g, *vals)
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Soma as linhas de um arquivo (eventos só contam para o cancelamento)."""
+        with self._lock:
+            for row in rows:
+                parser = row.get("_parser")
+                if parser == EVENT_PARSER:
+                    if is_cancel_event(row):
+                        key = normalize_key(row.get("chNFe"))
+                        if key:
+                            self._cancel(key)
+                    continue
+                g = group_of(row)
+                g = self._interned.setdefault(g, g)
+                contrib = (g, _cents(row.get("vNF")), _cents(row.get("vICMS")), _cents(row.get("vICMS_ST")))
+                key = normalize_key(row.get("chave")) if parser in NF_PARSERS else None
+                self._add_note(key, contrib)
+
+    def merge(self, other: "Aggregates") -> "Aggregates":
+        """Junta outro parcial (ex.: de outro shard) neste; cancelamentos valem entre os dois."""
+        with self._lock:
+            for g, acc in other._groups.items():
+                self._bump(self._interned.setdefault(g, g), *acc)
+            # nota de um lado, cancelamento só do outro: sai das somas de quem tem a nota
+            for key in other._canceled - self._canceled:
+                for g, *vals in self._notes.get(key, ()):
+                    self._drop(g, *vals)
+            for key, contribs in other._notes.items():
+                mine = self._notes.setdefault(key, [])
+                for g, *vals in contribs:
+                    g = self._interned.setdefault(g, g)
+                    if key in self._canceled and key not in other._canceled:
+                        self._drop(g, *vals)
+                    mine.append((g, *vals))
+            self._canceled |= other._canceled
+        return self
+
+    # ---------------------------
+    # saída
+    # ---------------------------
+    def to_frame(self, by: Optional[List[str]] = None) -> "pd.DataFrame":
+        """Resumo em reais; `by` agrupa por um subconjunto de GROUP_COLS."""
+        import pandas as pd
+
+        with self._lock:
+            items = [(g, list(acc)) for g, acc in self._groups.items()]
+        df = pd.DataFrame(
+            [(*g, acc[0], *(c / 100 for c in acc[1:])) for g, acc in items],
+            columns=GROUP_COLS + ["notas"] + VALUE_COLS,
+        )
+        if by:
+            df = df.groupby(by, as_index=False, sort=True)[["notas"] + VALUE_COLS].sum()
+        else:
+            df = df.sort_values(GROUP_COLS, ignore_index=True)
+        for c in VALUE_COLS:
+            df[c] = df[c].round(2)
+        return df
+
+    def totals(self) -> Dict[str, Any]:
+        with self._lock:
+            accs = [list(a) for a in self._groups.values()]
+        return {"notas": sum(a[0] for a in accs),
+                **{c: round(sum(a[i + 1] for a in accs) / 100, 2) for i, c in enumerate(VALUE_COLS)}}
+
+    def to_state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "grupos": [[*g, *acc] for g, acc in self._groups.items()],
+                "notas": {k: [[*g, *vals] for g, *vals in v] for k, v in self._notes.items()},
+                "canceladas": sorted(self._canceled),
+            }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Aggregates":
+        out = cls()
+        n = len(GROUP_COLS)
+        for item in state["grupos"]:
+            g = tuple(item[:n])
+            out._groups[out._interned.setdefault(g, g)] = list(item[n:])
+        for k, contribs in state["notas"].items():
+            out._notes[k] = [(out._interned.setdefault(tuple(c[:n]), tuple(c[:n])), *c[n:]) for c in contribs]
+        out._canceled = set(state["canceladas"])
+        return out
+
+    def save(self, path: str) -> None:
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(self.to_state(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "Aggregates":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return cls.from_state(json.load(f))
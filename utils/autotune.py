@@ -0,0 +1,120 @@
+# utils/autotune.py
+"""
+Autoajuste do paralelismo do estágio de parse.
+
+Mede arquivos/s e a razão I/O x CPU de cada tarefa (wall vs thread_time)
+nos primeiros segundos da execução e faz hill-climbing no número de
+tarefas simultâneas. Depois do aquecimento o melhor valor fica fixo.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class ConcurrencyTuner:
+    def __init__(
+        self,
+        min_workers: int = 2,
+        max_workers: int = 64,
+        start: Optional[int] = None,
+        warmup_s: float = 5.0,
+        interval_s: float = 0.5,
+    ):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        cpus = os.cpu_count() or 2
+        self._limit = self._clamp(start if start is not None else cpus * 2)
+        self.warmup_s = warmup_s
+        self.interval_s = interval_s
+
+        self._lock = threading.Lock()
+        self._t0: Optional[float] = None
+        self._t_interval = 0.0
+        self._n_interval = 0
+        self._wall = 0.0
+        self._cpu = 0.0
+        self._total = 0
+
+        self._best_rate = 0.0
+        self._best_limit = self._limit
+        self._direction = 0  # 0 = ainda não decidido (decide pela razão de I/O)
+        self._step = max(1, self._limit // 2)
+        self.frozen = False
+
+    def _clamp(self, n: int) -> int:
+        return max(self.min_workers, min(self.max_workers, int(n)))
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def io_ratio(self) -> float:
+        """Fração do tempo das tarefas gasta fora da CPU (esperando I/O ou GIL)."""
+        if self._wall <= 0:
+            return 0.0
+        return max(0.0, 1.0 - self._cpu / self._wall)
+
+    def wrap(self, fn: Callable) -> Callable:
+        """Envolve a função da tarefa para medir wall/CPU dentro da thread do worker."""
+        def timed(*args, **kwargs):
+            w0, c0 = time.perf_counter(), time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - w0
+                cpu = time.thread_time() - c0
+                with self._lock:
+                    self._wall += wall
+                    self._cpu += cpu
+        return timed
+
+    def task_done(self) -> None:
+        """Chamado pelo consumidor a cada tarefa concluída; ajusta o limite por intervalo."""
+        now = time.perf_counter()
+        if self._t0 is None:
+            self._t0 = self._t_interval = now
+        self._total += 1
+        self._n_interval += 1
+        if self.frozen:
+            return
+        elapsed = now - self._t_interval
+        if elapsed < self.interval_s:
+            return
+
+        rate = self._n_interval / elapsed
+        self._n_interval = 0
+        self._t_interval = now
+
+        if self._direction == 0:
+            # muito tempo fora da CPU => mais threads ajudam; senão, GIL manda reduzir
+            self._direction = 1 if self.io_ratio >= 0.5 else -1
+            self._best_rate, self._best_limit = rate, self._limit
+        elif rate > self._best_rate * 1.05:
+            # melhorou: guarda e acelera na mesma direção (busca exponencial)
+            self._best_rate, self._best_limit = rate, self._limit
+            self._step *= 2
+        else:
+            self._direction = -self._direction
+            self._step = self._step // 2
+
+        if self._step == 0 or now - self._t0 >= self.warmup_s:
+            self._limit = self._best_limit
+            self.frozen = True
+            return
+        self._limit = self._clamp(self._best_limit + self._direction * self._step)
+        if self._limit == self._best_limit:
+            # bateu no limite min/max: tenta o outro lado
+            self._direction = -self._direction
+            self._limit = self._clamp(self._best_limit + self._direction * self._step)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = (time.perf_counter() - self._t0) if self._t0 is not None else 0.0
+        return {
+            "modo": "auto",
+            "threads": self._best_limit if self.frozen else self._limit,
+            "arquivos_s_pico": round(self._best_rate, 1),
+            "arquivos_s_media": round(self._total / elapsed, 1) if elapsed > 0 else 0.0,
+            "io_wait_pct": round(self.io_ratio * 100, 1),
+        }
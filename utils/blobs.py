@@ -0,0 +1,130 @@
+# utils/blobs.py
+"""
+Cópia dos XMLs originais fora da memória do processo, para abrir o documento
+de qualquer linha (ou erro) depois do lote.
+
+Dois arquivos numa pasta:
+- xml.bin: os bytes de cada documento, um atrás do outro (append-only);
+- xml.idx: uma linha "offset<TAB>tamanho<TAB>chave" por documento, ou
+  "offset<TAB>tamanho<TAB>chave<TAB>nome" quando a chave não é o nome.
+
+O índice (chave -> offset, tamanho) fica em memória; os bytes são lidos por mmap,
+então pegar um documento não copia nada até ser exibido. Arquivos do disco usam
+o próprio caminho (o `_arquivo` das linhas) como chave. Uploads usam uma chave
+única por upload e guardam o nome à parte: dois uploads com o mesmo nome são
+dois documentos, e a busca pelo nome (`view`/`get`) acha o último gravado.
+"""
+import mmap
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+DATA_FILE = "xml.bin"
+INDEX_FILE = "xml.idx"
+
+
+class BlobStore:
+    def __init__(self, path: str):
+        self.dir = Path(path)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._by_name: Dict[str, str] = {}  # nome -> chave, quando diferem (uploads)
+        data_path = self.dir / DATA_FILE
+        size = data_path.stat().st_size if data_path.exists() else 0
+        idx_path = self.dir / INDEX_FILE
+        if idx_path.exists():
+            with open(idx_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # última linha incompleta (queda durante a gravação)
+                    off, n, key = line.rstrip("\n").split("\t", 2)
+                    key, _, name = key.partition("\t")
+                    off, n = int(off), int(n)
+                    if off + n <= size:
+                        self._index[key] = (off, n)
+                        if name:
+                            self._by_name[name] = key
+        self._data = open(data_path, "a+b")  # legível: o mmap usa o mesmo descritor
+        self._idx = open(idx_path, "a", encoding="utf-8")
+        self._mm: Optional[mmap.mmap] = None
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index or name in self._by_name
+
+    def names(self) -> Iterator[str]:
+        return iter(list(self._index))
+
+    def put(self, key: str, raw, name: Optional[str] = None) -> None:
+        """
+        Acrescenta o documento (bytes ou memoryview); o índice só aponta para bytes já escritos.
+        `name`: nome de exibição (`_arquivo`) quando a chave é outra (uploads).
+        """
+        with self._lock:
+            off = self._data.tell()
+            self._data.write(raw)
+            n = len(raw)
+            alias = name if name and name != key else None
+            self._idx.write(f"{off}\t{n}\t{key}" + (f"\t{alias}" if alias else "") + "\n")
+            self._index[key] = (off, n)
+            if alias:
+                self._by_name[alias] = key
+            self._dirty = True
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._dirty:
+            self._data.flush()
+            self._idx.flush()
+            self._dirty = False
+
+    def view(self, name: str) -> Optional[memoryview]:
+        """Fatia do mmap com o documento (sem cópia), ou None se não estiver guardado."""
+        with self._lock:
+            loc = self._index.get(name)
+            if loc is None and name in self._by_name:
+                loc = self._index.get(self._by_name[name])
+            if loc is None:
+                return None
+            off, n = loc
+            self._flush()
+            if n == 0:
+                return memoryview(b"")
+            if self._mm is None or off + n > len(self._mm):
+                # o arquivo cresceu: novo mapa (views antigas mantêm o anterior vivo)
+                self._mm = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._mm)[off:off + n]
+
+    def get(self, name: str) -> Optional[bytes]:
+        v = self.view(name)
+        return None if v is None else v.tobytes()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._data.close()
+            self._idx.close()
+            self._mm = None  # fechado pelo GC quando não houver mais views
+
+
+def read_original(name: str, blobs: Optional[BlobStore] = None) -> Optional[bytes]:
+    """XML original de uma linha: cópia guardada, senão o próprio arquivo em disco."""
+    if blobs is not None:
+        raw = blobs.get(name)
+        if raw is not None:
+            return raw
+    try:
+        if os.path.isfile(name):
+            with open(name, "rb") as f:
+                return f.read()
+    except OSError:
+        pass
+    return None
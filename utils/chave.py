@@ -0,0 +1,143 @@
+# utils/chave.py
+"""
+Chave de acesso (44 dígitos) em colunas: normalização, dígito verificador e
+decodificação dos campos que a chave carrega.
+
+    cUF(2) AAMM(4) CNPJ(14) mod(2) serie(3) nNF(9) tpEmis(1) cNF(8) cDV(1)
+
+Tudo opera sobre a coluna inteira (fatiamento de strings do pandas e uma
+matriz N x 44 de dígitos no numpy), sem laço Python por linha.
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+KEY_LEN = 44
+_WEIGHTS = np.array([2 + (i % 8) for i in range(KEY_LEN - 1)][::-1], dtype=np.float32)
+
+# campo -> (início, fim) na chave
+LAYOUT = {
+    "cUF": (0, 2),
+    "AAMM": (2, 6),
+    "emit_CNPJ": (6, 20),
+    "modelo": (20, 22),
+    "serie": (22, 25),
+    "numero": (25, 34),
+    "tpEmis": (34, 35),
+    "cNF": (35, 43),
+    "cDV": (43, 44),
+}
+DECODED_COLS = list(LAYOUT) + ["dv_ok"]
+FILL_COLS = ("modelo", "serie", "emit_CNPJ", "nNF")
+
+
+def normalize_keys(values: pd.Series) -> pd.Series:
+    """Versão em bloco de normalize_key: só dígitos, últimos 44 (senão NA)."""
+    s = values.astype("string").str.strip()
+    ok = (s.str.len().eq(KEY_LEN) & s.str.isdigit()).fillna(False)
+    if bool(ok.all()):
+        return s
+    rest = s[~ok].str.replace(r"\D", "", regex=True)
+    rest = rest.where(rest.str.len() >= KEY_LEN).str[-KEY_LEN:]
+    out = s.copy()
+    out[rest.index] = rest
+    return out
+
+
+def key_digits(keys: np.ndarray) -> np.ndarray:
+    """Array de chaves (S44) -> matriz N x 44 de dígitos (uint8), sem cópia de texto."""
+    return np.frombuffer(keys.astype(f"S{KEY_LEN}").tobytes(), dtype=np.uint8).reshape(-1, KEY_LEN) - ord("0")
+
+
+def check_digit_ok(keys: np.ndarray) -> np.ndarray:
+    """Máscara das chaves com o dígito verificador (módulo 11, pesos 2..9) correto."""
+    if len(keys) == 0:
+        return np.zeros(0, dtype=bool)
+    d = key_digits(keys)
+    # soma máxima 43 * 9 * 9: exata em float32, e o produto vai para o BLAS
+    r = np.rint(d[:, :-1].astype(np.float32) @ _WEIGHTS).astype(np.int64) % 11
+    dv = np.where(r < 2, 0, 11 - r)
+    return dv == d[:, -1]
+
+
+def _strip_zeros(s: pd.Series) -> pd.Series:
+    out = s.str.lstrip("0")
+    return out.mask(out.eq("") & s.notna(), "0")
+
+
+def decode_chaves(keys: pd.Series) -> pd.DataFrame:
+    """
+    Chaves já normalizadas (NA onde não há) -> DataFrame com os campos da
+    chave (mesmo índice). `serie` e `numero` sem zeros à esquerda, como nos
+    XMLs; `dv_ok` diz se o dígito verificador confere.
+    """
+    s = keys.astype("string")
+    out = pd.DataFrame({col: s.str[a:b] for col, (a, b) in LAYOUT.items()}, index=s.index)
+    out["serie"] = _strip_zeros(out["serie"])
+    out["numero"] = _strip_zeros(out["numero"])
+    dv = np.zeros(len(s), dtype=bool)
+    has = s.notna().to_numpy()
+    if has.any():
+        dv[has] = check_digit_ok(s[has].to_numpy(dtype=f"S{KEY_LEN}"))
+    out["dv_ok"] = dv
+    return out
+
+
+def emit_from_keys(keys: pd.Series) -> pd.Series:
+    """CNPJ do emitente de cada chave (qualquer entrada; NA se não for chave)."""
+    return normalize_keys(keys).str[6:20]
+
+
+def _fill(df: pd.DataFrame, col: str, values: pd.Series) -> int:
+    """Preenche só as células vazias de `col` nas linhas de `values`; devolve quantas."""
+    if values.empty:
+        return 0
+    if col not in df.columns:
+        df[col] = None
+    elif isinstance(df[col].dtype, pd.CategoricalDtype):
+        df[col] = df[col].astype(object)
+    cur = df.loc[values.index, col]
+    vazio = (cur.isna() | cur.astype(str).str.strip().eq("")).to_numpy()
+    if not vazio.any():
+        return 0
+    df.loc[values.index[vazio], col] = values.to_numpy(dtype=object)[vazio]
+    return int(vazio.sum())
+
+
+def fill_from_chave(df: pd.DataFrame, event_parser: Optional[str] = None) -> pd.DataFrame:
+    """
+    Completa modelo, serie, nNF (nCT no CT-e) e emit_CNPJ a partir da chave,
+    in-place, só onde estão vazios e só com chave de DV válido. Nos eventos
+    (`_parser` == event_parser) a chave é chNFe.
+    """
+    if df.empty or "_parser" not in df.columns:
+        return df
+    # só as linhas com algum dos campos vazio (NF-e completas, o caso comum, não são decodificadas)
+    need = np.zeros(len(df), dtype=bool)
+    for col in FILL_COLS:
+        if col not in df.columns:
+            need[:] = True
+            break
+        need |= (df[col].isna() | df[col].astype(str).str.strip().eq("")).to_numpy()
+    if not need.any():
+        return df
+    is_ev = df["_parser"].eq(event_parser).to_numpy() if event_parser else np.zeros(len(df), dtype=bool)
+    keys = pd.Series(pd.NA, index=df.index, dtype="string")
+    if "chave" in df.columns and (need & ~is_ev).any():
+        keys[need & ~is_ev] = normalize_keys(df.loc[need & ~is_ev, "chave"])
+    if "chNFe" in df.columns and (need & is_ev).any():
+        keys[need & is_ev] = normalize_keys(df.loc[need & is_ev, "chNFe"])
+    keys = keys.dropna()
+    if keys.empty:
+        return df
+    dec = decode_chaves(keys)
+    dec = dec[dec["dv_ok"]]
+    for col in ("modelo", "serie", "emit_CNPJ"):
+        _fill(df, col, dec[col])
+    nf = dec["modelo"].isin(["55", "65"])
+    _fill(df, "nNF", dec.loc[nf, "numero"])
+    cte = dec["modelo"].eq("57") & ~pd.Series(is_ev, index=df.index)[dec.index]
+    if "nCT" in df.columns:
+        _fill(df, "nCT", dec.loc[cte, "numero"])
+    return df
@@ -0,0 +1,182 @@
+# utils/checkpoint.py
+"""
+Execuções retomáveis: diário de progresso durável + parciais em disco.
+
+Cada execução tem um ID e uma pasta própria:
+    <runs_dir>/<run_id>/run.json               parâmetros da execução
+    <runs_dir>/<run_id>/chunk-000001.jsonl.gz  linhas/erros de um bloco de arquivos
+    <runs_dir>/<run_id>/journal.log            uma linha por bloco gravado:
+                                               "<chunk>\\t<json com os arquivos do bloco>"
+
+O bloco é gravado (atômico, com fsync do arquivo e da pasta) ANTES da linha do diário; só contam como concluídos
+os arquivos de blocos registrados no diário. Se o processo morrer no meio, o
+bloco órfão é descartado e esses arquivos são reprocessados, então a saída
+final é a mesma de uma execução sem interrupção.
+"""
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.io import read_jsonl_gz, write_jsonl_gz
+
+RUNS_DIR = os.environ.get("LEITOR_XML_RUNS", ".runs")
+_RUN_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,80}$")
+_CHUNK_RE = re.compile(r"^chunk-(\d+)\.jsonl\.gz$")
+
+
+def valid_run_id(run_id: str) -> bool:
+    return bool(_RUN_ID_RE.match(run_id or "")) and run_id not in {".", ".."}
+
+
+def _chunk_number(chunk: str) -> int:
+    m = _CHUNK_RE.match(chunk)
+    return int(m.group(1)) if m else 0
+
+
+class RunCheckpoint:
+    def __init__(self, run_id: str, runs_dir: Optional[str] = None,
+                 params: Optional[Dict[str, Any]] = None,
+                 flush_every: int = 1000, flush_secs: float = 15.0, read_only: bool = False):
+        """`read_only`: só abre uma execução existente (diff, conciliar); sem diário, FileNotFoundError."""
+        if not valid_run_id(run_id):
+            raise ValueError("ID de execução inválido (use letras, números, '.', '_' ou '-').")
+        self.run_id = run_id
+        self.dir = Path(runs_dir or RUNS_DIR) / run_id
+        self.read_only = read_only
+        if read_only:
+            if not (self.dir / "journal.log").is_file():
+                raise FileNotFoundError(f"Execução não encontrada: {run_id} (sem diário em {self.dir})")
+        else:
+            self.dir.mkdir(parents=True, exist_ok=True)
+        self.flush_every = max(1, flush_every)
+        self.flush_secs = flush_secs
+
+        meta_path = self.dir / "run.json"
+        if meta_path.exists():
+            self.params = json.loads(meta_path.read_text(encoding="utf-8"))
+            if params and not read_only:
+                self._check_params(params)
+        elif read_only:
+            self.params = {"run_id": run_id}
+        else:
+            self.params = dict(params or {}, run_id=run_id, criado_em=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            meta_path.write_text(json.dumps(self.params, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        self._chunks: List[str] = []
+        self._last_chunk = 0  # maior número de bloco no diário (inclusive blocos cujo arquivo sumiu)
+        self._done: Set[str] = set()
+        self._load_journal()
+
+        self._buf_names: List[str] = []
+        self._buf_items: List[Dict[str, Any]] = []
+        self._last_flush = time.monotonic()
+
+    def _check_params(self, params: Dict[str, Any]) -> None:
+        """Retomada só com os mesmos parâmetros (tipo, pastas) com que a execução foi criada."""
+        # ida e volta no JSON: tuplas viram listas, como no run.json
+        wanted = json.loads(json.dumps(params, ensure_ascii=False, default=str))
+        diff = [k for k, v in wanted.items() if self.params.get(k) != v]
+        if diff:
+            detail = "; ".join(f"{k}: {self.params.get(k)!r} na execução, {wanted[k]!r} agora" for k in diff)
+            raise ValueError(f"Execução {self.run_id} foi criada com outros parâmetros ({detail}). "
+                             "Use outro ID de execução.")
+
+    # ---------------------------
+    # leitura do diário
+    # ---------------------------
+    def _load_journal(self) -> None:
+        journal = self.dir / "journal.log"
+        if journal.exists():
+            with open(journal, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # última linha incompleta (queda durante a escrita)
+                    chunk, names = line.rstrip("\n").split("\t", 1)
+                    self._last_chunk = max(self._last_chunk, _chunk_number(chunk))
+                    if (self.dir / chunk).exists():
+                        self._chunks.append(chunk)
+                        self._done.update(json.loads(names))
+        if self.read_only:
+            return
+        # blocos gravados mas não registrados no diário: descarta
+        known = set(self._chunks)
+        for p in self.dir.glob("chunk-*.jsonl.gz"):
+            if p.name not in known:
+                p.unlink()
+
+    @property
+    def completed(self) -> Set[str]:
+        return self._done
+
+    @property
+    def finished(self) -> bool:
+        return (self.dir / "finished").exists()
+
+    # ---------------------------
+    # gravação
+    # ---------------------------
+    def record(self, name: str, rows: Optional[List[Dict[str, Any]]], errrow: Optional[Dict[str, Any]]) -> None:
+        """Registra o resultado de um arquivo; grava um bloco quando atinge o limite."""
+        self._buf_names.append(name)
+        if rows is not None:
+            self._buf_items.extend({"k": "row", "d": r} for r in rows)
+        if errrow is not None:
+            self._buf_items.append({"k": "err", "d": errrow})
+        if (len(self._buf_names) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_secs):
+            self.flush()
+
+    def flush(self) -> None:
+        if self.read_only:
+            raise RuntimeError(f"Execução {self.run_id} aberta só para leitura.")
+        self._last_flush = time.monotonic()
+        if not self._buf_names:
+            return
+        # numeração pelo diário, não por len(_chunks): bloco do diário sem arquivo não pode ter o nome reusado
+        self._last_chunk += 1
+        chunk = f"chunk-{self._last_chunk:06d}.jsonl.gz"
+        # bloco e entrada na pasta no disco antes da linha do diário que os torna válidos
+        write_jsonl_gz(self.dir / chunk, self._buf_items, sync=True)
+        line = chunk + "\t" + json.dumps(self._buf_names, ensure_ascii=False) + "\n"
+        with open(self.dir / "journal.log", "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._chunks.append(chunk)
+        self._done.update(self._buf_names)
+        self._buf_names, self._buf_items = [], []
+
+    def finish(self) -> None:
+        self.flush()
+        (self.dir / "finished").write_text(time.strftime("%Y-%m-%dT%H:%M:%S"), encoding="utf-8")
+
+    # ---------------------------
+    # recuperação
+    # ---------------------------
+    def iter_saved(self) -> Iterable[Tuple[str, Dict[str, Any]]]:
+        """("row" | "err", dados) de todos os blocos gravados, na ordem do diário."""
+        for chunk in self._chunks:
+            for item in read_jsonl_gz(self.dir / chunk):
+                yield item["k"], item["d"]
+
+    def load(self, into=None):
+        """(RowStore, erros) com tudo o que já foi gravado. `into`: outro acumulador (ex.: SpillWriter)."""
+        from utils.rows import RowStore
+
+        results = into if into is not None else RowStore()
+        erros: List[Dict[str, Any]] = []
+        for kind, data in self.iter_saved():
+            if kind == "row":
+                results.append(data)
+            else:
+                erros.append(data)
+        return results, erros
+
+
+def pending_inputs(names: Iterable[Any], ckpt: RunCheckpoint) -> List[Any]:
+    """Filtra as entradas que ainda não constam no diário (compara por str(nome); aceita (nome, tamanho))."""
+    done = ckpt.completed
+    return [n for n in names if str(n[0] if isinstance(n, tuple) else n) not in done]
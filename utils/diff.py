@@ -0,0 +1,346 @@
+# utils/diff.py
+"""
+Comparação entre duas execuções (ex.: o mês passado e o reprocessamento de hoje).
+
+Cada lado é um conjunto de resultados: arquivo exportado (.csv, .parquet,
+.xlsx, com o arquivo de erros opcional para saber das canceladas), base local
+SQLite ou "run:<ID>" (diário de uma execução). As linhas são casadas pela
+mesma chave de upsert da base (doc_key: 44 dígitos ou NFS-e por emitente +
+número), e a última ocorrência de uma chave vale.
+
+- Em memória: índice por hash (dict chave -> linha) de cada lado.
+- Com orçamento (`memoria_bytes`): cada lado vira blocos ordenados pela chave
+  em disco, lidos em sequência com heapq.merge, e os dois fluxos ordenados são
+  comparados num merge-join. A base SQLite já sai ordenada pela chave.
+
+Saída: uma linha por diferença (chave, status, campo, antes, depois, delta).
+Status: incluída, removida, cancelada ou alterada; incluídas e removidas vêm
+com o valor do documento no campo (vNF, ou vTPrest do CT-e), então somar
+`delta` dá o efeito no valor total.
+"""
+import heapq
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.postprocess import EVENT_PARSER, EXCEL_COLUMNS, EXCEL_TZ, is_missing, read_frame
+from utils.store import doc_key
+
+DIFF_COLS = ["chave", "numero", "emit_CNPJ", "status", "campo", "antes", "depois", "delta"]
+IGNORE_FIELDS = frozenset({"_arquivo", "__key"})
+CANCELED_ERR = ("NF cancelada", "NF cancelada (sem XML da nota)")
+AUTORIZADA, CANCELADA = "Autorizada", "Cancelada"
+
+_NUM_RE = re.compile(r"^-?\d+(\.\d+)?$")
+_ISO_DT_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:")
+_FROM_EXCEL = {v: k for k, v in EXCEL_COLUMNS.items()}
+
+Keyed = Tuple[str, Dict[str, Any]]
+
+
+# ---------------------------
+# leitura dos lados
+# ---------------------------
+def _clean(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Sem vazios e com os nomes internos (a planilha do app renomeia as colunas)."""
+    return {_FROM_EXCEL.get(k, k): v for k, v in row.items() if not is_missing(v) and v != ""}
+
+
+def _canceled_rows(erros: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Notas canceladas (vão para Erros na exportação) como linhas com situacao=Cancelada."""
+    for e in erros:
+        if e.get("tipo") in CANCELED_ERR:
+            row = {k: e.get(k) for k in ("chave", "nNF", "serie", "emit_CNPJ", "vNF")}
+            row["situacao"] = CANCELADA
+            yield row
+
+
+def _keyed(rows: Iterable[Dict[str, Any]]) -> Iterator[Keyed]:
+    for row in rows:
+        row = _clean(row)
+        if row.get("_parser") == EVENT_PARSER:
+            continue
+        key = doc_key(row)
+        if key is not None:
+            row.setdefault("situacao", AUTORIZADA)
+            yield key, row
+
+
+def _frame_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    ext = path.lower().rsplit(".", 1)[-1]
+    if ext == "parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif ext == "csv":
+        yield from pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+    else:
+        yield read_frame(path)
+
+
+def _store_rows(path: str, chunk_rows: int) -> Iterator[Keyed]:
+    """Base local: `dados` é a linha original do parser; ORDER BY doc_key já é a ordem do merge."""
+    conn = sqlite3.connect(path)
+    try:
+        cur = conn.execute("SELECT doc_key, cancelada, dados FROM notas ORDER BY doc_key")
+        while True:
+            batch = cur.fetchmany(chunk_rows)
+            if not batch:
+                break
+            for key, cancelada, dados in batch:
+                if key.startswith("ARQ:"):
+                    continue  # sem chave nem número: não casa entre execuções
+                row = _clean(json.loads(dados) if dados else {})
+                row["situacao"] = CANCELADA if cancelada else AUTORIZADA
+                yield key, row
+    finally:
+        conn.close()
+
+
+def is_store(spec: str) -> bool:
+    return spec.lower().endswith((".sqlite", ".sqlite3", ".db"))
+
+
+def open_side(spec: str, erros: Optional[str] = None, runs_dir: Optional[str] = None,
+              chunk_rows: int = 50_000) -> Tuple[Iterator[Keyed], bool]:
+    """(linhas com chave, já ordenadas?) de um arquivo exportado, base SQLite ou run:<ID>."""
+    if spec.startswith("run:"):
+        from utils.checkpoint import RunCheckpoint
+        from utils.watch import load_store
+
+        df, errs = load_store(RunCheckpoint(spec[4:], runs_dir=runs_dir, read_only=True))
+        return _keyed(_frame_and_errors(df, errs)), False
+    if is_store(spec):
+        return _store_rows(spec, chunk_rows), True
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        for chunk in _frame_chunks(spec, chunk_rows):
+            yield from chunk.to_dict("records")
+        if erros:
+            yield from _canceled_rows(read_frame(erros).to_dict("records"))
+
+    return _keyed(rows()), False
+
+
+def _frame_and_errors(df: pd.DataFrame, erros: Optional[Iterable[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    yield from df.to_dict("records")
+    if erros is not None:
+        yield from _canceled_rows(erros)
+
+
+# ---------------------------
+# ordenação externa
+# ---------------------------
+def _read_run(path: str) -> Iterator[Keyed]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            key, row = json.loads(line)
+            yield key, row
+
+
+def sorted_rows(rows: Iterable[Keyed], run_rows: int, tmp_dir: str) -> Iterator[Keyed]:
+    """
+    Ordena por chave com memória limitada: blocos de `run_rows` linhas ordenados
+    e gravados em disco, depois intercalados. Empates saem na ordem de chegada.
+    """
+    runs: List[str] = []
+    buf: List[Keyed] = []
+
+    def dump() -> None:
+        buf.sort(key=lambda kv: kv[0])  # sort estável: mantém a ordem de chegada por chave
+        path = os.path.join(tmp_dir, f"run-{len(runs):05d}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for kv in buf:
+                f.write(json.dumps(kv, ensure_ascii=False, default=str))
+                f.write("\n")
+        runs.append(path)
+        buf.clear()
+
+    for kv in rows:
+        buf.append(kv)
+        if len(buf) >= run_rows:
+            dump()
+    if not runs:
+        buf.sort(key=lambda kv: kv[0])
+        yield from buf
+        return
+    if buf:
+        dump()
+    yield from heapq.merge(*(_read_run(p) for p in runs), key=lambda kv: kv[0])
+
+
+def _last_per_key(rows: Iterable[Keyed]) -> Iterator[Keyed]:
+    """Fluxo ordenado -> uma linha por chave (a última)."""
+    cur: Optional[Keyed] = None
+    for kv in rows:
+        if cur is not None and kv[0] != cur[0]:
+            yield cur
+        cur = kv
+    if cur is not None:
+        yield cur
+
+
+# ---------------------------
+# comparação
+# ---------------------------
+def _norm(v: Any) -> Any:
+    """Mesma grandeza vinda de CSV (texto), Parquet (tipado) ou da base (JSON)."""
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (int, float)):
+        return round(float(v), 6)
+    if isinstance(v, datetime):
+        return _wall_time(pd.Timestamp(v))
+    if isinstance(v, date):
+        return v.isoformat()
+    s = str(v).strip()
+    if _NUM_RE.match(s):
+        return round(float(s), 6)
+    if _ISO_DT_RE.match(s):
+        try:
+            return _wall_time(pd.Timestamp(s))
+        except ValueError:
+            return s
+    return s
+
+
+def _wall_time(ts: pd.Timestamp) -> str:
+    """Hora local sem fuso, como na planilha (strip_tz_for_excel)."""
+    if ts.tzinfo is not None:
+        try:
+            ts = ts.tz_convert(EXCEL_TZ)
+        except Exception:
+            pass
+        ts = ts.tz_localize(None)
+    return ts.isoformat(sep=" ")
+
+
+def _is_value(field: str) -> bool:
+    return field.startswith("v") or field == "frete_rateado"
+
+
+def _value_field(row: Dict[str, Any]) -> str:
+    """Valor do documento: vNF (NF-e/NFC-e/NFS-e) ou vTPrest (CT-e), como na base."""
+    return "vTPrest" if "vNF" not in row and "vTPrest" in row else "vNF"
+
+
+def _num(v: Any) -> Optional[float]:
+    v = _norm(v)
+    return v if isinstance(v, float) else None
+
+
+def _record(key: str, row: Dict[str, Any], status: str, campo: Optional[str],
+            antes: Any, depois: Any, delta: Optional[float]) -> Dict[str, Any]:
+    return {
+        "chave": key,
+        "numero": row.get("nNF") or row.get("nCT") or row.get("numero"),
+        "emit_CNPJ": row.get("emit_CNPJ"),
+        "status": status, "campo": campo, "antes": antes, "depois": depois,
+        "delta": None if delta is None else round(delta, 2),
+    }
+
+
+def compare_rows(key: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]],
+                 fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """Diferenças de uma chave; `fields` restringe os campos comparados."""
+    if old is None:
+        campo = _value_field(new)
+        v = _num(new.get(campo))
+        return [_record(key, new, "incluída", campo, None, new.get(campo), v)]
+    if new is None:
+        campo = _value_field(old)
+        v = _num(old.get(campo))
+        return [_record(key, old, "removida", campo, old.get(campo), None, None if v is None else -v)]
+    status = "cancelada" if old["situacao"] == AUTORIZADA and new["situacao"] == CANCELADA else "alterada"
+    names = fields if fields is not None else [c for c in new if c in old]
+    out = []
+    for c in names:
+        if c in IGNORE_FIELDS or c not in old or c not in new:
+            continue
+        a, b = _norm(old[c]), _norm(new[c])
+        if a == b:
+            continue
+        delta = b - a if _is_value(c) and isinstance(a, float) and isinstance(b, float) else None
+        out.append(_record(key, new, status, c, old[c], new[c], delta))
+    return out
+
+
+def diff_keyed(old: Iterable[Keyed], new: Iterable[Keyed],
+               fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Em memória: índice por hash dos dois lados."""
+    a = dict(old)
+    b = dict(new)
+    for key in sorted(a.keys() | b.keys()):
+        yield from compare_rows(key, a.get(key), b.get(key), fields)
+
+
+def diff_sorted(old: Iterable[Keyed], new: Iterable[Keyed],
+                fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Merge-join de dois fluxos ordenados pela chave (memória constante)."""
+    it_a, it_b = _last_per_key(old), _last_per_key(new)
+    a, b = next(it_a, None), next(it_b, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            yield from compare_rows(a[0], a[1], None, fields)
+            a = next(it_a, None)
+        elif a is None or b[0] < a[0]:
+            yield from compare_rows(b[0], None, b[1], fields)
+            b = next(it_b, None)
+        else:
+            yield from compare_rows(a[0], a[1], b[1], fields)
+            a, b = next(it_a, None), next(it_b, None)
+
+
+def diff_frames(old_df: pd.DataFrame, new_df: pd.DataFrame,
+                old_erros: Optional[Iterable[Dict[str, Any]]] = None,
+                new_erros: Optional[Iterable[Dict[str, Any]]] = None,
+                fields: Optional[List[str]] = None) -> pd.DataFrame:
+    """Diferenças entre dois DataFrames de resultado (erros: para reconhecer as canceladas)."""
+    changes = diff_keyed(_keyed(_frame_and_errors(old_df, old_erros)),
+                         _keyed(_frame_and_errors(new_df, new_erros)), fields)
+    return pd.DataFrame(list(changes), columns=DIFF_COLS)
+
+
+def diff_sources(old: str, new: str, old_erros: Optional[str] = None, new_erros: Optional[str] = None,
+                 memoria_bytes: int = 0, runs_dir: Optional[str] = None,
+                 fields: Optional[List[str]] = None, tmp_dir: Optional[str] = None) -> pd.DataFrame:
+    """
+    Diferenças entre dois conjuntos gravados. Sem `memoria_bytes`, índice em
+    memória; com ele, ordenação externa + merge-join (blocos de ~2 KB por linha).
+    """
+    side_a, sorted_a = open_side(old, old_erros, runs_dir)
+    side_b, sorted_b = open_side(new, new_erros, runs_dir)
+    if not memoria_bytes:
+        return pd.DataFrame(list(diff_keyed(side_a, side_b, fields)), columns=DIFF_COLS)
+
+    run_rows = max(1000, memoria_bytes // 2 // 2048)  # metade para cada lado
+    work = tempfile.mkdtemp(prefix="leitor_xml_diff_", dir=tmp_dir)
+    try:
+        dir_a, dir_b = os.path.join(work, "a"), os.path.join(work, "b")
+        os.makedirs(dir_a)
+        os.makedirs(dir_b)
+        if not sorted_a:
+            side_a = sorted_rows(side_a, run_rows, dir_a)
+        if not sorted_b:
+            side_b = sorted_rows(side_b, run_rows, dir_b)
+        return pd.DataFrame(list(diff_sorted(side_a, side_b, fields)), columns=DIFF_COLS)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def diff_summary(changes: pd.DataFrame) -> pd.DataFrame:
+    """Chaves e efeito no valor (vNF/vTPrest) por status."""
+    if changes.empty:
+        return pd.DataFrame(columns=["status", "chaves", "delta_valor"])
+    valor = changes[changes["campo"].isin(["vNF", "vTPrest"])]
+    out = changes.groupby("status")["chave"].nunique().rename("chaves").to_frame()
+    delta = pd.to_numeric(valor["delta"], errors="coerce").groupby(valor["status"]).sum()
+    out["delta_valor"] = delta.reindex(out.index).fillna(0.0).round(2)
+    return out.reset_index()
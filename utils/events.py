@@ -0,0 +1,211 @@
+# utils/events.py
+"""
+Linha do tempo de eventos por chave de NF-e (todos os tipos, não só 110111).
+
+O índice é atualizado a cada arquivo: os eventos de uma chave ficam ordenados
+por (dhEvento, nSeqEvento) e o estado resumido da chave (situação, última
+manifestação do destinatário, cartas de correção, EPEC) é recalculado só para
+ela. Assim "qual a situação da nota X" e "notas com manifestação pendente"
+custam O(1) por chave, sem varrer os eventos.
+"""
+import bisect
+import gzip
+import json
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set
+
+from utils.values import EVENT_PARSER, is_cancel_event, normalize_key
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+EVENT_TYPES = {
+    "110110": "Carta de Correção",
+    "110111": "Cancelamento",
+    "110112": "Cancelamento por substituição",
+    "110140": "EPEC",
+    "210200": "Confirmação da Operação",
+    "210210": "Ciência da Operação",
+    "210220": "Desconhecimento da Operação",
+    "210240": "Operação não Realizada",
+}
+CANCEL_TYPES = frozenset({"110111", "110112"})
+MANIFEST_CONCLUSIVE = frozenset({"210200", "210220", "210240"})
+MANIFEST_TYPES = MANIFEST_CONCLUSIVE | {"210210"}
+
+
+def _ts(dh: Optional[str]) -> float:
+    """dhEvento (ISO, com ou sem fuso) -> epoch para ordenar; sem data vai para o início."""
+    if not dh:
+        return float("-inf")
+    try:
+        return datetime.fromisoformat(str(dh).strip()).timestamp()
+    except ValueError:
+        return float("-inf")
+
+
+@dataclass
+class Event:
+    tpEvento: str
+    descEvento: Optional[str]
+    dhEvento: Optional[str]
+    nSeqEvento: int
+    nProt: Optional[str]
+    autor: Optional[str]
+    arquivo: Optional[str]
+
+    @property
+    def sort_key(self):
+        return (_ts(self.dhEvento), self.nSeqEvento)
+
+    @property
+    def cancela(self) -> bool:
+        return self.tpEvento in CANCEL_TYPES or is_cancel_event({"tpEvento": self.tpEvento, "descEvento": self.descEvento})
+
+
+class EventIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: Dict[str, List[Event]] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._notes: Set[str] = set()     # chaves de NF-e vistas (modelo 55: tem manifestação)
+        self._pending: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    # ---------------------------
+    # ingestão
+    # ---------------------------
+    def add(self, rows: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for row in rows:
+                parser = row.get("_parser")
+                if parser == EVENT_PARSER:
+                    key = normalize_key(row.get("chNFe"))
+                    if key:
+                        self._add_event(key, row)
+                elif parser == "NF-e":
+                    key = normalize_key(row.get("chave"))
+                    if key and key not in self._notes:
+                        self._notes.add(key)
+                        self._refresh(key)
+
+    def _add_event(self, key: str, row: Dict[str, Any]) -> None:
+        try:
+            seq = int(row.get("nSeqEvento") or 1)
+        except (TypeError, ValueError):
+            seq = 1
+        ev = Event(
+            tpEvento=str(row.get("tpEvento") or "").strip(),
+            descEvento=row.get("descEvento"),
+            dhEvento=row.get("dhEvento"),
+            nSeqEvento=seq,
+            nProt=row.get("nProt_retEvento"),
+            autor=row.get("emit_CNPJ"),
+            arquivo=row.get("_arquivo"),
+        )
+        timeline = self._events.setdefault(key, [])
+        # o mesmo evento em dois arquivos (ex.: evento e procEvento) entra uma vez
+        if any(e.tpEvento == ev.tpEvento and e.nSeqEvento == ev.nSeqEvento and e.dhEvento == ev.dhEvento
+               for e in timeline):
+            return
+        keys = [e.sort_key for e in timeline]
+        timeline.insert(bisect.bisect_right(keys, ev.sort_key), ev)
+        self._refresh(key)
+
+    def _refresh(self, key: str) -> None:
+        """Recalcula o estado resumido de uma chave (eventos dela já ordenados)."""
+        timeline = self._events.get(key, [])
+        cancel = next((e for e in reversed(timeline) if e.cancela), None)
+        manif = next((e for e in reversed(timeline) if e.tpEvento in MANIFEST_CONCLUSIVE), None)
+        ciencia = next((e for e in reversed(timeline) if e.tpEvento == "210210"), None)
+        ultimo = timeline[-1] if timeline else None
+        st = {
+            "situacao": "Cancelada" if cancel else "Autorizada",
+            "cancelado_em": cancel.dhEvento if cancel else None,
+            "manifestacao": EVENT_TYPES.get(manif.tpEvento) if manif else ("Ciência da Operação" if ciencia else None),
+            "manifestado_em": (manif or ciencia).dhEvento if (manif or ciencia) else None,
+            "cartas_correcao": sum(1 for e in timeline if e.tpEvento == "110110"),
+            "epec": any(e.tpEvento == "110140" for e in timeline),
+            "eventos": len(timeline),
+            "ultimo_evento": (EVENT_TYPES.get(ultimo.tpEvento) or ultimo.descEvento or ultimo.tpEvento) if ultimo else None,
+            "ultimo_em": ultimo.dhEvento if ultimo else None,
+            "nota_lida": key in self._notes,
+        }
+        self._status[key] = st
+        # pendente: NF-e (ou ciência) sem manifestação conclusiva e não cancelada
+        if cancel is None and manif is None and (key in self._notes or ciencia is not None):
+            self._pending.add(key)
+        else:
+            self._pending.discard(key)
+
+    # ---------------------------
+    # consultas
+    # ---------------------------
+    def status(self, chave: Any) -> Optional[Dict[str, Any]]:
+        key = normalize_key(chave)
+        with self._lock:
+            st = self._status.get(key) if key else None
+            return dict(st, chave=key) if st else None
+
+    def timeline(self, chave: Any) -> List[Dict[str, Any]]:
+        key = normalize_key(chave)
+        with self._lock:
+            return [dict(asdict(e), tipo=EVENT_TYPES.get(e.tpEvento)) for e in self._events.get(key or "", [])]
+
+    def pending_manifestacao(self) -> List[str]:
+        with self._lock:
+            return sorted(self._pending)
+
+    def status_frame(self, chaves: Optional[Iterable[str]] = None) -> "pd.DataFrame":
+        import pandas as pd
+
+        with self._lock:
+            keys = sorted(self._status) if chaves is None else [k for k in chaves if k in self._status]
+            return pd.DataFrame([dict(self._status[k], chave=k) for k in keys],
+                                columns=["chave", "situacao", "cancelado_em", "manifestacao", "manifestado_em",
+                                         "cartas_correcao", "epec", "eventos", "ultimo_evento", "ultimo_em",
+                                         "nota_lida"])
+
+    def events_frame(self) -> "pd.DataFrame":
+        import pandas as pd
+
+        with self._lock:
+            rows = [dict(asdict(e), chave=k, tipo=EVENT_TYPES.get(e.tpEvento))
+                    for k, timeline in self._events.items() for e in timeline]
+        return pd.DataFrame(rows, columns=["chave", "tpEvento", "tipo", "descEvento", "dhEvento", "nSeqEvento",
+                                           "nProt", "autor", "arquivo"])
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            out: Dict[str, int] = {}
+            for timeline in self._events.values():
+                for e in timeline:
+                    label = EVENT_TYPES.get(e.tpEvento) or e.tpEvento or "?"
+                    out[label] = out.get(label, 0) + 1
+            return out
+
+    # ---------------------------
+    # persistência (CLI)
+    # ---------------------------
+    def save(self, path: str) -> None:
+        with self._lock:
+            data = {"notas": sorted(self._notes),
+                    "eventos": {k: [asdict(e) for e in tl] for k, tl in self._events.items()}}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "EventIndex":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        out = cls()
+        out._notes = set(data["notas"])
+        for k, tl in data["eventos"].items():
+            out._events[k] = [Event(**e) for e in tl]
+        for k in out._notes | set(out._events):
+            out._refresh(k)
+        return out
@@ -0,0 +1,125 @@
+# utils/executor.py
+"""Submissão em janela (in-flight limitado) sobre um executor de concurrent.futures."""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+Task = Tuple[Callable, tuple, Any]  # (função, args, metadados do chamador)
+
+
+def _run_timed(cell: list, fn: Callable, *args):
+    cell.append(time.monotonic())  # início real (a tarefa pode ter esperado thread livre)
+    return fn(*args)
+
+
+def iter_windowed(
+    ex: Executor,
+    tasks: Iterable[Task],
+    window: Callable[[], int],
+    timeout_s: Optional[float] = None,
+) -> Iterator[Tuple[Any, Future]]:
+    """
+    Submete `tasks` mantendo no máximo `window()` futures pendentes e devolve
+    (meta, future) à medida que terminam. `window` é consultado a cada volta,
+    então a concorrência pode mudar durante a execução.
+
+    Com `timeout_s`, um future que passa do prazo também é devolvido, ainda NÃO
+    concluído (`fut.done()` é False): sai da janela e o chamador decide o que
+    fazer. A thread continua ocupada até o parse terminar; o resultado é ignorado.
+    """
+    it = iter(tasks)
+    pending: Dict[Future, Any] = {}
+    started: Dict[Future, list] = {}
+    exhausted = False
+    while True:
+        limit = max(1, int(window()))
+        while not exhausted and len(pending) < limit:
+            try:
+                fn, args, meta = next(it)
+            except StopIteration:
+                exhausted = True
+                break
+            if timeout_s:
+                cell: list = []
+                fut = ex.submit(_run_timed, cell, fn, *args)
+                started[fut] = cell
+            else:
+                fut = ex.submit(fn, *args)
+            pending[fut] = meta
+        if not pending:
+            return
+        wait_s = None
+        if timeout_s:
+            t0s = [c[0] for c in started.values() if c]
+            wait_s = max(0.0, min(t0s) + timeout_s - time.monotonic()) if t0s else timeout_s
+        done, _ = wait(pending, timeout=wait_s, return_when=FIRST_COMPLETED)
+        for fut in done:
+            started.pop(fut, None)
+            yield pending.pop(fut), fut
+        if timeout_s:
+            now = time.monotonic()
+            for fut in [f for f, c in started.items() if c and now - c[0] >= timeout_s and f not in done]:
+                if fut.done():
+                    continue  # terminou entre o wait e agora: sai na próxima volta
+                del started[fut]
+                yield pending.pop(fut), fut
+
+
+class AbandonablePool:
+    """
+    ThreadPoolExecutor em que tarefas abandonadas por prazo seguem contando como
+    ocupadas (`stuck`) até a thread voltar: o parse no lxml não é interrompível.
+    Quem submete desconta `stuck` da própria janela. Quando as presas chegam a
+    `max_stuck`, o pool é trocado por um novo com todas as threads livres; o
+    antigo é largado e as presas terminam nele sem ocupar o novo.
+    """
+
+    def __init__(self, max_workers: int, max_stuck: Optional[int] = None, thread_name_prefix: str = ""):
+        self.max_workers = max(1, max_workers)
+        self.max_stuck = max(1, max_stuck or self.max_workers // 4)
+        self.thread_name_prefix = thread_name_prefix
+        self.replaced = 0
+        self._lock = threading.Lock()
+        self._stuck: set = set()
+        self._old: list = []
+        self._ex = self._new()
+
+    def _new(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.thread_name_prefix)
+
+    @property
+    def stuck(self) -> int:
+        return len(self._stuck)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        with self._lock:
+            return self._ex.submit(fn, *args)
+
+    def abandon(self, fut: Future) -> None:
+        """Marca a tarefa como presa (passou do prazo, resultado descartado)."""
+        with self._lock:
+            if fut.done():
+                return
+            self._stuck.add(fut)
+            old = None
+            if len(self._stuck) >= self.max_stuck:
+                old, self._ex = self._ex, self._new()
+                self._stuck = set()
+                self._old.append(old)
+                self.replaced += 1
+        fut.add_done_callback(self._unstick)
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def _unstick(self, fut: Future) -> None:
+        with self._lock:
+            self._stuck.discard(fut)
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        # com thread presa não espera por ela
+        with self._lock:
+            ex, old, stuck = self._ex, self._old, bool(self._stuck)
+        ex.shutdown(wait=wait and not stuck, cancel_futures=cancel_futures)
+        for o in old:
+            o.shutdown(wait=False, cancel_futures=cancel_futures)
@@ -1,5 +1,7 @@
+import gzip
+import json
 import os
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 from pathlib import Path
 
 def iter_xml_paths_from_dir(dir_path: str) -> Iterable[Path]:
@@ -7,6 +9,25 @@ def iter_xml_paths_from_dir(dir_path: str) -> Iterable[Path]:
     for ext in ("*.xml", "*.XML"):
         yield from p.rglob(ext)
 
+def iter_xml_entries(dir_path: str) -> Iterator[Tuple[Path, int]]:
+    """(caminho, tamanho) dos XMLs sob `dir_path`, com os.scandir (mesmo critério do rglob)."""
+    stack = [str(dir_path)]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.name.endswith((".xml", ".XML")) and e.is_file():
+                        yield Path(e.path), e.stat().st_size
+                except OSError:
+                    continue
+
 def chunked(iterable, size: int):
     chunk = []
     for item in iterable:
@@ -16,3 +37,37 @@ def chunked(iterable, size: int):
             chunk = []
     if chunk:
         yield chunk
+
+def fsync_dir(path: Path) -> None:
+    """Persiste a entrada de um arquivo recém-renomeado na pasta (no Windows não há fsync de pasta)."""
+    if os.name == "nt":
+        return
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_jsonl_gz(path: Path, rows: Iterable[Dict[str, Any]], sync: bool = False) -> int:
+    """Grava via .tmp + replace. `sync`: fsync do arquivo e da pasta antes de voltar."""
+    tmp = path.with_name(path.name + ".tmp")
+    n = 0
+    with open(tmp, "wb") as raw:
+        with gzip.open(raw, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str))
+                f.write("\n")
+                n += 1
+        if sync:
+            raw.flush()
+            os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    if sync:
+        fsync_dir(path.parent)
+    return n
+
+def read_jsonl_gz(path: Path) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,501 @@
+# utils/jobs.py
+"""
+Fila de processamento compartilhada entre as sessões do app.
+
+Um único JobManager por processo, com UM pool de parse de tamanho fixo
+(LEITOR_XML_WORKERS, padrão 32). Cada "Processar" vira um Job na fila:
+- a leitura de disco de cada job roda no seu Prefetcher (read-ahead em bytes);
+- o despachante distribui as vagas do pool em rodízio entre as SESSÕES (uma
+  tarefa por vez para cada sessão com trabalho), e por ordem de chegada entre
+  os jobs da mesma sessão;
+- o app só consulta o estado do job, então a página não fica travada e o job
+  pode ser cancelado;
+- arquivos acima do limite de tamanho ou que passam do prazo vão para uma
+  faixa de quarentena (processos, ver utils/quarantine.py) comum a todos os jobs.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from utils.executor import AbandonablePool
+from utils.pipeline import error_row, parse_buffer_bytes, parse_path
+from utils.prefetch import Prefetched, Prefetcher
+from utils.quarantine import QuarantineLane, quarantine_error_row
+from utils.schedule import order_lpt
+
+JOB_WORKERS = int(os.environ.get("LEITOR_XML_WORKERS", "32"))
+QUARANTINE_WORKERS = int(os.environ.get("LEITOR_XML_QUARANTINE_WORKERS", "2"))
+_FINALIZE = object()
+
+QUEUED, RUNNING, FINALIZING, DONE, CANCELING, CANCELED, FAILED = (
+    "na fila", "processando", "finalizando", "concluído", "cancelando", "cancelado", "erro",
+)
+FINAL_STATES = (DONE, CANCELED, FAILED)
+
+
+class ResultSink:
+    """
+    Destino das linhas de uma execução: acumulador em memória (RowStore) ou em
+    disco (SpillWriter), diário retomável (RunCheckpoint) e base local (DocStore).
+    `finish()` aplica normalização + cancelamento e devolve (df, erros, spill_result).
+    `text_index` (TextIndex) recebe as linhas em memória; os ids são os rótulos do df.
+    `aggregates` (Aggregates) soma o resumo linha a linha, em qualquer modo;
+    `events` (EventIndex) monta a linha do tempo de eventos por chave.
+    Em memória, `finish()` também liga CT-e e NF-e; os pares ficam em `links`.
+    `memory` (utils.memory.MemoryGuard): sob pressão de memória, o acumulador em
+    memória vira SpillWriter no meio da execução (e o índice de texto é descartado).
+    """
+
+    def __init__(self, ckpt=None, store=None, spill=None, text_index=None, aggregates=None, events=None,
+                 memory=None):
+        from utils.rows import RowStore
+
+        self.ckpt = ckpt
+        self.store = store
+        self.spill = spill
+        self.text_index = text_index if spill is None else None  # modo disco: sem índice
+        self.results = spill if spill is not None else RowStore(index=self.text_index)
+        self.erros: List[Dict[str, Any]] = []
+        self.aggregates = aggregates
+        self.events = events
+        self.memory = memory
+        self.links = None
+        if ckpt is not None and ckpt.completed:
+            self._replay(ckpt)
+
+    def _replay(self, ckpt) -> None:
+        """Retomada: uma única leitura dos blocos do diário repõe base, resumo e eventos."""
+        accs = [acc for acc in (self.aggregates, self.events) if acc is not None]
+        if self.store is None and not accs:
+            return
+
+        def saved():
+            for kind, data in ckpt.iter_saved():
+                if kind == "row":
+                    for acc in accs:
+                        acc.add((data,))
+                yield kind, data
+
+        if self.store is not None:
+            self.store.ingest_saved(saved())  # upsert idempotente
+        else:
+            for _ in saved():
+                pass
+
+    def record(self, name: str, rows: Optional[List[Dict[str, Any]]], errrow: Optional[Dict[str, Any]]) -> None:
+        if self.store is not None:
+            self.store.record(name, rows, errrow)
+        if rows is not None:
+            if self.aggregates is not None:
+                self.aggregates.add(rows)
+            if self.events is not None:
+                self.events.add(rows)
+        if self.ckpt is not None:
+            self.ckpt.record(name, rows, errrow)
+        elif rows is not None:
+            if self.spill is None and self.memory is not None and self.memory.pressure >= 2:
+                self._to_disk()
+            self.results.extend(rows)
+        else:
+            self.erros.append(errrow)
+
+    def finish(self):
+        from utils.linkage import link_cte_nfe
+        from utils.postprocess import apply_cancellations, normalize_frame
+        from utils.rows import RowStore
+
+        if self.store is not None:
+            self.store.close()
+        if self.ckpt is not None:
+            self.ckpt.finish()
+            self.results, self.erros = self.ckpt.load(
+                into=self.spill if self.spill is not None else RowStore(index=self.text_index))
+        if self.spill is not None:
+            # normalização + cancelamento parte a parte; só uma prévia fica em memória
+            res = self.spill.finalize(self.erros)
+            return res.preview, self.erros, res
+        if self.memory is not None and self.memory.pressure >= 1:
+            # o DataFrame final custa algumas vezes o RowStore: perto do limite, vai por partes
+            self._to_disk()
+            res = self.spill.finalize(self.erros)
+            return res.preview, self.erros, res
+        df = self.results.to_frame()
+        self.results = None
+        normalize_frame(df)
+        df = apply_cancellations(df, self.erros)
+        df, self.links = link_cte_nfe(df)
+        return df, self.erros, None
+
+    def _to_disk(self) -> None:
+        """Passa as linhas já acumuladas em memória para partes Parquet e segue em modo disco."""
+        from utils.spill import SpillWriter
+
+        budget = self.memory.budget // 4 if self.memory.budget else 256 * 1024 * 1024
+        spill = SpillWriter(budget)
+        spill.extend(self.results.iter_dicts())
+        self.results = self.spill = spill
+        self.text_index = None
+        self.memory.spills += 1
+
+    def abort(self) -> None:
+        """Cancelamento: grava o que já foi feito no diário (retomável) e descarta o resto."""
+        if self.store is not None:
+            self.store.close()
+        if self.ckpt is not None:
+            self.ckpt.flush()
+        if self.spill is not None:
+            self.spill.cleanup()
+        self.results = None
+
+
+class Job:
+    def __init__(self, manager: "JobManager", session: str, label: str, tipo_ui: str,
+                 paths: List[Any], uploads: List[Tuple[str, bytes]], sink: ResultSink,
+                 max_inflight: int = 64, tuner=None, io_workers: int = 8,
+                 read_ahead_bytes: int = 256 * 1024 * 1024,
+                 max_file_bytes: Optional[int] = None, timeout_s: Optional[float] = None,
+                 blobs=None, validator=None, memory=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.session = session
+        self.label = label
+        self.tipo_ui = tipo_ui
+        self.sink = sink
+        self.tuner = tuner
+        self.total = len(paths) + len(uploads)
+        self.done = 0
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.result: Any = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+        self._manager = manager
+        self._window: Callable[[], int] = (lambda: tuner.limit) if tuner else (lambda: max_inflight)
+        if memory is not None:
+            self._window = memory.window(self._window)
+        self._parse_path = tuner.wrap(parse_path) if tuner else parse_path
+        self._parse_buffer = tuner.wrap(parse_buffer_bytes) if tuner else parse_buffer_bytes
+        self.max_file_bytes = max_file_bytes
+        self.timeout_s = timeout_s
+        self.blobs = blobs
+        self.validator = validator
+        self.memory = memory
+        self._read_ahead_bytes = read_ahead_bytes
+        # maiores primeiro (ver utils/schedule.py); aqui sem lotes: o rodízio entre sessões é por arquivo
+        self._prefetcher = Prefetcher(order_lpt(paths), readers=io_workers, max_bytes=read_ahead_bytes,
+                                      max_file_bytes=max_file_bytes)
+        self._uploads = sorted(uploads, key=lambda u: len(u[1]), reverse=True)
+        self._ready: Deque[Prefetched] = deque()
+        self._fed = False
+        self._inflight = 0
+        self._running: Dict[int, Tuple[float, Prefetched]] = {}  # id(item) -> (início, item)
+        self._futures: Dict[int, Any] = {}  # id(item) -> future no pool do JobManager
+        self._lane = 0  # arquivos na quarentena ainda sem resultado
+        self._canceled = False
+        self._record_lock = threading.Lock()
+
+    @property
+    def progress(self) -> float:
+        return self.done / self.total if self.total else 1.0
+
+    def stats(self) -> Dict[str, Any]:
+        out = self.tuner.summary() if self.tuner else {"modo": "manual", "threads": self._window()}
+        if self.validator is not None:
+            out.update(self.validator.summary())
+        if self.memory is not None:
+            out.update(self.memory.summary())
+        return out
+
+    @property
+    def _too_big(self) -> str:
+        return f"arquivo acima do limite de {(self.max_file_bytes or 0) / (1024 * 1024):g} MB"
+
+    # executado numa thread própria: alimenta a fila de itens já lidos
+    def _feed(self) -> None:
+        cond = self._manager._cond
+        try:
+            for item in self._prefetcher:
+                if self.blobs is not None and item.raw is not None and not self._canceled:
+                    self.blobs.put(item.name, item.raw)  # fora do lock do despachante
+                with cond:
+                    if self._canceled:
+                        self._prefetcher.release(item)
+                        break
+                    if item.oversize:
+                        self._manager._quarantine(self, item.name, None, self._too_big)
+                        continue
+                    self._ready.append(item)
+                    cond.notify_all()
+            for name, raw in self._uploads:
+                with cond:
+                    if self._canceled:
+                        break
+                    if self.max_file_bytes and len(raw) > self.max_file_bytes:
+                        self._manager._quarantine(self, name, raw, self._too_big)
+                        continue
+                    self._ready.append(Prefetched(name, raw, 0))
+                    cond.notify_all()
+        finally:
+            self._uploads = []
+            with cond:
+                self._fed = True
+                cond.notify_all()
+
+    def _parse(self, item: Prefetched):
+        try:
+            if item.error is not None:
+                rows = self._parse_path(Path(item.name), self.tipo_ui, self.validator)
+            else:
+                rows = self._parse_buffer(item.raw, item.name, self.tipo_ui, self.validator)
+            out = (item.name, rows, None)
+        except Exception as e:
+            out = (item.name, None, error_row(item.name, self.tipo_ui, e, item.raw))
+        finally:
+            self._prefetcher.release(item)
+            item.raw = None
+        return out
+
+    def _record(self, out, tuned: bool = True) -> None:
+        if self.memory is not None:
+            self._prefetcher.budget.max_bytes = self.memory.scale(self._read_ahead_bytes)
+        with self._record_lock:
+            if not self._canceled:
+                self.sink.record(*out)
+            self.done += 1
+            if self.tuner and tuned:
+                self.tuner.task_done()
+
+    def _finalize(self) -> None:
+        try:
+            if self.memory is not None:
+                with self.memory.stage("consolidação"):
+                    self.result = self.sink.finish()
+            else:
+                self.result = self.sink.finish()
+            self.state = DONE
+        except Exception as e:
+            self.error = str(e)
+            self.state = FAILED
+        finally:
+            self.sink = None
+            self.finished = time.time()
+
+
+class JobManager:
+    def __init__(self, workers: int = JOB_WORKERS, quarantine_workers: int = QUARANTINE_WORKERS):
+        self.workers = max(1, workers)
+        self.quarantine_workers = quarantine_workers
+        self._lane: Optional[QuarantineLane] = None
+        # thread presa em parse abandonado conta como ocupada; com muitas presas o pool é trocado
+        self._pool = AbandonablePool(self.workers, thread_name_prefix="leitor-job")
+        self._cond = threading.Condition()
+        self._jobs: Dict[str, Job] = {}
+        self._sessions: Dict[str, Deque[Job]] = {}  # fila FIFO por sessão
+        self._rr: Deque[str] = deque()              # rodízio entre sessões
+        self._inflight = 0
+        threading.Thread(target=self._dispatch_loop, name="leitor-job-dispatch", daemon=True).start()
+
+    # ---------------------------
+    # API usada pelo app
+    # ---------------------------
+    def submit(self, session: str, label: str, tipo_ui: str, paths: Iterable[Any],
+               uploads: Iterable[Tuple[str, bytes]] = (), sink: Optional[ResultSink] = None,
+               **job_kwargs) -> Job:
+        job = Job(self, session, label, tipo_ui, list(paths), list(uploads), sink or ResultSink(), **job_kwargs)
+        with self._cond:
+            self._jobs[job.id] = job
+            if session not in self._sessions:
+                self._sessions[session] = deque()
+                self._rr.append(session)
+            self._sessions[session].append(job)
+            self._cond.notify_all()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self, session: Optional[str] = None) -> List[Job]:
+        with self._cond:
+            return [j for j in self._jobs.values() if session is None or j.session == session]
+
+    def active(self) -> int:
+        """Jobs na fila ou em andamento (todas as sessões)."""
+        with self._cond:
+            return sum(len(q) for q in self._sessions.values())
+
+    def cancel(self, job_id: str) -> None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINAL_STATES or job.state == FINALIZING:
+                return
+            job._canceled = True
+            job.state = CANCELING
+            job._prefetcher.close()
+            self._cond.notify_all()
+
+    def forget(self, job_id: str) -> None:
+        """Descarta um job terminado (o resultado já foi entregue à sessão)."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state in FINAL_STATES:
+                del self._jobs[job_id]
+
+    # ---------------------------
+    # despachante
+    # ---------------------------
+    def _start(self, job: Job) -> None:
+        job.state = RUNNING
+        job.started = time.time()
+        threading.Thread(target=job._feed, name=f"leitor-job-feed-{job.id}", daemon=True).start()
+
+    def _retire(self, job: Job) -> None:
+        if job.memory is not None:
+            job.memory.close()
+        q = self._sessions[job.session]
+        q.remove(job)
+        if not q:
+            del self._sessions[job.session]
+            self._rr.remove(job.session)
+
+    def _next_task(self) -> Optional[Tuple[Job, Any]]:
+        """Próxima tarefa em rodízio entre sessões; o job ativo de cada sessão é o mais antigo."""
+        for _ in range(len(self._rr)):
+            session = self._rr[0]
+            self._rr.rotate(-1)
+            job = self._sessions[session][0]
+            if job.state == QUEUED:
+                self._start(job)
+            if job._canceled:
+                while job._ready:
+                    job._prefetcher.release(job._ready.popleft())
+                if job._fed and job._inflight == 0 and job._lane == 0:
+                    job.sink.abort()
+                    job.sink = None
+                    job.state = FAILED if job.error else CANCELED
+                    job.finished = time.time()
+                    self._retire(job)
+                    return self._next_task() if self._rr else None
+                continue
+            if job._ready and job._inflight < job._window():
+                return job, job._ready.popleft()
+            if job._fed and not job._ready and job._inflight == 0 and job._lane == 0 and job.state == RUNNING:
+                job.state = FINALIZING
+                return job, _FINALIZE
+        return None
+
+    # ---------------------------
+    # quarentena
+    # ---------------------------
+    def _quarantine(self, job: Job, name: str, raw: Optional[bytes], reason: str) -> None:
+        """Manda um arquivo para a faixa isolada (chamado com self._cond adquirido)."""
+        if self._lane is None:
+            timeout = max(60.0, (job.timeout_s or 0) * 4)
+            self._lane = QuarantineLane(workers=self.quarantine_workers, timeout_s=timeout)
+        send = None if raw is None or Path(name).is_file() else raw
+        job._lane += 1
+        fut = self._lane.submit(name, send, job.tipo_ui, reason)
+        fut.add_done_callback(lambda f: self._quarantine_done(job, name, reason, f))
+
+    def _quarantine_done(self, job: Job, name: str, reason: str, fut) -> None:
+        try:
+            out = (name, fut.result(), None)
+        except Exception as e:
+            out = (name, None, quarantine_error_row(name, job.tipo_ui, e, reason))
+        try:
+            job._record(out, tuned=False)
+        except Exception as e:
+            job.error = str(e)
+            self.cancel(job.id)
+        finally:
+            with self._cond:
+                job._lane -= 1
+                self._cond.notify_all()
+
+    def _check_deadlines(self) -> None:
+        """Tarefas que passaram do prazo saem da vaga e vão para a quarentena."""
+        now = time.monotonic()
+        for q in self._sessions.values():
+            job = q[0]
+            if not job.timeout_s:
+                continue
+            for key, (t0, item) in list(job._running.items()):
+                if now - t0 < job.timeout_s:
+                    continue
+                fut = job._futures.get(key)
+                if fut is None:
+                    continue  # o despachante ainda não registrou o future: fica para a próxima volta
+                # a thread segue presa até o lxml terminar (resultado descartado): a vaga passa de
+                # _inflight para as presas do pool, que o despachante também desconta
+                del job._running[key]
+                job._inflight -= 1
+                self._inflight -= 1
+                self._pool.abandon(fut)
+                job._prefetcher.release(item)
+                if not job._canceled:
+                    self._quarantine(job, item.name, item.raw,
+                                     f"prazo de {job.timeout_s:g}s excedido no lote principal")
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                task = None
+                while task is None:
+                    self._check_deadlines()
+                    if self._inflight + self._pool.stuck < self.workers and self._rr:
+                        task = self._next_task()
+                    if task is None:
+                        self._cond.wait(0.5)
+                job, item = task
+                self._inflight += 1
+                job._inflight += 1
+            fut = self._pool.submit(self._run_task, job, item)
+            if item is not _FINALIZE:
+                key = id(item)
+                with self._cond:
+                    job._futures[key] = fut
+                fut.add_done_callback(lambda f, k=key, j=job: j._futures.pop(k, None))
+
+    def _run_task(self, job: Job, item: Any) -> None:
+        mine = True
+        try:
+            if item is _FINALIZE:
+                job._finalize()
+                return
+            with self._cond:
+                job._running[id(item)] = (time.monotonic(), item)
+            out = job._parse(item)
+            with self._cond:
+                # fora do dicionário = passou do prazo e já foi para a quarentena
+                mine = job._running.pop(id(item), None) is not None
+            if mine:
+                job._record(out)
+        except Exception as e:
+            # falha no destino (disco cheio, base travada...): interrompe o job
+            job.error = str(e)
+            self.cancel(job.id)
+        finally:
+            with self._cond:
+                if mine:
+                    self._inflight -= 1
+                    job._inflight -= 1
+                if item is _FINALIZE:
+                    self._retire(job)
+                self._cond.notify_all()
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> JobManager:
+    """JobManager do processo (criado no primeiro uso, compartilhado por todas as sessões)."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
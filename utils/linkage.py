@@ -0,0 +1,126 @@
+# utils/linkage.py
+"""
+Vínculo CT-e ↔ NF-e: frete de cada nota e CT-e com notas faltando no lote.
+
+O CT-e traz as chaves das NF-e transportadas (coluna `chaves_NFe`, "; "). A
+tabela lateral tem uma linha por par (CT-e, NF-e) e a junção com as notas é
+por hash da chave (merge/map do pandas), então o custo é linear no número de
+documentos + vínculos.
+
+Rateio do frete por nota, uma regra por CT-e: proporcional ao vNF quando o
+CT-e informa vCarga e todas as notas citadas estão no lote; senão, vTPrest
+dividido igualmente. As partes são reescaladas e arredondadas para somar
+exatamente vTPrest (os centavos da sobra vão para a última nota do CT-e).
+"""
+from typing import Tuple
+
+import pandas as pd
+
+from utils.chave import normalize_keys
+from utils.postprocess import NF_PARSERS
+
+CTE_PARSER = "CT-e"
+LINK_COLS = ["cte_chave", "nCT", "cte_emit_CNPJ", "vTPrest", "vCarga", "nfe_chave"]
+
+
+def cte_links(df: pd.DataFrame) -> pd.DataFrame:
+    """Tabela lateral: uma linha por NF-e citada em cada CT-e."""
+    if df.empty or "chaves_NFe" not in df.columns or "_parser" not in df.columns:
+        return pd.DataFrame(columns=LINK_COLS)
+    cte = df[df["_parser"].eq(CTE_PARSER) & df["chaves_NFe"].notna()]
+    if cte.empty:
+        return pd.DataFrame(columns=LINK_COLS)
+    links = pd.DataFrame({
+        "cte_chave": cte["chave"].astype(object),
+        "nCT": cte["nCT"].astype(object) if "nCT" in cte.columns else None,
+        "cte_emit_CNPJ": cte["emit_CNPJ"].astype(object),
+        "vTPrest": pd.to_numeric(cte.get("vTPrest"), errors="coerce"),
+        "vCarga": pd.to_numeric(cte.get("vCarga"), errors="coerce"),
+        "nfe_chave": cte["chaves_NFe"].astype(str).str.split("; "),
+    })
+    links = links.explode("nfe_chave", ignore_index=True)
+    links["nfe_chave"] = normalize_keys(links["nfe_chave"])
+    return links.dropna(subset=["nfe_chave"]).reset_index(drop=True)
+
+
+def _rateio(links: pd.DataFrame) -> pd.Series:
+    """Frete de cada vínculo; a soma por CT-e é vTPrest arredondado a centavos."""
+    g = links.groupby("cte_chave", sort=False)
+    todas_no_lote = g["vNF"].transform("count").eq(g["nfe_chave"].transform("size"))
+    soma_vnf = g["vNF"].transform("sum")
+    usa_prop = todas_no_lote & links["vCarga"].gt(0) & soma_vnf.gt(0)
+    peso = (links["vNF"] / soma_vnf).where(usa_prop, 1 / g["nfe_chave"].transform("size"))
+    total = links["vTPrest"].round(2)
+    frete = (total * peso).round(2)
+    # sobra do arredondamento na última nota de cada CT-e
+    sobra = total - frete.groupby(links["cte_chave"], sort=False).transform("sum")
+    ultima = ~links["cte_chave"].duplicated(keep="last")
+    return frete.where(~ultima, frete + sobra).round(2)
+
+
+def check_rateio(links: pd.DataFrame) -> None:
+    """Garante que o frete rateado de cada CT-e soma vTPrest (ValueError com os CT-e divergentes)."""
+    soma = links.groupby("cte_chave")["frete_rateado"].sum(min_count=1)
+    total = links.groupby("cte_chave")["vTPrest"].first().round(2)
+    diverge = ((soma - total).abs() > 0.005) | (soma.isna() != total.isna())
+    if diverge.any():
+        raise ValueError(f"Rateio de frete não fecha com vTPrest nos CT-e: {', '.join(diverge[diverge].index[:5])}")
+
+
+def _join_unique(links: pd.DataFrame, col: str) -> pd.Series:
+    """Valores distintos de `col` por nota, na ordem dos vínculos, unidos por "; "."""
+    pares = links[["nfe_chave", col]].dropna().drop_duplicates()
+    pares = pares.assign(**{col: pares[col].astype(str)})
+    repetida = pares["nfe_chave"].duplicated(keep=False)
+    # a maioria das notas está em um só CT-e: só as repetidas passam pelo join
+    unicas = pares.loc[~repetida].set_index("nfe_chave")[col]
+    varias = pares.loc[repetida].groupby("nfe_chave", sort=False)[col].agg("; ".join)
+    return pd.concat([unicas, varias])
+
+
+def link_cte_nfe(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Anexa às NF-e/NFC-e: cte_nCT, cte_chave e frete_rateado; aos CT-e:
+    notas_vinculadas e notas_ausentes (chaves citadas que não estão na tabela;
+    roda depois do cancelamento, então nota cancelada conta como ausente).
+    Retorna (df, vínculos com `vNF`, `frete_rateado` e `nota_no_lote`). Sem CT-e, df fica igual.
+    """
+    links = cte_links(df)
+    if links.empty:
+        return df, links
+
+    nf_mask = df["_parser"].isin(NF_PARSERS)
+    nf_keys = normalize_keys(df.loc[nf_mask, "chave"])
+    vnf = pd.to_numeric(df.loc[nf_mask, "vNF"], errors="coerce")
+    vnf_by_key = pd.Series(vnf.to_numpy(), index=nf_keys.to_numpy())
+    vnf_by_key = vnf_by_key[~vnf_by_key.index.duplicated()]
+
+    links["nota_no_lote"] = links["nfe_chave"].isin(vnf_by_key.index)
+    links["vNF"] = links["nfe_chave"].map(vnf_by_key)
+    links["frete_rateado"] = _rateio(links)
+    check_rateio(links)
+
+    # NF-e <- CT-e (uma nota pode estar em mais de um CT-e)
+    achados = links[links["nota_no_lote"]]
+    por_nota = pd.DataFrame({
+        "cte_nCT": _join_unique(achados, "nCT"),
+        "cte_chave": _join_unique(achados, "cte_chave"),
+        "frete_rateado": achados.groupby("nfe_chave")["frete_rateado"].sum(),
+    })
+    for col in por_nota.columns:
+        if col not in df.columns:
+            df[col] = pd.NA
+        elif isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+        df.loc[nf_mask, col] = nf_keys.map(por_nota[col]).to_numpy()
+
+    # CT-e -> quantas notas citadas não vieram no lote
+    por_cte = links.assign(ausente=~links["nota_no_lote"]).groupby("cte_chave").agg(
+        notas_vinculadas=("nfe_chave", "size"),
+        notas_ausentes=("ausente", "sum"),
+    )
+    cte_mask = df["_parser"].eq(CTE_PARSER)
+    cte_keys = df.loc[cte_mask, "chave"].astype(object)
+    for col in por_cte.columns:
+        df.loc[cte_mask, col] = cte_keys.map(por_cte[col]).fillna(0).astype(int).to_numpy()
+    return df, links
@@ -0,0 +1,154 @@
+# utils/memory.py
+"""
+Guarda de memória da execução: amostra o RSS do processo, guarda o pico por
+etapa (parse, consolidação, exportação) e aplica contrapressão quando há limite.
+
+Com limite, acima de SOFT (80%) a janela de parse, o read-ahead e o tamanho
+dos lotes caem pela metade; acima de HARD (95%) vão ao mínimo (uma tarefa, um
+arquivo lido à frente). O ResultSink em memória consulta `pressure` e, sob
+pressão, passa a despejar as linhas em partes Parquet (modo disco), antes que
+o DataFrame final estoure o contêiner.
+
+RSS vem de /proc/self/statm (Linux); sem ele, psutil se instalado, senão o
+pico de getrusage. `trace=True` liga o tracemalloc e registra também o pico de
+alocações Python por etapa (custa CPU: só para diagnóstico).
+"""
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+SOFT = 0.80
+HARD = 0.95
+MB = 1024 * 1024
+
+try:
+    _PAGE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE = 4096
+
+
+def rss_bytes() -> int:
+    """RSS atual do processo (0 se a plataforma não informa)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return 0
+
+
+class MemoryGuard:
+    def __init__(self, budget_bytes: Optional[int] = None, interval_s: float = 0.2, trace: bool = False):
+        self.budget = budget_bytes or None
+        self.interval_s = interval_s
+        self.trace = trace
+        self.rss = rss_bytes()
+        self.pressure = 0  # 0 ok, 1 acima de SOFT, 2 acima de HARD
+        self.current = "parse"
+        self.peaks: Dict[str, int] = {}
+        self.traced: Dict[str, int] = {}
+        self.pressure_events = 0
+        self.spills = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._own_trace = False
+        self._sample()
+        threading.Thread(target=self._loop, name="leitor-memory", daemon=True).start()
+
+    def _sample(self) -> None:
+        rss = rss_bytes()
+        with self._lock:
+            self.rss = rss
+            if rss > self.peaks.get(self.current, 0):
+                self.peaks[self.current] = rss
+            if self.budget:
+                level = 2 if rss >= HARD * self.budget else 1 if rss >= SOFT * self.budget else 0
+                if level > self.pressure:
+                    self.pressure_events += 1
+                self.pressure = level
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._own_trace:
+            tracemalloc.stop()
+            self._own_trace = False
+
+    # ---------------------------
+    # contrapressão
+    # ---------------------------
+    def scale(self, n: int, minimum: int = 1) -> int:
+        """`n` reduzido conforme a pressão (metade acima de SOFT, mínimo acima de HARD)."""
+        if self.pressure == 0:
+            return n
+        if self.pressure == 1:
+            return max(minimum, n // 2)
+        return min(n, minimum)
+
+    def window(self, fn: Callable[[], int]) -> Callable[[], int]:
+        return lambda: self.scale(fn())
+
+    # ---------------------------
+    # etapas
+    # ---------------------------
+    @contextmanager
+    def stage(self, name: str):
+        """Atribui o pico de RSS (e do tracemalloc, com trace) do bloco à etapa `name`."""
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_trace = True
+        if self.trace:
+            tracemalloc.reset_peak()
+        with self._lock:
+            prev, self.current = self.current, name
+        self._sample()
+        try:
+            yield self
+        finally:
+            self._sample()
+            if self.trace and tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+                self.traced[name] = max(self.traced.get(name, 0), peak)
+            with self._lock:
+                self.current = prev
+
+    def summary(self) -> Dict[str, Any]:
+        self._sample()
+        with self._lock:
+            out: Dict[str, Any] = {
+                "memoria_pico_mb": {k: round(v / MB, 1) for k, v in self.peaks.items()},
+                "memoria_limite_mb": round(self.budget / MB) if self.budget else None,
+                "memoria_contrapressao": self.pressure_events,
+                "memoria_despejos": self.spills,
+            }
+            if self.traced:
+                out["memoria_tracemalloc_mb"] = {k: round(v / MB, 1) for k, v in self.traced.items()}
+            return out
+
+
+def format_peaks(summary: Dict[str, Any]) -> str:
+    """'parse 120 MB • consolidação 340 MB' a partir de MemoryGuard.summary()."""
+    parts = [f"{k} {v:g} MB" for k, v in summary.get("memoria_pico_mb", {}).items()]
+    if summary.get("memoria_limite_mb"):
+        parts.append(f"limite {summary['memoria_limite_mb']} MB: contrapressão {summary['memoria_contrapressao']}x, "
+                     f"despejos em disco {summary['memoria_despejos']}")
+    traced = summary.get("memoria_tracemalloc_mb")
+    if traced:
+        parts.append("tracemalloc: " + ", ".join(f"{k} {v:g} MB" for k, v in traced.items()))
+    return " • ".join(parts)
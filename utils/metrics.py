@@ -0,0 +1,231 @@
+# utils/metrics.py
+"""
+Métricas do pipeline de parse no formato OpenMetrics (texto), para execuções
+sem tela: run, shard-run e watch.
+
+O pipeline (iter_parse) atualiza contadores e o histograma uma vez por lote,
+na thread que consome os resultados: o custo por arquivo é somar números num
+dict, sob um único lock. Os gauges (fila, pool, threads) são funções lidas só
+na hora da coleta.
+
+Exposição: MetricsServer (http.server em localhost, GET /metrics) ou
+MetricsFile (arquivo reescrito a cada N segundos, para o textfile collector do
+node_exporter). A ocupação dos workers sai de
+rate(leitor_parse_ocupado_segundos_total) / leitor_threads_parse.
+"""
+import atexit
+import bisect
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PARSE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# tipo da inspeção mínima (error_row) -> nome do parser, para o rótulo dos erros
+_SNIFF_PARSER = {"CTe": "CT-e", "NFSe": "NFS-e (ABRASF)"}
+
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def _add(self, labels: Tuple = (), n: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self) -> List[str]:
+        out = [f"# TYPE {self.name} counter", f"# HELP {self.name} {self.help}"]
+        values = self._values or ({(): 0} if not self.labelnames else {})
+        for labels, v in sorted(values.items()):
+            out.append(f"{self.name}_total{_labels(self.labelnames, labels)} {_num(v)}")
+        return out
+
+
+class Gauge:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.fn: Optional[Callable[[], float]] = None
+
+    def render(self) -> List[str]:
+        try:
+            v = float(self.fn()) if self.fn is not None else 0.0
+        except Exception:
+            v = 0.0
+        return [f"# TYPE {self.name} gauge", f"# HELP {self.name} {self.help}", f"{self.name} {_num(v)}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name, self.help = name, help
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def _observe(self, v: float) -> None:
+        self._counts[bisect.bisect_left(self.buckets, v)] += 1
+        self._sum += v
+
+    def render(self) -> List[str]:
+        out = [f"# TYPE {self.name} histogram", f"# HELP {self.name} {self.help}"]
+        acc = 0
+        for le, n in zip(self.buckets + (math.inf,), self._counts):
+            acc += n
+            out.append(f'{self.name}_bucket{{le="{_num(le)}"}} {acc}')
+        out.append(f"{self.name}_sum {_num(self._sum)}")
+        out.append(f"{self.name}_count {acc}")
+        return out
+
+
+class Metrics:
+    """Registro das métricas do pipeline (um por processo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.arquivos = Counter("leitor_arquivos", "Arquivos processados, por parser e resultado.", ("parser", "resultado"))
+        self.linhas = Counter("leitor_linhas", "Linhas (notas, eventos) extraídas, por parser.", ("parser",))
+        self.bytes = Counter("leitor_bytes", "Bytes de XML parseados.")
+        self.quarentena = Counter("leitor_quarentena", "Arquivos enviados à quarentena.")
+        self.ocupado = Counter("leitor_parse_ocupado_segundos", "Tempo somado das threads em parse.")
+        self.parse = Histogram("leitor_parse_segundos", "Tempo de parse por arquivo.", PARSE_BUCKETS)
+        self.fila_bytes = Gauge("leitor_fila_bytes", "Bytes lidos à espera do parse (read-ahead).")
+        self.fila_arquivos = Gauge("leitor_fila_arquivos", "Arquivos lidos à espera do parse.")
+        self.no_pool = Gauge("leitor_arquivos_no_pool", "Arquivos submetidos ao pool de parse, sem resultado ainda.")
+        self.threads = Gauge("leitor_threads_parse", "Limite atual de tarefas de parse simultâneas.")
+        self.inicio = time.time()
+        self._all = [self.arquivos, self.linhas, self.bytes, self.quarentena, self.ocupado, self.parse,
+                     self.fila_bytes, self.fila_arquivos, self.no_pool, self.threads]
+
+    # ---------------------------
+    # chamado pelo pipeline
+    # ---------------------------
+    def observe_parse(self, durations: Iterable[float]) -> None:
+        """Tempos de parse de um lote (chamado pela thread do pool, uma vez por lote)."""
+        with self._lock:
+            for d in durations:
+                self.parse._observe(d)
+                self.ocupado._add((), d)
+
+    def files_done(self, outs: Iterable[Tuple[str, Any, Any]], nbytes: int = 0) -> None:
+        with self._lock:
+            self.bytes._add((), nbytes)
+            for _name, rows, errrow in outs:
+                if rows:
+                    parser = rows[0].get("_parser") or "desconhecido"
+                    self.arquivos._add((parser, "ok"))
+                    self.linhas._add((parser,), len(rows))
+                else:
+                    self.arquivos._add((error_parser(errrow), "erro"))
+
+    def quarantined(self, n: int = 1) -> None:
+        with self._lock:
+            self.quarentena._add((), n)
+
+    def attach(self, fila_bytes: Optional[Callable[[], float]], fila_arquivos: Optional[Callable[[], float]],
+               no_pool: Optional[Callable[[], float]], threads: Optional[Callable[[], float]]) -> None:
+        """Gauges lidos do iter_parse em andamento (None: fora de execução, valem 0)."""
+        self.fila_bytes.fn, self.fila_arquivos.fn, self.no_pool.fn, self.threads.fn = (
+            fila_bytes, fila_arquivos, no_pool, threads)
+
+    def detach(self) -> None:
+        self.attach(None, None, None, None)
+
+    # ---------------------------
+    # exposição
+    # ---------------------------
+    def render(self) -> str:
+        with self._lock:
+            lines = [line for m in self._all for line in m.render()]
+        lines += ["# TYPE leitor_inicio_segundos gauge", "# HELP leitor_inicio_segundos Início do processo (epoch).",
+                  f"leitor_inicio_segundos {_num(round(self.inicio, 3))}", "# EOF"]
+        return "\n".join(lines) + "\n"
+
+
+def error_parser(errrow: Optional[Dict[str, Any]]) -> str:
+    """Parser provável de um arquivo com erro, pela inspeção mínima."""
+    if not errrow:
+        return "desconhecido"
+    tipo = errrow.get("_sniff_tipo")
+    if tipo == "NFe/NFCe":
+        return "NFC-e" if str(errrow.get("modelo") or "") == "65" else "NF-e"
+    return _SNIFF_PARSER.get(tipo, "desconhecido")
+
+
+class MetricsServer:
+    """GET /metrics em http://host:porta (só localhost por padrão)."""
+
+    def __init__(self, metrics: Metrics, port: int, host: str = "127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/metrics"
+        threading.Thread(target=self.httpd.serve_forever, name="leitor-metrics", daemon=True).start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MetricsFile:
+    """Reescreve `path` a cada `interval_s` (troca atômica) e uma última vez no fim do processo."""
+
+    def __init__(self, metrics: Metrics, path: str, interval_s: float = 10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval_s = max(0.5, interval_s)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="leitor-metrics-file", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self) -> None:
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.metrics.render())
+        os.replace(tmp, self.path)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.write()
+            except OSError:
+                pass  # pasta indisponível: tenta de novo na próxima volta
+
+    def close(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self.write()
@@ -0,0 +1,341 @@
+# utils/pipeline.py
+"""
+Estágio de parse (só lxml + parsers): detecção do tipo, leitura de arquivo/bytes
+e inspeção mínima de XML com erro. Usado pelo app e por workers/CLI.
+"""
+import io
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from lxml import etree
+
+from parsers import ALL_PARSERS, get_parser_by_name, parse_all
+from utils.executor import AbandonablePool, iter_windowed
+from utils.prefetch import Prefetched, Prefetcher
+from utils.schedule import BATCH_BYTES, batch_small, order_lpt
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+CTE_NS = "http://www.portalfiscal.inf.br/cte"
+ABRASF_NS = "http://www.abrasf.org.br/ABRASF/arquivos/nfse.xsd"
+
+def detect_parser(root: etree._Element):
+    for p in ALL_PARSERS:
+        try:
+            if p.matches(root):
+                return p
+        except Exception:
+            pass
+    return None
+
+def parse_with_selected_or_auto(root: etree._Element, nome_arquivo_hint: str, tipo_ui: str) -> List[Dict[str, Any]]:
+    """
+    Tenta usar o parser selecionado. Se não casar, faz fallback para detecção automática.
+    Assim, mesmo que o usuário escolha 'NF-e' e o arquivo seja 'Evento', o arquivo é lido.
+    Retorna uma linha por nota (ListaNfse ABRASF pode trazer várias).
+    """
+    parser_local = None
+    if tipo_ui != "Auto (detectar)":
+        sel = get_parser_by_name(tipo_ui)
+        try:
+            if sel.matches(root):
+                parser_local = sel
+            else:
+                parser_local = detect_parser(root)
+        except Exception:
+            parser_local = detect_parser(root)
+    else:
+        parser_local = detect_parser(root)
+
+    if not parser_local:
+        raise ValueError("Nenhum parser reconheceu este XML.")
+
+    rows = parse_all(parser_local, root)
+    if not rows:
+        raise ValueError(f"{parser_local.name}: nenhuma nota encontrada no XML.")
+    for data in rows:
+        data["_arquivo"] = nome_arquivo_hint
+        data["_parser"] = parser_local.name
+    return rows
+
+def parse_path(p: Path, tipo_ui: str, validator=None) -> List[Dict[str, Any]]:
+    with open(p, "rb") as f:
+        tree = etree.parse(f)
+    if validator is not None:
+        validator.validate(tree)
+    root = tree.getroot()
+    return parse_with_selected_or_auto(root, str(p), tipo_ui)
+
+def parse_buffer_bytes(raw: bytes, name: str, tipo_ui: str, validator=None) -> List[Dict[str, Any]]:
+    """`validator` (utils.xsd.XsdValidator, opcional) valida a árvore antes do parser."""
+    tree = etree.parse(io.BytesIO(raw))
+    if validator is not None:
+        validator.validate(tree)
+    root = tree.getroot()
+    return parse_with_selected_or_auto(root, name, tipo_ui)
+
+def text_or_none(node: Optional[etree._Element], tag: str, ns: str) -> Optional[str]:
+    if node is None:
+        return None
+    el = node.find(f"{{{ns}}}{tag}")
+    if el is not None and el.text:
+        return el.text.strip()
+    return None
+
+def sniff_minimal_from_bytes(raw: bytes) -> Dict[str, Any]:
+    info: Dict[str, Any] = {}
+    try:
+        root = etree.fromstring(raw)
+    except Exception as e:
+        return {"_sniff_ok": False, "_sniff_erro": f"XML inválido: {e}"}
+
+    try:
+        nfe = root.find(f".//{{{NFE_NS}}}NFe")
+        if nfe is None:
+            nfe = root
+        infNFe = nfe.find(f".//{{{NFE_NS}}}infNFe")
+        if infNFe is not None:
+            ide = infNFe.find(f".//{{{NFE_NS}}}ide")
+            info["chave"] = (infNFe.get("Id") or "").replace("NFe", "") or None
+            info["modelo"] = text_or_none(ide, "mod", NFE_NS)
+            info["tpAmb"] = text_or_none(ide, "tpAmb", NFE_NS)
+            info["nNF"] = text_or_none(ide, "nNF", NFE_NS)
+            info["emissao"] = text_or_none(ide, "dhEmi", NFE_NS) or text_or_none(ide, "dEmi", NFE_NS)
+            info["_sniff_tipo"] = "NFe/NFCe"
+            info["_sniff_ok"] = True
+            return info
+    except Exception:
+        pass
+
+    try:
+        cte = root.find(f".//{{{CTE_NS}}}CTe")
+        if cte is None:
+            cte = root
+        infCte = cte.find(f".//{{{CTE_NS}}}infCte")
+        if infCte is not None:
+            ide = infCte.find(f".//{{{CTE_NS}}}ide")
+            info["chave"] = (infCte.get("Id") or "").replace("CTe", "") or None
+            info["modelo"] = text_or_none(ide, "mod", CTE_NS)
+            info["tpAmb"] = text_or_none(ide, "tpAmb", CTE_NS)
+            info["nCT"] = text_or_none(ide, "nCT", CTE_NS)
+            info["emissao"] = text_or_none(ide, "dhEmi", CTE_NS)
+            info["_sniff_tipo"] = "CTe"
+            info["_sniff_ok"] = True
+            return info
+    except Exception:
+        pass
+
+    try:
+        inf = root.find(f".//{{{ABRASF_NS}}}InfNfse")
+        if inf is not None:
+            info["numero"] = text_or_none(inf, "Numero", ABRASF_NS)
+            info["emissao"] = text_or_none(inf, "DataEmissao", ABRASF_NS)
+            info["competencia"] = text_or_none(inf, "Competencia", ABRASF_NS)
+            info["_sniff_tipo"] = "NFSe"
+            info["_sniff_ok"] = True
+            return info
+    except Exception:
+        pass
+
+    return {"_sniff_ok": False}
+
+def parse_batch(items: List[Prefetched], tipo_ui: str, validator=None, metrics=None) -> List[Tuple[str, Optional[List[Dict[str, Any]]], Optional[Dict[str, Any]]]]:
+    """
+    Parse de um lote de itens já lidos; cada arquivo vira (nome, linhas, None) ou (nome, None, erro).
+    Com `metrics` (utils.metrics.Metrics), o tempo de cada arquivo vai para o histograma.
+    """
+    out = []
+    durations = [] if metrics is not None else None
+    for item in items:
+        t0 = time.perf_counter() if durations is not None else 0.0
+        try:
+            if item.error is not None:
+                # falha de leitura: tenta de novo pelo caminho direto (registra o erro se persistir)
+                rows = parse_path(Path(item.name), tipo_ui, validator)
+            else:
+                rows = parse_buffer_bytes(item.raw, item.name, tipo_ui, validator)
+            out.append((item.name, rows, None))
+        except Exception as e:
+            out.append((item.name, None, error_row(item.name, tipo_ui, e, item.raw)))
+        if durations is not None:
+            durations.append(time.perf_counter() - t0)
+    if durations:
+        metrics.observe_parse(durations)
+    return out
+
+def error_row(name: str, tipo_ui: str, exc: BaseException, raw: Optional[bytes]) -> Dict[str, Any]:
+    """Linha da aba Erros para um arquivo que falhou no parse (com inspeção mínima)."""
+    try:
+        if raw is None:
+            raw = Path(name).read_bytes()
+        elif isinstance(raw, memoryview):
+            raw = raw.tobytes()
+        sniff = sniff_minimal_from_bytes(raw)
+    except Exception as e2:
+        sniff = {"_sniff_ok": False, "_sniff_erro": f"Falha ao ler/inspecionar: {e2}"}
+    errrow = {"_arquivo": name, "_parser_ui": tipo_ui, "_erro": str(exc)}
+    errrow.update(sniff)
+    return errrow
+
+def iter_parse(
+    paths: Iterable[Any],
+    tipo_ui: str,
+    uploads: Iterable[Tuple[str, bytes]] = (),
+    max_workers: int = 64,
+    io_workers: int = 8,
+    read_ahead_bytes: int = 256 * 1024 * 1024,
+    tuner=None,
+    max_file_bytes: Optional[int] = None,
+    timeout_s: Optional[float] = None,
+    quarantine=None,
+    lpt: bool = True,
+    batch_bytes: int = BATCH_BYTES,
+    blobs=None,
+    validator=None,
+    metrics=None,
+    memory=None,
+) -> Iterator[Tuple[str, Optional[List[Dict[str, Any]]], Optional[Dict[str, Any]]]]:
+    """
+    Pipeline em dois estágios: leitura (Prefetcher) -> parse (pool em janela).
+    Gera (nome, linhas, None) em caso de sucesso ou (nome, None, linha_de_erro).
+    `tuner` (ConcurrencyTuner) controla a janela do parse; sem ele usa max_workers.
+
+    Orçamentos por arquivo: acima de `max_file_bytes`, ou passando de `timeout_s`
+    no pool principal, o arquivo vai para a quarentena (QuarantineLane, processos
+    que podem ser mortos). Sem `quarantine`, uma faixa pequena é criada aqui.
+
+    Escalonamento (utils/schedule.py): com `lpt`, maiores primeiro; arquivos
+    pequenos vão em lotes de até `batch_bytes` por tarefa (0 desliga).
+
+    `blobs` (utils.blobs.BlobStore, opcional) guarda uma cópia de cada XML lido
+    do disco; uploads já devem chegar guardados (ver app.py).
+
+    `validator` (utils.xsd.XsdValidator, opcional) valida cada XML contra o XSD
+    no próprio worker; inválido vira linha de erro.
+
+    `metrics` (utils.metrics.Metrics, opcional) recebe arquivos, bytes, erros por
+    parser, tempos de parse e os gauges de fila/pool, uma vez por lote.
+
+    `memory` (utils.memory.MemoryGuard, opcional): perto do limite de memória,
+    janela, read-ahead e lotes encolhem (ver utils/memory.py).
+    """
+    from utils.quarantine import QuarantineLane, quarantine_error_row
+
+    own_lane = quarantine is None and bool(max_file_bytes or timeout_s)
+    if own_lane:
+        quarantine = QuarantineLane(timeout_s=max(60.0, (timeout_s or 0) * 4))
+    lane_pending: Dict[Any, Tuple[str, str]] = {}
+
+    def to_quarantine(name: str, raw: Optional[bytes], reason: str) -> None:
+        if metrics is not None:
+            metrics.quarantined()
+        # caminho em disco: o filho relê o arquivo (não copia bytes grandes pelo pipe)
+        send = None if raw is None or Path(name).is_file() else raw
+        lane_pending[quarantine.submit(name, send, tipo_ui, reason)] = (name, reason)
+
+    def lane_results(block: bool):
+        done = [f for f in lane_pending if f.done()] if not block else list(lane_pending)
+        for fut in done:
+            name, reason = lane_pending.pop(fut)
+            try:
+                yield name, fut.result(), None
+            except Exception as e:
+                yield name, None, quarantine_error_row(name, tipo_ui, e, reason)
+
+    def counted(results):
+        if metrics is None:
+            return results
+        results = list(results)
+        metrics.files_done(results)
+        return results
+
+    if lpt:
+        paths = order_lpt(paths)
+        uploads = sorted(uploads, key=lambda u: len(u[1]), reverse=True)
+    prefetcher = Prefetcher(paths, readers=io_workers, max_bytes=read_ahead_bytes,
+                            max_file_bytes=max_file_bytes)
+    window = (lambda: tuner.limit) if tuner else (lambda: max_workers)
+    if memory is not None:
+        window = memory.window(window)
+
+    def batch_limit() -> int:
+        # no máximo metade do read-ahead atual: o lote em formação não pode segurar o orçamento
+        # que os leitores precisam para completá-lo (max_bytes encolhe com a contrapressão)
+        limit = memory.scale(batch_bytes) if memory is not None else batch_bytes
+        return min(limit, prefetcher.budget.max_bytes // 2)
+
+    fn_batch = tuner.wrap(parse_batch) if tuner else parse_batch
+
+    def parse_and_release(batch, *args):
+        # devolve o orçamento quando o parse termina, não quando o consumidor chega ao
+        # resultado: ele pode estar parado esperando o próximo item lido (como no Job)
+        try:
+            return fn_batch(batch, *args)
+        finally:
+            for item in batch:
+                prefetcher.release(item)
+    too_big = f"arquivo acima do limite de {max_file_bytes / (1024 * 1024):g} MB" if max_file_bytes else ""
+
+    def iter_items():
+        for item in prefetcher:
+            if blobs is not None and item.raw is not None:
+                blobs.put(item.name, item.raw)
+            if item.oversize:
+                to_quarantine(item.name, None, too_big)
+            else:
+                yield item
+        for name, raw in uploads:
+            if max_file_bytes and len(raw) > max_file_bytes:
+                to_quarantine(name, raw, too_big)
+            else:
+                yield Prefetched(name, raw, 0)
+
+    in_pool = [0]  # arquivos submetidos e ainda sem resultado (só a thread consumidora mexe)
+
+    def iter_tasks():
+        for batch in batch_small(iter_items(), batch_bytes=batch_limit):
+            in_pool[0] += len(batch)
+            yield parse_and_release, (batch, tipo_ui, validator, metrics), batch
+
+    if metrics is not None:
+        metrics.attach(fila_bytes=lambda: prefetcher.budget.used, fila_arquivos=lambda: prefetcher.queued,
+                       no_pool=lambda: in_pool[0], threads=window)
+
+    # thread presa em parse abandonado continua ocupando o pool: sai da janela e, passando do
+    # limite de presas, o pool é trocado (utils/executor.py)
+    ex = AbandonablePool(max_workers)
+
+    def window_free() -> int:
+        return max(1, min(window(), max_workers - ex.stuck))
+
+    try:
+        for batch, fut in iter_windowed(ex, iter_tasks(), window_free, timeout_s=timeout_s):
+            outs: List[Tuple[str, Any, Any]] = []
+            if not fut.done():
+                # estourou o prazo: a thread segue presa, os arquivos do lote vão para a quarentena
+                ex.abandon(fut)
+                for item in batch:
+                    to_quarantine(item.name, item.raw, f"prazo de {timeout_s:g}s excedido no lote principal")
+            else:
+                outs = fut.result()  # parse_batch não levanta: erros viram linhas de erro
+            in_pool[0] -= len(batch)
+            if memory is not None:
+                prefetcher.budget.max_bytes = memory.scale(read_ahead_bytes)
+            if metrics is not None:
+                metrics.files_done(outs, sum(item.size or len(item.raw or b"") for item in batch))
+            for item in batch:
+                prefetcher.release(item)
+                if tuner:
+                    tuner.task_done()
+            batch.clear()
+            yield from outs
+            if lane_pending:
+                yield from counted(lane_results(block=False))
+        yield from counted(lane_results(block=True))
+    finally:
+        if metrics is not None:
+            metrics.detach()
+        ex.shutdown(wait=True, cancel_futures=True)
+        prefetcher.close()
+        if own_lane:
+            quarantine.close()
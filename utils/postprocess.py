@@ -0,0 +1,287 @@
+# utils/postprocess.py
+"""
+Pós-processamento do DataFrame de notas (pandas): normalização de valores,
+datas e movimento, e o tratamento de cancelamentos (110111). Compartilhado
+entre o app, o merge de shards e demais modos em lote.
+"""
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from utils.chave import emit_from_keys, fill_from_chave
+from utils.rows import categorize
+from utils.values import (  # noqa: F401 (reexportados)
+    EVENT_PARSER, NF_PARSERS, infer_movimento, is_cancel_event, is_missing, normalize_key,
+)
+
+
+def to_number_maybe_br(x):
+    if pd.isna(x):
+        return pd.NA
+    s = str(x).strip()
+    if s == "":
+        return pd.NA
+    if "," in s and "." in s:
+        s = s.replace(".", "").replace(",", ".")
+    elif "," in s and "." not in s:
+        s = s.replace(",", ".")
+    return pd.to_numeric(s, errors="coerce")
+
+def to_percent_decimal(x):
+    v = to_number_maybe_br(x)
+    if pd.isna(v):
+        return pd.NA
+    try:
+        v = float(v)
+    except Exception:
+        return pd.NA
+    return v / 100.0 if v > 1.0 else v
+
+def to_datetime_col(x):
+    return pd.to_datetime(x, errors="coerce")
+
+EXCEL_TZ = "America/Fortaleza"
+
+# Cabeçalhos da planilha "Notas" exportada pelo app
+EXCEL_COLUMNS = {
+    "vNF": "Valor",
+    "emissao": "Data de Emissão",
+    "emit_CNPJ": "CNPJ Emitente",
+    "emit_xNome": "Nome Emitente",
+    "dest_CNPJ": "CNPJ Destinatário",
+    "dest_xNome": "Nome Destinatário",
+    "nNF": "Número NF",
+    "serie": "Série",
+    "movimento": "Tipo (Entrada/Saída)",
+    "CFOPs_itens": "CFOP(s) da Nota",
+    "CFOP_predominante": "CFOP Predominante",
+    "vBC_ICMS": "BC ICMS",
+    "vICMS": "Valor ICMS",
+    "vBC_ST": "BC ICMS ST",
+    "vICMS_ST": "Valor ICMS ST",
+}
+
+def strip_tz_for_excel(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    tz_cols = out.select_dtypes(include=["datetimetz"]).columns
+    for c in tz_cols:
+        try:
+            out[c] = out[c].dt.tz_convert(EXCEL_TZ).dt.tz_localize(None)
+        except Exception:
+            out[c] = out[c].dt.tz_localize(None)
+    return out
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalizações gerais / enriquecimento antes do cancelamento (in-place)."""
+    if not df.empty:
+        # Moedas
+        if "vNF" in df.columns: df["vNF"] = df["vNF"].map(to_number_maybe_br)
+        if "valor_iss" in df.columns: df["valor_iss"] = df["valor_iss"].map(to_number_maybe_br)
+        for col in ["vTPrest", "vRec", "vCarga"]:
+            if col in df.columns: df[col] = df[col].map(to_number_maybe_br)
+
+        # Datas
+        for dcol in ["emissao", "competencia", "cancelado_em"]:
+            if dcol in df.columns: df[dcol] = df[dcol].map(to_datetime_col)
+
+        # Alíquota base 1
+        if "aliquota" in df.columns: df["aliquota"] = df["aliquota"].map(to_percent_decimal)
+
+        # Movimento (NF-e/NFC-e)
+        if "tpNF" in df.columns:
+            df["movimento"] = df.apply(lambda r: infer_movimento(r.to_dict()), axis=1)
+        else:
+            df["movimento"] = df.get("movimento", "Desconhecido")
+
+        # Campos que a chave carrega (modelo, série, número, emitente), onde faltarem
+        fill_from_chave(df, EVENT_PARSER)
+        categorize(df)
+    return df
+
+
+_CANCEL_COLS = ["__key", "cancelado_em", "cancel_nProt", "_arquivo_evento"]
+
+
+def add_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """__key (chave normalizada) p/ NF-e/NFC-e (chave) e eventos (chNFe), in-place."""
+    df["__key"] = None
+    if "chave" in df.columns:
+        df.loc[df["_parser"].isin(NF_PARSERS), "__key"] = df.loc[df["_parser"].isin(NF_PARSERS), "chave"].map(normalize_key)
+    if "chNFe" in df.columns:
+        mask_ev = df["_parser"].eq(EVENT_PARSER)
+        df.loc[mask_ev & df["__key"].isna(), "__key"] = df.loc[mask_ev, "chNFe"].map(normalize_key)
+    return df
+
+
+def cancel_lookup(ev: pd.DataFrame) -> pd.DataFrame:
+    """Último evento de cancelamento por __key (eventos já com __key)."""
+    cancel_info = pd.DataFrame(columns=_CANCEL_COLS)
+    if ev.empty:
+        return cancel_info
+    ev = ev.copy()
+    if "tpEvento" in ev.columns:
+        ev["tpEvento"] = ev["tpEvento"].astype(str).str.strip()
+    if "descEvento" in ev.columns:
+        ev["descEvento"] = ev["descEvento"].astype(str).str.strip().str.lower()
+    if "dhEvento" in ev.columns:
+        ev["dhEvento"] = pd.to_datetime(ev["dhEvento"], errors="coerce")
+
+    cancel_mask = pd.Series(False, index=ev.index)
+    if "tpEvento" in ev.columns:
+        cancel_mask |= ev["tpEvento"].eq("110111")
+    if "descEvento" in ev.columns:
+        cancel_mask |= ev["descEvento"].str.contains("cancel", na=False)
+    ev_cancel = ev[cancel_mask].copy()
+
+    if not ev_cancel.empty:
+        ev_cancel = ev_cancel.sort_values(["__key", "dhEvento"], ascending=[True, True])
+        last = ev_cancel.groupby("__key", as_index=False).tail(1)
+
+        # montar lookup com arquivo do evento também
+        keep_cols = ["__key", "_arquivo"]
+        if "dhEvento" in last.columns:
+            keep_cols.append("dhEvento")
+        if "nProt_retEvento" in last.columns:
+            keep_cols.append("nProt_retEvento")
+        if "emit_CNPJ" in last.columns:   # <--- NOVO
+            keep_cols.append("emit_CNPJ")
+
+        cancel_info = last[keep_cols].rename(columns={
+            "dhEvento": "cancelado_em",
+            "nProt_retEvento": "cancel_nProt",
+            "_arquivo": "_arquivo_evento"
+        })
+    return cancel_info
+
+
+def split_canceled(df: pd.DataFrame, cancel_info: pd.DataFrame, erros: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    a) NF reais canceladas (NF-e/NFC-e): vão para `erros` e saem do DataFrame.
+    `df` precisa ter __key. Retorna o DataFrame sem as canceladas.
+    """
+    if cancel_info.empty or df.empty:
+        return df
+    keys_cancel = set(cancel_info["__key"].dropna().astype(str))
+    mask_nf = df["_parser"].isin(NF_PARSERS)
+    nf_canceladas = df[mask_nf & df["__key"].isin(keys_cancel)].copy()
+    if nf_canceladas.empty:
+        return df
+
+    idx_canceladas = nf_canceladas.index  # merge recria o índice
+    nf_canceladas = nf_canceladas.merge(
+        cancel_info.drop(columns=["emit_CNPJ"], errors="ignore"), on="__key", how="left"
+    )
+
+    # normaliza tipos (garante que vão “inteiros” para o Excel)
+    if "emissao" in nf_canceladas.columns:
+        nf_canceladas["emissao"] = pd.to_datetime(nf_canceladas["emissao"], errors="coerce")
+    if "vNF" in nf_canceladas.columns:
+        nf_canceladas["vNF"] = nf_canceladas["vNF"].map(to_number_maybe_br)
+
+    for _, r in nf_canceladas.iterrows():
+        erros.append({
+            "tipo": "NF cancelada",
+            "chave": r.get("chave") or normalize_key(r.get("chave")),
+            "nNF": r.get("nNF"),
+            "serie": r.get("serie"),
+            "emissao": r.get("emissao"),
+            "vNF": r.get("vNF"),
+            "emit_CNPJ": r.get("emit_CNPJ"),
+            "emit_xNome": r.get("emit_xNome"),
+            "dest_CNPJ": r.get("dest_CNPJ"),
+            "dest_xNome": r.get("dest_xNome"),
+            "cancelado_em": r.get("cancelado_em"),
+            "cancel_nProt": r.get("cancel_nProt"),
+            "_arquivo_nota": r.get("_arquivo"),
+            "_arquivo_evento": r.get("_arquivo_evento"),
+        })
+
+    # remove da tabela principal
+    return df.drop(index=idx_canceladas, errors="ignore")
+
+
+def orphan_cancellations(cancel_info: pd.DataFrame, keys_nf: set, erros: List[Dict[str, Any]]) -> None:
+    """b) Cancelada SEM XML da NF (apenas evento): chaves canceladas fora de `keys_nf`."""
+    if cancel_info.empty:
+        return
+    keys_cancel = set(cancel_info["__key"].dropna().astype(str))
+    apenas_evento = sorted(keys_cancel - keys_nf)
+    if not apenas_evento:
+        return
+    lk = cancel_info.set_index("__key")
+    emit_das_chaves = emit_from_keys(pd.Series(apenas_evento, dtype="string")).tolist()
+    for k, emit_da_chave in zip(apenas_evento, emit_das_chaves):
+        emit_do_evento = lk.at[k, "emit_CNPJ"] if ("emit_CNPJ" in lk.columns and k in lk.index) else None
+        erros.append({
+            "tipo": "NF cancelada (sem XML da nota)",
+            "chave": k,
+            "nNF": None,
+            "serie": None,
+            "emissao": None,
+            "vNF": None,
+            "emit_CNPJ": emit_do_evento or emit_da_chave,  # << NOVO
+            "emit_xNome": None,  # evento não traz nome
+            "dest_CNPJ": None,
+            "dest_xNome": None,
+            "cancelado_em": lk.at[k, "cancelado_em"] if ("cancelado_em" in lk.columns and k in lk.index) else None,
+            "cancel_nProt": lk.at[k, "cancel_nProt"] if ("cancel_nProt" in lk.columns and k in lk.index) else None,
+            "_arquivo_nota": None,
+            "_arquivo_evento": lk.at[k, "_arquivo_evento"] if ("_arquivo_evento" in lk.columns and k in lk.index) else None,
+        })
+
+
+def apply_cancellations(df: pd.DataFrame, erros: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    CANCELAMENTO 110111 ⇒ envia para `erros` e exclui da tabela principal.
+    Retorna o novo DataFrame (sem notas canceladas e sem eventos).
+    """
+    if len(df) > 0:
+        add_keys(df)
+
+        # 1) lookup do último evento de cancelamento por chave
+        cancel_info = cancel_lookup(df[df["_parser"] == EVENT_PARSER])
+
+        # 2) Mover canceladas para "Erros"
+        if not cancel_info.empty:
+            keys_nf = set(df.loc[df["_parser"].isin(NF_PARSERS), "__key"].dropna().astype(str))
+            df = split_canceled(df, cancel_info, erros)
+            orphan_cancellations(cancel_info, keys_nf, erros)
+
+            # c) Remover eventos da tabela principal sempre (independente do checkbox)
+            if df is not None and not df.empty and "_parser" in df.columns:
+                df = df[df["_parser"] != EVENT_PARSER]
+
+        # limpar coluna técnica
+        if "__key" in df.columns:
+            df.drop(columns=["__key"], inplace=True)
+    return df
+
+
+def export_frame(df: pd.DataFrame, path: str, sheet_name: str = "Notas") -> None:
+    """Grava o DataFrame conforme a extensão: .csv, .parquet ou .xlsx."""
+    ext = path.lower().rsplit(".", 1)[-1]
+    if ext == "csv":
+        df.to_csv(path, index=False)
+    elif ext == "parquet":
+        out = df.copy()
+        for c in out.columns:
+            # colunas object misturam str/Timestamp/float: parquet exige tipo único
+            if out[c].dtype == object:
+                out[c] = out[c].map(lambda v: None if is_missing(v) else str(v))
+        out.to_parquet(path, index=False)
+    elif ext == "xlsx":
+        strip_tz_for_excel(df).to_excel(path, index=False, sheet_name=sheet_name)
+    else:
+        raise ValueError(f"Formato de saída não suportado: .{ext} (use .csv, .parquet ou .xlsx)")
+
+
+def read_frame(path) -> pd.DataFrame:
+    """Lê um arquivo gravado por export_frame (mesma ordem de linhas); aceita upload com `.name`."""
+    ext = str(getattr(path, "name", path)).lower().rsplit(".", 1)[-1]
+    if ext == "csv":
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    if ext == "parquet":
+        return pd.read_parquet(path)
+    if ext == "xlsx":
+        return pd.read_excel(path, dtype=str)  # chaves e CNPJs como texto (senão viram float)
+    raise ValueError(f"Formato não suportado: .{ext} (use .csv, .parquet ou .xlsx)")
@@ -0,0 +1,149 @@
+# utils/prefetch.py
+"""
+Estágio de leitura (I/O) separado do parse (CPU).
+
+Threads leitoras dedicadas leem os bytes dos arquivos à frente do parse,
+limitadas por um orçamento em BYTES (não em quantidade de arquivos). Quem
+consome devolve o orçamento com `release()` quando termina de usar o buffer,
+então leitores ficam bloqueados (backpressure) se o parse não acompanhar.
+"""
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+PathLike = Union[str, Path]
+_DONE = object()
+
+
+@dataclass
+class Prefetched:
+    name: str
+    raw: Optional[bytes]
+    size: int
+    error: Optional[BaseException] = None
+    oversize: bool = False  # acima de max_file_bytes: não lido (vai para a quarentena)
+
+
+class ByteBudget:
+    """Semáforo por bytes. Um arquivo maior que o orçamento passa sozinho."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(1, int(max_bytes))
+        self.used = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self, n: int) -> bool:
+        with self._cond:
+            while not self.closed and self.used > 0 and self.used + n > self.max_bytes:
+                self._cond.wait()
+            if self.closed:
+                return False
+            self.used += n
+            return True
+
+    def release(self, n: int) -> None:
+        with self._cond:
+            self.used = max(0, self.used - n)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class Prefetcher:
+    """
+    Itera arquivos já lidos em memória, na ordem em que a leitura termina.
+
+    items: caminhos ou tuplas (caminho, tamanho) — o tamanho evita um stat extra.
+    readers: threads de leitura (concorrência do estágio de I/O).
+    max_bytes: read-ahead máximo em bytes ainda não liberados pelo consumidor.
+    max_file_bytes: arquivos maiores não são lidos; saem com `oversize=True`.
+    """
+
+    def __init__(self, items: Iterable[Union[PathLike, Tuple[PathLike, int]]],
+                 readers: int = 8, max_bytes: int = 256 * 1024 * 1024,
+                 max_file_bytes: Optional[int] = None):
+        self._items = iter(items)
+        self._items_lock = threading.Lock()
+        self.readers = max(1, int(readers))
+        self.budget = ByteBudget(max_bytes)
+        self.max_file_bytes = max_file_bytes
+        self._q: "queue.Queue" = queue.Queue()
+        self._threads = []
+
+    def _next_item(self) -> Optional[Tuple[str, Optional[int]]]:
+        with self._items_lock:
+            try:
+                item = next(self._items)
+            except StopIteration:
+                return None
+        if isinstance(item, tuple):
+            return str(item[0]), item[1]
+        return str(item), None
+
+    def _reader(self) -> None:
+        try:
+            while not self.budget.closed:
+                item = self._next_item()
+                if item is None:
+                    break
+                name, size = item
+                try:
+                    if size is None:
+                        size = os.path.getsize(name)
+                    if self.max_file_bytes and size > self.max_file_bytes:
+                        self._q.put(Prefetched(name, None, 0, oversize=True))
+                        continue
+                    if not self.budget.acquire(size):
+                        break
+                    with open(name, "rb") as f:
+                        raw = f.read()
+                    if len(raw) != size:
+                        # arquivo mudou entre o stat e a leitura: acerta o orçamento. Devolve a
+                        # reserva antes de pedir o tamanho novo, senão o leitor esperaria por si mesmo
+                        self.budget.release(size)
+                        size = len(raw)
+                        if not self.budget.acquire(size):
+                            break
+                    self._q.put(Prefetched(name, raw, size))
+                except Exception as e:
+                    self._q.put(Prefetched(name, None, 0, e))
+        finally:
+            self._q.put(_DONE)
+
+    def __iter__(self) -> Iterator[Prefetched]:
+        for _ in range(self.readers):
+            t = threading.Thread(target=self._reader, daemon=True)
+            t.start()
+            self._threads.append(t)
+        done = 0
+        try:
+            while done < self.readers:
+                item = self._q.get()
+                if item is _DONE:
+                    done += 1
+                    continue
+                yield item
+        finally:
+            self.close()
+
+    @property
+    def queued(self) -> int:
+        """Itens já lidos à espera do consumidor (aproximado)."""
+        return self._q.qsize()
+
+    def release(self, item: Prefetched) -> None:
+        """Devolve ao orçamento os bytes de um item já parseado."""
+        if item.size:
+            self.budget.release(item.size)
+            item.size = 0
+
+    def close(self) -> None:
+        """Interrompe as leituras pendentes (cancelamento / erro no consumidor)."""
+        self.budget.close()
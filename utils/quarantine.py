@@ -0,0 +1,146 @@
+# utils/quarantine.py
+"""
+Faixa de quarentena para XMLs patológicos (muito grandes ou lentos demais).
+
+O lote principal roda em threads, que não podem ser interrompidas no meio de um
+parse do lxml. Arquivos acima do limite de tamanho, ou que estouram o prazo no
+lote principal, vão para esta faixa: poucos processos filhos, um arquivo por
+vez, com prazo próprio. Se o prazo estoura, o processo é morto (e recriado no
+próximo arquivo) e a falha vai para os erros com o motivo. Assim a cauda do
+lote principal fica limitada.
+"""
+import multiprocessing as mp
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+STARTUP_TIMEOUT_S = 60.0
+
+
+class QuarantineError(Exception):
+    pass
+
+
+def _worker(conn, mem_limit_bytes: Optional[int]) -> None:
+    """Processo filho: recebe (nome, bytes|None, tipo_ui) e devolve as linhas."""
+    if mem_limit_bytes:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (mem_limit_bytes, mem_limit_bytes))
+        except (ImportError, ValueError, OSError):
+            pass  # sem limite de memória nesta plataforma
+    from utils.pipeline import parse_buffer_bytes, parse_path
+
+    conn.send(("ready", None))  # imports feitos: o prazo por arquivo não conta a partida
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        name, raw, tipo_ui = msg
+        try:
+            if raw is None:
+                rows = parse_path(Path(name), tipo_ui)
+            else:
+                rows = parse_buffer_bytes(raw, name, tipo_ui)
+            conn.send(("ok", rows))
+        except MemoryError:
+            conn.send(("err", "memória excedida na quarentena"))
+        except Exception as e:
+            conn.send(("err", str(e)))
+
+
+class _Slot:
+    """Um processo filho reaproveitável; morto e recriado quando estoura o prazo."""
+
+    def __init__(self, ctx, mem_limit_bytes: Optional[int]):
+        self._ctx = ctx
+        self._mem = mem_limit_bytes
+        self.proc = None
+        self.conn = None
+
+    def ensure(self) -> None:
+        if self.proc is not None and self.proc.is_alive():
+            return
+        parent, child = self._ctx.Pipe()
+        self.proc = self._ctx.Process(target=_worker, args=(child, self._mem), daemon=True)
+        self.proc.start()
+        child.close()
+        self.conn = parent
+        if not parent.poll(STARTUP_TIMEOUT_S):
+            self.kill()
+            raise QuarantineError("processo de quarentena não iniciou")
+        parent.recv()
+
+    def kill(self) -> None:
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.join(5)
+        if self.conn is not None:
+            self.conn.close()
+        self.proc = self.conn = None
+
+    def stop(self) -> None:
+        if self.proc is not None and self.proc.is_alive():
+            try:
+                self.conn.send(None)
+                self.proc.join(2)
+            except (OSError, ValueError):
+                pass
+        self.kill()
+
+
+class QuarantineLane:
+    """
+    workers: processos filhos (e threads que os acompanham).
+    timeout_s: prazo por arquivo dentro da quarentena.
+    mem_limit_mb: limite de memória de cada processo filho (POSIX).
+    """
+
+    def __init__(self, workers: int = 2, timeout_s: float = 120.0, mem_limit_mb: Optional[int] = 2048):
+        self.timeout_s = timeout_s
+        ctx = mp.get_context("spawn")  # sem fork de um processo cheio de threads
+        mem = mem_limit_mb * 1024 * 1024 if mem_limit_mb else None
+        self._slots: "queue.Queue[_Slot]" = queue.Queue()
+        self._all = [_Slot(ctx, mem) for _ in range(max(1, workers))]
+        for slot in self._all:
+            self._slots.put(slot)
+        self._ex = ThreadPoolExecutor(max_workers=len(self._all), thread_name_prefix="leitor-quarentena")
+
+    def submit(self, name: str, raw: Optional[bytes], tipo_ui: str, reason: str):
+        """Agenda o parse isolado (future com as linhas). `raw=None` faz o filho ler o arquivo pelo caminho."""
+        if isinstance(raw, memoryview):
+            raw = raw.tobytes()  # vai por pickle para o filho
+        return self._ex.submit(self._run, name, raw, tipo_ui, reason)
+
+    def _run(self, name: str, raw: Optional[bytes], tipo_ui: str, reason: str) -> List[Dict[str, Any]]:
+        slot = self._slots.get()
+        try:
+            slot.ensure()
+            slot.conn.send((name, raw, tipo_ui))
+            if not slot.conn.poll(self.timeout_s):
+                slot.kill()
+                raise QuarantineError(f"{reason}; prazo da quarentena excedido ({self.timeout_s:g}s)")
+            try:
+                status, payload = slot.conn.recv()
+            except (EOFError, OSError):
+                slot.kill()
+                raise QuarantineError(f"{reason}; processo de quarentena abortou durante o parse")
+            if status != "ok":
+                raise QuarantineError(f"{reason}; {payload}")
+            return payload
+        finally:
+            self._slots.put(slot)
+
+    def close(self) -> None:
+        self._ex.shutdown(wait=True)
+        for slot in self._all:
+            slot.stop()
+
+
+def quarantine_error_row(name: str, tipo_ui: str, exc: BaseException, reason: str) -> Dict[str, Any]:
+    """Linha da aba Erros para arquivo da quarentena (sem reler o arquivo no processo principal)."""
+    return {"_arquivo": name, "_parser_ui": tipo_ui, "_erro": str(exc), "_quarentena": reason}
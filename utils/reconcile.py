@@ -0,0 +1,181 @@
+# utils/reconcile.py
+"""
+Conciliação do lote com uma lista externa de chaves (SEFAZ, ERP do cliente).
+
+A lista (TXT com uma chave por linha, ou CSV com uma coluna de chaves) é
+normalizada como em normalize_key — só dígitos, últimos 44 — mas em bloco:
+linhas que já são 44 dígitos (o caso comum) não passam por regex. O dígito
+verificador (módulo 11, pesos 2..9 da direita para a esquerda) é conferido
+numa matriz N x 44 de dígitos com um único produto matricial.
+
+As chaves válidas viram um array ordenado e sem repetição (S44, ordenação
+nativa do numpy); faltando e extras saem de busca binária (searchsorted) de um
+array no outro, então milhões de chaves levam poucos segundos.
+"""
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.chave import KEY_LEN, check_digit_ok, decode_chaves, normalize_keys
+from utils.diff import is_store
+from utils.postprocess import read_frame
+
+
+def sorted_unique(keys: np.ndarray) -> np.ndarray:
+    a = np.sort(keys)
+    if len(a) < 2:
+        return a
+    keep = np.empty(len(a), dtype=bool)
+    keep[0] = True
+    np.not_equal(a[1:], a[:-1], out=keep[1:])
+    return a[keep]
+
+
+def in_sorted(values: np.ndarray, ref: np.ndarray) -> np.ndarray:
+    """Máscara de `values` presentes em `ref` (ordenado)."""
+    if len(ref) == 0:
+        return np.zeros(len(values), dtype=bool)
+    i = np.searchsorted(ref, values)
+    i[i == len(ref)] = 0
+    return ref[i] == values
+
+
+def read_key_list(path, column: Optional[str] = None) -> pd.Series:
+    """
+    Lista externa -> Series com o texto de cada linha (índice = nº da linha).
+    TXT: uma chave por linha. CSV/XLSX: a coluna `column` ou, sem ela, a que
+    mais tem valores com 44+ dígitos.
+    """
+    name = str(getattr(path, "name", path)).lower()
+    if name.endswith(".txt"):
+        raw = path.read() if hasattr(path, "read") else open(path, "rb").read()
+        lines = raw.decode("utf-8-sig", errors="replace").splitlines()
+        s = pd.Series(lines, dtype="string")
+        s.index = s.index + 1
+        return s[s.str.strip().ne("")]
+    if name.endswith(".csv"):
+        df = pd.read_csv(path, dtype=str, keep_default_na=False, sep=None, engine="python")
+    else:
+        df = read_frame(path)
+    if column is None:
+        scores = {c: df[c].astype("string").str.count(r"\d").ge(KEY_LEN).mean() for c in df.columns}
+        column = max(scores, key=scores.get) if scores else None
+    if column is None or column not in df.columns:
+        raise ValueError("Coluna de chaves não encontrada na lista.")
+    s = df[column].astype("string")
+    s.index = s.index + 2  # linha 1 = cabeçalho
+    return s
+
+
+@dataclass
+class Reconciliation:
+    faltando: pd.DataFrame   # na lista, sem XML no lote
+    extras: pd.DataFrame     # XML no lote, fora da lista
+    invalidas: pd.DataFrame  # linhas da lista sem chave ou com DV errado
+    lista: int               # chaves válidas (sem repetição) na lista
+    repetidas: int
+    lote: int
+
+    def counts(self) -> Dict[str, int]:
+        return {"lista": self.lista, "repetidas": self.repetidas, "lote": self.lote,
+                "faltando": len(self.faltando), "extras": len(self.extras), "invalidas": len(self.invalidas)}
+
+
+def _describe(keys: np.ndarray) -> pd.DataFrame:
+    s = pd.Series(keys.astype(str), dtype="string")
+    dec = decode_chaves(s)
+    return pd.DataFrame({"chave": s, "emit_CNPJ": dec["emit_CNPJ"], "modelo": dec["modelo"],
+                         "serie": dec["serie"], "numero": dec["numero"]})
+
+
+def _fora(rows: pd.DataFrame, keys: pd.Series, extra_keys: np.ndarray) -> pd.DataFrame:
+    """Linhas de `rows` cuja chave normalizada está em `extra_keys` (ordenado)."""
+    has_key = keys.notna().to_numpy()
+    fora = np.zeros(len(rows), dtype=bool)
+    fora[has_key] = in_sorted(keys[has_key].to_numpy(dtype=f"S{KEY_LEN}"), extra_keys)
+    out = rows.loc[fora].copy()
+    out["chave"] = keys[fora].to_numpy()
+    return out
+
+
+def reconcile(expected: pd.Series, lote: pd.DataFrame,
+              erros: Optional[Iterable[Dict[str, Any]]] = None) -> Reconciliation:
+    """
+    `expected`: texto das linhas da lista (read_key_list). `lote`: resultado
+    (coluna chave); notas canceladas estão em `erros` e contam como lidas.
+    """
+    norm = normalize_keys(expected)
+    bad_len = norm.isna()
+    cand = norm[~bad_len]
+    arr = cand.to_numpy(dtype=f"S{KEY_LEN}")
+    dv_ok = check_digit_ok(arr)
+    invalidas = pd.concat([
+        pd.DataFrame({"linha": expected.index[bad_len.to_numpy()], "valor": expected[bad_len].to_numpy(),
+                      "motivo": "menos de 44 dígitos"}),
+        pd.DataFrame({"linha": cand.index[~dv_ok], "valor": expected[cand.index[~dv_ok]].to_numpy(),
+                      "motivo": "dígito verificador inválido"}),
+    ], ignore_index=True).sort_values("linha", ignore_index=True)
+
+    valid = arr[dv_ok]
+    wanted = sorted_unique(valid)
+    lote_norm = normalize_keys(lote["chave"]) if "chave" in lote.columns else pd.Series(dtype="string")
+    erros = list(erros or ())
+    found = lote_keys(lote_norm, erros)
+
+    faltando = _describe(wanted[~in_sorted(wanted, found)])
+    extra_keys = found[~in_sorted(found, wanted)]
+    extras = pd.DataFrame(columns=["chave"])
+    if len(extra_keys):
+        partes = []
+        if len(lote_norm):
+            cols = [c for c in ("chave", "_parser", "nNF", "nCT", "serie", "emissao", "emit_CNPJ", "vNF", "_arquivo")
+                    if c in lote.columns]
+            partes.append(_fora(lote[cols], lote_norm, extra_keys))
+        canc = pd.DataFrame(_canceladas(erros))
+        if not canc.empty:
+            # canceladas também vieram com XML: entram nos extras para fechar com a contagem do lote
+            # _arquivo da linha de erro (lida de um arquivo de erros) não é o da nota: usa _arquivo_nota
+            cols = [c for c in ("chave", "nNF", "serie", "emissao", "emit_CNPJ", "vNF", "_arquivo_nota")
+                    if c in canc.columns]
+            canc = canc[cols].rename(columns={"_arquivo_nota": "_arquivo"}).assign(_parser="NF cancelada")
+            partes.append(_fora(canc, normalize_keys(canc["chave"]), extra_keys))
+        extras = pd.concat(partes, ignore_index=True).drop_duplicates("chave").sort_values("chave", ignore_index=True)
+    return Reconciliation(faltando=faltando, extras=extras, invalidas=invalidas,
+                          lista=len(wanted), repetidas=len(valid) - len(wanted), lote=len(found))
+
+
+def _canceladas(erros: Optional[Iterable[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Notas lidas e depois canceladas; "NF cancelada (sem XML da nota)" não conta como lida."""
+    return [e for e in erros or () if str(e.get("tipo", "")) == "NF cancelada"]
+
+
+def lote_keys(keys: pd.Series, erros: Optional[Iterable[Dict[str, Any]]] = None) -> np.ndarray:
+    """Chaves já normalizadas do lote (+ canceladas de `erros`), ordenadas e sem repetição."""
+    parts: List[pd.Series] = [keys.dropna()]
+    canceladas = [e.get("chave") for e in _canceladas(erros)]
+    if canceladas:
+        parts.append(normalize_keys(pd.Series(canceladas, dtype=object)).dropna())
+    keys = pd.concat(parts, ignore_index=True)
+    return sorted_unique(keys.to_numpy(dtype=f"S{KEY_LEN}"))
+
+
+def load_lote(spec: str, erros: Optional[str] = None, runs_dir: Optional[str] = None):
+    """(DataFrame, erros) de uma exportação, base SQLite ou run:<ID> (como no diff)."""
+    if spec.startswith("run:"):
+        from utils.checkpoint import RunCheckpoint
+        from utils.watch import load_store
+
+        return load_store(RunCheckpoint(spec[4:], runs_dir=runs_dir, read_only=True))
+    if is_store(spec):
+        conn = sqlite3.connect(spec)
+        try:
+            df = pd.read_sql_query("SELECT chave, parser AS _parser, numero AS nNF, serie, emissao, emit_CNPJ, "
+                                   "vNF, arquivo AS _arquivo FROM notas WHERE chave IS NOT NULL", conn)
+        finally:
+            conn.close()
+        return df, []
+    df = read_frame(spec)
+    return df, read_frame(erros).to_dict("records") if erros else []
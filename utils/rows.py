@@ -0,0 +1,100 @@
+# utils/rows.py
+"""
+Representação compacta das linhas parseadas.
+
+Cada parser devolve dicts sempre com as mesmas chaves e na mesma ordem, então
+guardamos só a tupla de valores por "schema" (ordem de campos do parser).
+Campos de baixa cardinalidade são internados (sys.intern) no parse e viram
+colunas categóricas quando o DataFrame é montado.
+"""
+import sys
+from array import array
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Valores que se repetem muito entre notas (mesmo emitente, mesmo CFOP, etc.)
+LOW_CARD_FIELDS = frozenset({
+    "_parser", "tipo", "modelo", "serie", "tpNF", "movimento",
+    "emit_CNPJ", "emit_xNome", "emit_IM", "dest_CNPJ", "dest_xNome",
+    "rem_CNPJ", "rem_xNome",
+    "CFOP", "CFOPs_itens", "CFOP_predominante", "natOp", "tpCTe",
+    "status", "autorizacao", "tpEvento", "descEvento",
+    "municipio", "modelo_nfse", "sentido_nfse", "iss_retido",
+    "itemListaServico", "codigoCNAE", "codigoMunicipioServico",
+    "orgaoGeradorCodigo", "orgaoGeradorUF",
+})
+
+Schema = Tuple[str, ...]
+
+
+class RowStore:
+    """
+    Acumula linhas como tuplas agrupadas por schema (ordem de campos do parser).
+    Um dict com ~20 chaves custa ~1 KB; a tupla equivalente, ~200 bytes.
+
+    Com `index` (utils.textindex.TextIndex), cada linha recebe um id na ordem de
+    chegada, é indexada na hora e o id vira o rótulo da linha em `to_frame()`.
+    """
+    __slots__ = ("_schemas", "_rows", "_n", "_ids", "index")
+
+    def __init__(self, index=None):
+        self._schemas: Dict[Schema, Schema] = {}
+        self._rows: Dict[Schema, List[tuple]] = {}
+        self._n = 0
+        self._ids: Dict[Schema, array] = {}
+        self.index = index
+
+    def __len__(self) -> int:
+        return self._n
+
+    def append(self, row: Dict[str, Any]) -> None:
+        key = tuple(row.keys())
+        schema = self._schemas.get(key)
+        if schema is None:
+            schema = self._schemas[key] = tuple(sys.intern(k) for k in key)
+            self._rows[schema] = []
+            self._ids[schema] = array("q")
+        if self.index is not None:
+            self._ids[schema].append(self._n)
+            self.index.add(self._n, row)
+        vals = tuple(
+            sys.intern(v) if (type(v) is str and k in LOW_CARD_FIELDS) else v
+            for k, v in zip(schema, row.values())
+        )
+        self._rows[schema].append(vals)
+        self._n += 1
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.append(row)
+
+    def iter_dicts(self) -> Iterable[Dict[str, Any]]:
+        for schema, rows in self._rows.items():
+            for vals in rows:
+                yield dict(zip(schema, vals))
+
+    def to_frame(self) -> "pd.DataFrame":
+        import pandas as pd
+
+        frames = [
+            pd.DataFrame.from_records(rows, columns=list(schema))
+            for schema, rows in self._rows.items() if rows
+        ]
+        if not frames:
+            return pd.DataFrame()
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True, sort=False)
+        if self.index is not None:
+            df.index = pd.Index([i for schema, rows in self._rows.items() if rows for i in self._ids[schema]])
+        return categorize(df)
+
+
+def categorize(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Converte (in-place) as colunas de baixa cardinalidade para `category`."""
+    import pandas as pd
+
+    for c in df.columns:
+        if c in LOW_CARD_FIELDS and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype("category")
+    return df
@@ -0,0 +1,63 @@
+# utils/schedule.py
+"""
+Ordem das tarefas de parse pelo custo estimado (tamanho do arquivo).
+
+- LPT (maiores primeiro): num pool dinâmico, submeter os arquivos grandes antes
+  é o escalonamento guloso de Graham; eles não sobram para o fim com uma thread
+  trabalhando e as outras paradas.
+- Arquivos pequenos vão em lotes (uma tarefa do pool parseia vários), o que
+  dilui o custo fixo por tarefa (submit, future, troca de thread).
+
+Os tamanhos vêm do próprio scan (utils.io.iter_xml_entries), sem stat extra.
+"""
+import os
+from typing import Any, Callable, Iterable, Iterator, List, Tuple, Union
+
+SMALL_FILE_BYTES = 64 * 1024
+BATCH_BYTES = 1024 * 1024
+BATCH_MAX_FILES = 64
+
+
+def with_sizes(items: Iterable[Any]) -> List[Tuple[str, int]]:
+    """(caminho, tamanho); itens sem tamanho pagam um stat (0 se falhar: o erro aparece na leitura)."""
+    out = []
+    for item in items:
+        if isinstance(item, tuple):
+            out.append((str(item[0]), int(item[1])))
+            continue
+        try:
+            size = os.path.getsize(item)
+        except OSError:
+            size = 0
+        out.append((str(item), size))
+    return out
+
+
+def order_lpt(items: Iterable[Any]) -> List[Tuple[str, int]]:
+    """Maiores primeiro (estável: empates mantêm a ordem original)."""
+    return sorted(with_sizes(items), key=lambda t: t[1], reverse=True)
+
+
+def batch_small(items: Iterable[Any], small_bytes: int = SMALL_FILE_BYTES,
+                batch_bytes: Union[int, Callable[[], int]] = BATCH_BYTES, max_files: int = BATCH_MAX_FILES) -> Iterator[List[Any]]:
+    """
+    Agrupa itens lidos (Prefetched) em lotes: grandes e com erro de leitura vão
+    sozinhos; pequenos acumulam até `batch_bytes` ou `max_files`. `batch_bytes`
+    pode ser uma função, consultada a cada item (contrapressão de memória).
+    """
+    limit = batch_bytes if callable(batch_bytes) else (lambda: batch_bytes)
+    batch: List[Any] = []
+    acc = 0
+    for item in items:
+        size = len(item.raw) if item.raw is not None else 0
+        batch_bytes_now = limit()
+        if item.raw is None or size > small_bytes or batch_bytes_now <= 0:
+            yield [item]
+            continue
+        batch.append(item)
+        acc += size
+        if acc >= batch_bytes_now or len(batch) >= max_files:
+            yield batch
+            batch, acc = [], 0
+    if batch:
+        yield batch
@@ -0,0 +1,332 @@
+# utils/service.py
+"""
+Serviço HTTP local de parse (biblioteca padrão): o ERP envia XMLs e recebe as
+linhas em NDJSON, uma por nota, à medida que cada documento termina.
+
+    POST /parse              corpo XML (um documento; nome em ?nome=),
+                             multipart/form-data (vários arquivos, .zip aceito)
+                             ou application/zip
+         ?tipo=NF-e          parser preferido (padrão: detecção automática)
+    GET  /saude              processos, requisições e documentos em andamento
+    GET  /metrics            métricas OpenMetrics (utils/metrics.py)
+
+Os processos do pool ficam quentes: parsers, lxml e (com --xsd) os esquemas
+compilados são carregados uma vez por processo, no initializer. Documentos
+pequenos de uma requisição vão juntos por tarefa (batch_small), e cada
+requisição mantém no máximo `window` tarefas no pool (iter_windowed). Acima de
+`max_requests` requisições simultâneas a resposta é 503 com Retry-After e
+Connection: close, sem ler o corpo.
+
+Cada linha do NDJSON é a linha do parser (com _arquivo e _parser) ou a linha
+de erro (com _erro); a última é {"_resumo": {...}}.
+"""
+import io
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from utils.executor import iter_windowed
+from utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Metrics
+from utils.prefetch import Prefetched
+from utils.schedule import BATCH_BYTES, batch_small
+
+TIPO_AUTO = "Auto (detectar)"
+NDJSON = "application/x-ndjson; charset=utf-8"
+MAX_BODY_BYTES = 256 * 1024 * 1024
+ZIP_RATIO = 20  # descompactado até 20x o corpo (contra zip bomb)
+
+# ---------------------------
+# processo do pool
+# ---------------------------
+_VALIDATOR = None
+
+
+class _Durations:
+    """Coleta os tempos de parse_batch no processo filho (volta junto com as linhas)."""
+
+    def __init__(self):
+        self.values: List[float] = []
+
+    def observe_parse(self, durations) -> None:
+        self.values.extend(durations)
+
+
+def _init_worker(xsd: Optional[str]) -> None:
+    global _VALIDATOR
+    import parsers  # noqa: F401
+    import utils.pipeline  # noqa: F401
+
+    if xsd is not None:
+        from utils.xsd import XsdValidator
+        _VALIDATOR = XsdValidator(xsd or None)
+
+
+def _ping(delay: float) -> int:
+    time.sleep(delay)  # segura o processo para o próximo ping ir a outro
+    return os.getpid()
+
+
+def _parse_task(items: List[Prefetched], tipo_ui: str):
+    from utils.pipeline import parse_batch
+
+    durations = _Durations()
+    outs = parse_batch(items, tipo_ui, _VALIDATOR, durations)
+    return outs, durations.values
+
+
+# ---------------------------
+# leitura do corpo
+# ---------------------------
+class RequestError(ValueError):
+    pass
+
+
+def _unzip(name: str, raw: bytes, limit: int) -> List[Tuple[str, bytes]]:
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(raw))
+    except zipfile.BadZipFile as e:
+        raise RequestError(f"{name}: ZIP inválido ({e})")
+    infos = [i for i in zf.infolist() if not i.is_dir() and i.filename.lower().endswith(".xml")]
+    if sum(i.file_size for i in infos) > limit:
+        raise RequestError(f"{name}: conteúdo descompactado acima do limite")
+    return [(f"{name}/{i.filename}", zf.read(i)) for i in infos]
+
+
+def read_documents(content_type: str, body: bytes, nome: Optional[str] = None) -> List[Tuple[str, bytes]]:
+    """Corpo da requisição -> [(nome, bytes do XML)]."""
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    limit = max(len(body), 1) * ZIP_RATIO
+    if ctype in ("application/zip", "application/x-zip-compressed"):
+        return _unzip(nome or "lote.zip", body, limit)
+    if ctype == "multipart/form-data":
+        msg = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+        if not msg.is_multipart():
+            raise RequestError("multipart sem partes")
+        docs: List[Tuple[str, bytes]] = []
+        for i, part in enumerate(msg.iter_parts()):
+            fname = part.get_filename() or part.get_param("name", header="content-disposition") or f"parte{i + 1}.xml"
+            payload = part.get_payload(decode=True) or b""
+            if fname.lower().endswith(".zip") or part.get_content_type() in ("application/zip", "application/x-zip-compressed"):
+                docs.extend(_unzip(fname, payload, limit))
+            else:
+                docs.append((fname, payload))
+        return docs
+    return [(nome or "documento.xml", body)]
+
+
+# ---------------------------
+# serviço
+# ---------------------------
+class ParseService:
+    """
+    processes: processos do pool (padrão: CPUs).
+    window: tarefas no pool por requisição (padrão: 2 x processos).
+    max_requests: requisições atendidas ao mesmo tempo; as demais recebem 503.
+    max_doc_bytes: documento maior vira linha de erro sem ir ao pool.
+    xsd: pasta de esquemas para validar nos processos (None = sem validação).
+    """
+
+    def __init__(self, processes: Optional[int] = None, tipo_ui: str = TIPO_AUTO, window: Optional[int] = None,
+                 max_requests: int = 8, batch_bytes: int = BATCH_BYTES, max_body_bytes: int = MAX_BODY_BYTES,
+                 max_doc_bytes: Optional[int] = None, xsd: Optional[str] = None):
+        self.processes = max(1, processes or os.cpu_count() or 1)
+        self.tipo_ui = tipo_ui
+        self.window = max(1, window or self.processes * 2)
+        self.max_requests = max(1, max_requests)
+        self.batch_bytes = batch_bytes
+        self.max_body_bytes = max_body_bytes
+        self.max_doc_bytes = max_doc_bytes
+        self.xsd = xsd
+        if xsd is not None:
+            from utils.xsd import XsdValidator
+            XsdValidator(xsd or None)  # pasta sem esquemas falha aqui, não em cada processo
+        self.metrics = Metrics()
+        self.metrics.attach(fila_bytes=None, fila_arquivos=None, no_pool=lambda: self.inflight,
+                            threads=lambda: self.processes)
+        self.inflight = 0   # documentos no pool
+        self.requests = 0   # requisições em andamento
+        self._slots = threading.BoundedSemaphore(self.max_requests)
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: sem fork de um processo cheio de threads (como na quarentena)
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=mp.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self.xsd,))
+
+    def warm(self) -> int:
+        """Sobe todos os processos (initializer incluso) antes da primeira requisição."""
+        return len(set(self._pool.map(_ping, [0.2] * self.processes)))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def try_acquire(self) -> bool:
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.requests += 1
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.requests -= 1
+        self._slots.release()
+
+    def _too_big(self, name: str, tipo_ui: str) -> Dict[str, Any]:
+        mb = (self.max_doc_bytes or 0) / (1024 * 1024)
+        return {"_arquivo": name, "_parser_ui": tipo_ui, "_erro": f"documento acima do limite de {mb:g} MB"}
+
+    def iter_results(self, docs: List[Tuple[str, bytes]], tipo_ui: Optional[str] = None
+                     ) -> Iterator[Tuple[str, Optional[List[Dict[str, Any]]], Optional[Dict[str, Any]]]]:
+        """(nome, linhas, None) ou (nome, None, erro) por documento, na ordem em que terminam."""
+        tipo_ui = tipo_ui or self.tipo_ui
+        items = []
+        for name, raw in docs:
+            if self.max_doc_bytes and len(raw) > self.max_doc_bytes:
+                yield name, None, self._too_big(name, tipo_ui)
+            else:
+                items.append(Prefetched(name, raw, len(raw)))
+        pool = self._pool
+        tasks = ((_parse_task, (batch, tipo_ui), batch) for batch in batch_small(items, batch_bytes=self.batch_bytes))
+        for batch, fut in iter_windowed(pool, self._counted(tasks), lambda: self.window):
+            with self._lock:
+                self.inflight -= len(batch)
+            try:
+                outs, durations = fut.result()
+            except BrokenProcessPool as e:
+                # processo morreu no meio (ex.: falta de memória): erro nos documentos do lote e pool novo
+                self._replace_pool(pool)
+                outs, durations = [(it.name, None, {"_arquivo": it.name, "_parser_ui": tipo_ui,
+                                                    "_erro": f"processo de parse encerrado: {e}"}) for it in batch], []
+            self.metrics.observe_parse(durations)
+            self.metrics.files_done(outs, sum(it.size for it in batch))
+            yield from outs
+
+    def _counted(self, tasks):
+        for task in tasks:
+            with self._lock:
+                self.inflight += len(task[2])
+            yield task
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is broken:
+                self._pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"ok": True, "processos": self.processes, "janela": self.window,
+                    "requisicoes": self.requests, "max_requisicoes": self.max_requests,
+                    "documentos_no_pool": self.inflight}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: ParseService
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code: int, body: bytes, ctype: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, code: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(code, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8",
+                   headers)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/saude":
+            self._json(200, self.service.health())
+        elif path == "/metrics":
+            self._send(200, self.service.metrics.render().encode("utf-8"), METRICS_CONTENT_TYPE)
+        else:
+            self._json(404, {"erro": "rota não encontrada"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path not in ("/", "/parse"):
+            self._json(404, {"erro": "rota não encontrada"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.close_connection = True
+            self._json(411, {"erro": "Content-Length obrigatório"}, {"Connection": "close"})
+            return
+        if length > self.service.max_body_bytes:
+            self.close_connection = True
+            self._json(413, {"erro": f"corpo acima de {self.service.max_body_bytes // (1024 * 1024)} MB"},
+                       {"Connection": "close"})
+            return
+        # vaga antes do corpo: sob sobrecarga, a recusa não lê nem guarda os bytes enviados
+        if not self.service.try_acquire():
+            self.close_connection = True
+            self._json(503, {"erro": "servidor ocupado"}, {"Retry-After": "1", "Connection": "close"})
+            return
+        try:
+            body = self.rfile.read(length)
+            q = parse_qs(url.query)
+            try:
+                docs = read_documents(self.headers.get("Content-Type", ""), body, (q.get("nome") or [None])[0])
+            except RequestError as e:
+                self._json(400, {"erro": str(e)})
+                return
+            del body
+            self._stream(docs, (q.get("tipo") or [None])[0])
+        finally:
+            self.service.release()
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def _stream(self, docs: List[Tuple[str, bytes]], tipo_ui: Optional[str]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", NDJSON)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        t0 = time.perf_counter()
+        n_docs = n_rows = n_err = 0
+        results = self.service.iter_results(docs, tipo_ui)
+        try:
+            for _name, rows, errrow in results:
+                n_docs += 1
+                if rows is None:
+                    n_err += 1
+                    rows = [errrow]
+                else:
+                    n_rows += len(rows)
+                self._chunk("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in rows).encode("utf-8"))
+            resumo = {"documentos": n_docs, "linhas": n_rows, "erros": n_err,
+                      "segundos": round(time.perf_counter() - t0, 3)}
+            self._chunk((json.dumps({"_resumo": resumo}, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # cliente desistiu: o resto do lote não é submetido
+        finally:
+            results.close()
+
+
+def make_server(service: ParseService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"service": service})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    return httpd
@@ -0,0 +1,198 @@
+# utils/shards.py
+"""
+Modo shard-and-merge para corpora grandes (vários milhões de XMLs).
+
+1) plan:  lista as entradas e divide em N shards determinísticos por hash do caminho
+          relativo (o mesmo arquivo cai sempre no mesmo shard, em qualquer máquina).
+2) run:   cada shard roda sozinho (mesmo host ou outro) e grava arquivos parciais
+          de notas, eventos e erros.
+3) merge: junta os parciais e roda o cancelamento (110111) GLOBALMENTE, então nota e
+          evento em shards diferentes ainda se encontram.
+
+Layout do diretório de trabalho:
+    manifest.json
+    shard-0000.txt                 (uma linha por arquivo: "<idx_base>\\t<caminho relativo>")
+    shard-0000.notas.jsonl.gz      (linhas de nota como o parser devolveu)
+    shard-0000.eventos.jsonl.gz
+    shard-0000.erros.jsonl.gz
+    shard-0000.resumo.json.gz      (resumo parcial, ver utils/aggregates.py)
+    shard-0000.done.json           (gravado por último; marca o shard como concluído)
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.io import iter_xml_paths_from_dir, read_jsonl_gz, write_jsonl_gz
+
+MANIFEST = "manifest.json"
+EVENT_PARSER = "Evento NF-e"
+
+
+def shard_name(i: int) -> str:
+    return f"shard-{i:04d}"
+
+
+def shard_of(rel_path: str, n: int) -> int:
+    """Shard de um caminho relativo (posix). Estável entre execuções e máquinas."""
+    h = hashlib.blake2b(rel_path.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(h, "big") % n
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+# ---------------------------
+# 1) plan
+# ---------------------------
+def plan_shards(bases: Sequence[str], n: int, work_dir: str) -> Dict[str, Any]:
+    """Varre as pastas, distribui os XMLs em `n` shards e grava o manifesto."""
+    if n < 1:
+        raise ValueError("Número de shards deve ser >= 1.")
+    wd = Path(work_dir)
+    wd.mkdir(parents=True, exist_ok=True)
+    bases_abs = [str(Path(b).resolve()) for b in bases]
+
+    buckets: List[List[str]] = [[] for _ in range(n)]
+    seen = set()
+    for bi, base in enumerate(bases_abs):
+        for p in iter_xml_paths_from_dir(base):
+            rel = Path(p).resolve().relative_to(base).as_posix()
+            if (bi, rel) in seen:
+                continue
+            seen.add((bi, rel))
+            buckets[shard_of(rel, n)].append(f"{bi}\t{rel}")
+
+    shards = []
+    for i, lines in enumerate(buckets):
+        lines.sort()
+        _write_atomic(wd / f"{shard_name(i)}.txt", ("\n".join(lines) + ("\n" if lines else "")).encode("utf-8"))
+        shards.append({"id": i, "arquivos": len(lines)})
+
+    manifest = {"n": n, "bases": bases_abs, "total": sum(len(b) for b in buckets), "shards": shards}
+    _write_atomic(wd / MANIFEST, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+    return manifest
+
+
+def load_manifest(work_dir: str) -> Dict[str, Any]:
+    return json.loads((Path(work_dir) / MANIFEST).read_text(encoding="utf-8"))
+
+
+def shard_paths(work_dir: str, shard_id: int, bases: Optional[Sequence[str]] = None) -> List[str]:
+    """
+    Caminhos absolutos de um shard. `bases` permite remapear as pastas em outro
+    host (mesma ordem do manifesto).
+    """
+    manifest = load_manifest(work_dir)
+    bases = list(bases) if bases else manifest["bases"]
+    if len(bases) != len(manifest["bases"]):
+        raise ValueError(f"Manifesto tem {len(manifest['bases'])} pasta(s) base; recebidas {len(bases)}.")
+    out = []
+    txt = Path(work_dir) / f"{shard_name(shard_id)}.txt"
+    for line in txt.read_text(encoding="utf-8").splitlines():
+        if not line:
+            continue
+        bi, rel = line.split("\t", 1)
+        out.append(os.path.join(bases[int(bi)], *rel.split("/")))
+    return out
+
+
+# ---------------------------
+# 2) run
+# ---------------------------
+def run_shard(work_dir: str, shard_id: int, tipo_ui: str = "Auto (detectar)",
+              bases: Optional[Sequence[str]] = None, **parse_kwargs) -> Dict[str, Any]:
+    """Processa um shard e grava os parciais (notas, eventos, erros e resumo)."""
+    from utils.aggregates import Aggregates
+    from utils.pipeline import iter_parse
+
+    wd = Path(work_dir)
+    name = shard_name(shard_id)
+    paths = shard_paths(work_dir, shard_id, bases)
+
+    notas: List[Dict[str, Any]] = []
+    eventos: List[Dict[str, Any]] = []
+    erros: List[Dict[str, Any]] = []
+    resumo = Aggregates()
+    for _, rows, errrow in iter_parse(paths, tipo_ui, **parse_kwargs):
+        if rows is None:
+            erros.append(errrow)
+            continue
+        resumo.add(rows)
+        for row in rows:
+            (eventos if row.get("_parser") == EVENT_PARSER else notas).append(row)
+
+    stats = {
+        "shard": shard_id,
+        "arquivos": len(paths),
+        "notas": write_jsonl_gz(wd / f"{name}.notas.jsonl.gz", notas),
+        "eventos": write_jsonl_gz(wd / f"{name}.eventos.jsonl.gz", eventos),
+        "erros": write_jsonl_gz(wd / f"{name}.erros.jsonl.gz", erros),
+    }
+    resumo.save(str(wd / f"{name}.resumo.json.gz"))
+    _write_atomic(wd / f"{name}.done.json", json.dumps(stats).encode("utf-8"))
+    return stats
+
+
+# ---------------------------
+# 3) merge
+# ---------------------------
+def shard_status(work_dir: str) -> Tuple[List[int], List[int]]:
+    """(concluídos, pendentes)."""
+    manifest = load_manifest(work_dir)
+    wd = Path(work_dir)
+    done, pending = [], []
+    for i in range(manifest["n"]):
+        (done if (wd / f"{shard_name(i)}.done.json").exists() else pending).append(i)
+    return done, pending
+
+
+def merge_shards(work_dir: str, allow_partial: bool = False):
+    """
+    Junta os parciais e aplica normalização + cancelamento globalmente.
+    Retorna (df, erros) como o app produziria numa execução única.
+    """
+    from utils.linkage import link_cte_nfe
+    from utils.postprocess import apply_cancellations, normalize_frame
+    from utils.rows import RowStore
+
+    done, pending = shard_status(work_dir)
+    if pending and not allow_partial:
+        raise RuntimeError(f"Shards pendentes: {', '.join(map(str, pending))}")
+
+    wd = Path(work_dir)
+    results = RowStore()
+    erros: List[Dict[str, Any]] = []
+    for i in done:
+        name = shard_name(i)
+        results.extend(read_jsonl_gz(wd / f"{name}.notas.jsonl.gz"))
+        results.extend(read_jsonl_gz(wd / f"{name}.eventos.jsonl.gz"))
+        erros.extend(read_jsonl_gz(wd / f"{name}.erros.jsonl.gz"))
+
+    df = results.to_frame()
+    del results
+    normalize_frame(df)
+    df = apply_cancellations(df, erros)
+    df, _ = link_cte_nfe(df)
+    return df, erros
+
+
+def merge_aggregates(work_dir: str, allow_partial: bool = False):
+    """Resumo global juntando os resumos parciais (sem ler as notas)."""
+    from utils.aggregates import Aggregates
+
+    done, pending = shard_status(work_dir)
+    if pending and not allow_partial:
+        raise RuntimeError(f"Shards pendentes: {', '.join(map(str, pending))}")
+    wd = Path(work_dir)
+    total = Aggregates()
+    for i in done:
+        path = wd / f"{shard_name(i)}.resumo.json.gz"
+        if not path.exists():
+            raise RuntimeError(f"Shard {i} sem resumo parcial (rode shard-run de novo).")
+        total.merge(Aggregates.load(str(path)))
+    return total
@@ -0,0 +1,236 @@
+# utils/spill.py
+"""
+Modo out-of-core: resultados maiores que a RAM.
+
+As linhas parseadas vão para partes Parquet em disco sempre que o buffer passa
+de 1/4 do orçamento de memória. No final, normalização e cancelamento rodam
+parte a parte: o lookup de cancelamentos fica em memória, montado lendo de cada
+parte de eventos só as colunas do lookup e só os cancelamentos (110111 ou
+descrição com "cancel"); CC-e, manifestações e EPEC ficam no disco. Cada parte
+de notas é filtrada contra ele e regravada. A exportação
+lê as partes em sequência, então o pico de memória fica limitado ao orçamento.
+"""
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from utils.postprocess import (
+    EVENT_PARSER, NF_PARSERS, add_keys, cancel_lookup, is_missing, normalize_frame,
+    orphan_cancellations, split_canceled, strip_tz_for_excel,
+)
+from utils.rows import RowStore
+
+MIN_CHUNK_BYTES = 8 * 1024 * 1024
+# colunas dos eventos lidas para o lookup de cancelamentos (o resto fica no disco)
+_CANCEL_READ_COLS = ["_parser", "chave", "chNFe", "tpEvento", "descEvento", "dhEvento", "nProt_retEvento",
+                     "emit_CNPJ", "_arquivo"]
+
+
+def _row_bytes(row: Dict[str, Any]) -> int:
+    """Estimativa barata do custo em memória de uma linha (tupla + valores)."""
+    n = 64 + 8 * len(row)
+    for v in row.values():
+        if type(v) is str:
+            n += 49 + len(v)
+        elif v is not None:
+            n += 24
+    return n
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Colunas object com tipos misturados viram texto (Parquet exige tipo único)."""
+    for c in df.columns:
+        if df[c].dtype == object:
+            df[c] = df[c].map(lambda v: None if is_missing(v) else str(v))
+    return df
+
+
+@dataclass
+class SpillResult:
+    dir: Path
+    parts: List[Path]
+    total: int
+    preview: pd.DataFrame
+    columns: List[str] = field(default_factory=list)
+
+    def iter_frames(self) -> Iterator[pd.DataFrame]:
+        for p in self.parts:
+            yield pd.read_parquet(p).reindex(columns=self.columns)
+
+
+class SpillWriter:
+    """Mesma interface de RowStore (append/extend), mas despeja em disco por partes."""
+
+    def __init__(self, budget_bytes: int = 512 * 1024 * 1024, spill_dir: Optional[str] = None):
+        self.budget_bytes = budget_bytes
+        self.chunk_bytes = max(MIN_CHUNK_BYTES, budget_bytes // 4)
+        self.dir = Path(spill_dir or tempfile.mkdtemp(prefix="leitor_xml_spill_"))
+        (self.dir / "in").mkdir(parents=True, exist_ok=True)
+        self._notas = RowStore()
+        self._eventos = RowStore()
+        self._est = 0
+        self._n = 0
+        self.parts_notas: List[Path] = []
+        self.parts_eventos: List[Path] = []
+
+    def __len__(self) -> int:
+        return self._n
+
+    def append(self, row: Dict[str, Any]) -> None:
+        (self._eventos if row.get("_parser") == EVENT_PARSER else self._notas).append(row)
+        self._n += 1
+        self._est += _row_bytes(row)
+        if self._est >= self.chunk_bytes:
+            self.spill()
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.append(row)
+
+    def spill(self) -> None:
+        """Grava o buffer atual como partes Parquet (brutas, sem normalização)."""
+        for store, parts, kind in ((self._notas, self.parts_notas, "notas"),
+                                   (self._eventos, self.parts_eventos, "eventos")):
+            if not len(store):
+                continue
+            path = self.dir / "in" / f"{kind}-{len(parts) + 1:05d}.parquet"
+            _arrow_safe(store.to_frame()).to_parquet(path, index=False)
+            parts.append(path)
+        self._notas, self._eventos = RowStore(), RowStore()
+        self._est = 0
+
+    def _read_cancel_events(self) -> pd.DataFrame:
+        """Só os eventos de cancelamento das partes, com as colunas do lookup (uma parte por vez)."""
+        import pyarrow.parquet as pq
+
+        frames = []
+        for p in self.parts_eventos:
+            names = set(pq.read_schema(p).names)
+            df = pd.read_parquet(p, columns=[c for c in _CANCEL_READ_COLS if c in names])
+            # mesmo critério de cancel_lookup
+            mask = pd.Series(False, index=df.index)
+            if "tpEvento" in df.columns:
+                mask |= df["tpEvento"].astype(str).str.strip().eq("110111")
+            if "descEvento" in df.columns:
+                mask |= df["descEvento"].astype(str).str.lower().str.contains("cancel", na=False)
+            if mask.any():
+                frames.append(df[mask])
+        if not frames:
+            return pd.DataFrame(columns=["_parser"])
+        return pd.concat(frames, ignore_index=True, sort=False)
+
+    def finalize(self, erros: List[Dict[str, Any]], preview_rows: int = 1000) -> SpillResult:
+        """
+        Normalização + cancelamento parte a parte. Notas canceladas e canceladas
+        sem XML vão para `erros`, como em apply_cancellations.
+        """
+        self.spill()
+        out_dir = self.dir / "out"
+        out_dir.mkdir(exist_ok=True)
+
+        ev = self._read_cancel_events()
+        cancel_info = pd.DataFrame()
+        if not ev.empty:
+            normalize_frame(ev)
+            add_keys(ev)
+            cancel_info = cancel_lookup(ev)
+        del ev
+        keys_cancel = set(cancel_info["__key"].dropna().astype(str)) if not cancel_info.empty else set()
+
+        # sem cancelamentos os eventos ficam na tabela principal (mesma regra do modo em memória),
+        # lidos parte a parte como as notas
+        sources = list(self.parts_notas)
+        if cancel_info.empty:
+            sources.extend(self.parts_eventos)
+
+        keys_nf_canceladas: set = set()
+        out_parts: List[Path] = []
+        columns: Dict[str, None] = {}
+        total = 0
+        preview: List[pd.DataFrame] = []
+        n_preview = 0
+        for i, src in enumerate(sources, start=1):
+            df = pd.read_parquet(src)
+            normalize_frame(df)
+            if keys_cancel and "_parser" in df.columns:
+                add_keys(df)
+                found = df.loc[df["_parser"].isin(NF_PARSERS), "__key"].dropna().astype(str)
+                keys_nf_canceladas.update(k for k in found if k in keys_cancel)
+                df = split_canceled(df, cancel_info, erros)
+                df = df.drop(columns=["__key"])
+            if df.empty:
+                continue
+            path = out_dir / f"notas-{i:05d}.parquet"
+            _arrow_safe(df).to_parquet(path, index=False)
+            out_parts.append(path)
+            columns.update(dict.fromkeys(df.columns))
+            total += len(df)
+            if n_preview < preview_rows:
+                preview.append(df.head(preview_rows - n_preview))
+                n_preview += len(preview[-1])
+
+        orphan_cancellations(cancel_info, keys_nf_canceladas, erros)
+        pv = pd.concat(preview, ignore_index=True, sort=False) if preview else pd.DataFrame()
+        return SpillResult(out_dir, out_parts, total, pv, list(columns))
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# ---------------------------
+# Exportação em streaming
+# ---------------------------
+def export_parts(result: SpillResult, path: str, columns: Optional[List[str]] = None) -> None:
+    """Grava as partes em um único arquivo (.csv, .parquet ou .xlsx) sem carregar tudo."""
+    cols = columns or result.columns
+    ext = path.lower().rsplit(".", 1)[-1]
+    if ext == "csv":
+        tmp = path + ".tmp"
+        first = True
+        for df in result.iter_frames():
+            df[[c for c in cols if c in df.columns]].to_csv(tmp, index=False, mode="w" if first else "a", header=first)
+            first = False
+        if first:
+            pd.DataFrame(columns=cols).to_csv(tmp, index=False)
+        os.replace(tmp, path)
+    elif ext == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # coluna com tipos diferentes entre partes vira texto
+        types: Dict[str, Any] = {}
+        for p in result.parts:
+            for f in pq.read_schema(p):
+                if f.name not in cols or pa.types.is_null(f.type):
+                    continue
+                t = types.get(f.name)
+                types[f.name] = f.type if t is None or t == f.type else pa.string()
+        schema = pa.schema([(c, types.get(c, pa.string())) for c in cols])
+        with pq.ParquetWriter(path, schema) as w:
+            for p in result.parts:
+                t = pq.read_table(p)
+                arrays = [
+                    (t[c] if c in t.column_names else pa.nulls(t.num_rows)).cast(schema.field(c).type)
+                    for c in cols
+                ]
+                w.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    elif ext == "xlsx":
+        from openpyxl import Workbook
+
+        if result.total > 1_048_575:
+            raise ValueError(f"{result.total} linhas excedem o limite do Excel; exporte em .csv ou .parquet.")
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Notas")
+        ws.append(cols)
+        for df in result.iter_frames():
+            df = strip_tz_for_excel(df[cols])
+            for row in df.itertuples(index=False):
+                ws.append([None if is_missing(v) else v for v in row])
+        wb.save(path)
+    else:
+        raise ValueError(f"Formato de saída não suportado: .{ext} (use .csv, .parquet ou .xlsx)")
@@ -0,0 +1,346 @@
+# utils/store.py
+"""
+Base local de documentos fiscais (SQLite, biblioteca padrão).
+
+Tabelas:
+    notas    uma linha por documento; chave = chave de 44 dígitos (NF-e, NFC-e,
+             CT-e) ou "NFSE:<CNPJ emitente>:<número>" para NFS-e
+    itens    CFOPs de cada nota (os parsers extraem os CFOPs, não os itens)
+    eventos  eventos de NF-e por chave; 110111 marca a nota como cancelada
+    erros    último erro de parse por arquivo
+
+Gravação em lote com executemany dentro de transações e upsert pela chave, então
+reprocessar uma pasta não duplica nada. Índices em emit_CNPJ, dest_CNPJ,
+emissão e CFOP respondem consultas como "notas do CNPJ X em março" sem reparse.
+"""
+import json
+import os
+import re
+import sqlite3
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.postprocess import (
+    EVENT_PARSER, infer_movimento, is_cancel_event, is_missing, normalize_key, to_datetime_col,
+    to_number_maybe_br,
+)
+
+DB_PATH = os.environ.get("LEITOR_XML_DB", "notas.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notas (
+    doc_key       TEXT PRIMARY KEY,
+    parser        TEXT,
+    tipo          TEXT,
+    chave         TEXT,
+    numero        TEXT,
+    serie         TEXT,
+    emissao       TEXT,
+    emit_CNPJ     TEXT,
+    emit_xNome    TEXT,
+    dest_CNPJ     TEXT,
+    dest_xNome    TEXT,
+    vNF           REAL,
+    movimento     TEXT,
+    cancelada     INTEGER NOT NULL DEFAULT 0,
+    cancelado_em  TEXT,
+    cancel_nProt  TEXT,
+    arquivo       TEXT,
+    dados         TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_notas_emit ON notas (emit_CNPJ, emissao);
+CREATE INDEX IF NOT EXISTS ix_notas_dest ON notas (dest_CNPJ, emissao);
+CREATE INDEX IF NOT EXISTS ix_notas_emissao ON notas (emissao);
+
+CREATE TABLE IF NOT EXISTS itens (
+    doc_key       TEXT NOT NULL,
+    cfop          TEXT NOT NULL,
+    predominante  INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (doc_key, cfop)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_itens_cfop ON itens (cfop);
+
+CREATE TABLE IF NOT EXISTS eventos (
+    chave         TEXT NOT NULL,
+    tpEvento      TEXT NOT NULL,
+    dhEvento      TEXT NOT NULL,
+    descEvento    TEXT,
+    nProt         TEXT,
+    emit_CNPJ     TEXT,
+    cancelamento  INTEGER NOT NULL DEFAULT 0,
+    arquivo       TEXT,
+    PRIMARY KEY (chave, tpEvento, dhEvento)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS erros (
+    arquivo       TEXT PRIMARY KEY,
+    erro          TEXT,
+    dados         TEXT
+);
+"""
+
+_NOTA_COLS = ("doc_key", "parser", "tipo", "chave", "numero", "serie", "emissao",
+              "emit_CNPJ", "emit_xNome", "dest_CNPJ", "dest_xNome", "vNF", "movimento",
+              "arquivo", "dados")
+_UPSERT_NOTA = (
+    f"INSERT INTO notas ({', '.join(_NOTA_COLS)}) VALUES ({', '.join('?' * len(_NOTA_COLS))}) "
+    "ON CONFLICT(doc_key) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in _NOTA_COLS[1:])
+)
+_UPSERT_EVENTO = (
+    "INSERT INTO eventos (chave, tpEvento, dhEvento, descEvento, nProt, emit_CNPJ, cancelamento, arquivo) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(chave, tpEvento, dhEvento) DO UPDATE SET descEvento = excluded.descEvento, "
+    "nProt = excluded.nProt, emit_CNPJ = excluded.emit_CNPJ, "
+    "cancelamento = excluded.cancelamento, arquivo = excluded.arquivo"
+)
+# último cancelamento da chave (se houver) vai para a nota
+_APPLY_CANCEL = """
+UPDATE notas SET
+    cancelada = 1,
+    cancelado_em = (SELECT e.dhEvento FROM eventos e WHERE e.chave = notas.doc_key AND e.cancelamento = 1
+                    ORDER BY e.dhEvento DESC LIMIT 1),
+    cancel_nProt = (SELECT e.nProt FROM eventos e WHERE e.chave = notas.doc_key AND e.cancelamento = 1
+                    ORDER BY e.dhEvento DESC LIMIT 1)
+WHERE doc_key = ? AND EXISTS (SELECT 1 FROM eventos e WHERE e.chave = ? AND e.cancelamento = 1)
+"""
+
+_ISO_DT = re.compile(r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2})?)?")
+_NUM = re.compile(r"^-?\d+(\.\d+)?$")
+
+
+def _digits(v) -> Optional[str]:
+    if is_missing(v):
+        return None
+    s = re.sub(r"\D", "", str(v))
+    return s or None
+
+
+def _text(v) -> Optional[str]:
+    if is_missing(v):
+        return None
+    s = str(v).strip()
+    return s or None
+
+
+def _datetime_text(v) -> Optional[str]:
+    """'AAAA-MM-DD HH:MM:SS' no horário da própria nota (fuso descartado), ordenável como texto."""
+    s = _text(v)
+    if s is None:
+        return None
+    m = _ISO_DT.match(s)
+    if m:
+        return s[:m.end()].replace("T", " ")
+    ts = to_datetime_col(s)
+    if pd.isna(ts):
+        return None
+    return ts.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _number(v) -> Optional[float]:
+    s = _text(v)
+    if s is None:
+        return None
+    if _NUM.match(s):
+        return float(s)
+    n = to_number_maybe_br(s)
+    return None if pd.isna(n) else float(n)
+
+
+def doc_key(row: Dict[str, Any]) -> Optional[str]:
+    """Chave de upsert: 44 dígitos ou NFS-e por (emitente, número)."""
+    key = normalize_key(row.get("chave"))
+    if key:
+        return key
+    if row.get("tipo") == "NFSe":
+        emit, numero = _digits(row.get("emit_CNPJ")), _text(row.get("numero"))
+        if emit and numero:
+            return f"NFSE:{emit}:{numero.lstrip('0') or '0'}"
+    return None
+
+
+def _json(row: Dict[str, Any]) -> str:
+    return json.dumps({k: v for k, v in row.items() if not is_missing(v)}, ensure_ascii=False, default=str)
+
+
+class DocStore:
+    """Base SQLite. `record`/`flush` acumulam e gravam em lote; `ingest` faz os dois."""
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = 5000):
+        self.path = path = path or DB_PATH
+        self.batch_size = max(1, batch_size)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._reset_buffers()
+
+    def _reset_buffers(self) -> None:
+        self._notas: List[tuple] = []
+        self._itens: List[tuple] = []
+        self._eventos: List[tuple] = []
+        self._erros: List[tuple] = []
+        self._ok_files: List[tuple] = []
+        self._touched: set = set()
+        self._n = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self) -> "DocStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------------------------
+    # gravação
+    # ---------------------------
+    def _add_row(self, row: Dict[str, Any], seq: int) -> None:
+        arquivo = _text(row.get("_arquivo"))
+        if row.get("_parser") == EVENT_PARSER:
+            key = normalize_key(row.get("chNFe"))
+            if key is None:
+                return
+            cancel = is_cancel_event(row)
+            self._eventos.append((
+                key, _text(row.get("tpEvento")) or "", _datetime_text(row.get("dhEvento")) or "",
+                _text(row.get("descEvento")), _text(row.get("nProt_retEvento")),
+                _digits(row.get("emit_CNPJ")), int(cancel), arquivo,
+            ))
+            if cancel:
+                self._touched.add(key)
+            return
+
+        key = doc_key(row) or f"ARQ:{arquivo}:{seq}"
+        self._notas.append((
+            key, _text(row.get("_parser")), _text(row.get("tipo")), normalize_key(row.get("chave")),
+            _text(row.get("nNF") or row.get("nCT") or row.get("numero")), _text(row.get("serie")),
+            _datetime_text(row.get("emissao")),
+            _digits(row.get("emit_CNPJ")), _text(row.get("emit_xNome")),
+            _digits(row.get("dest_CNPJ")), _text(row.get("dest_xNome")),
+            _number(row.get("vNF") if row.get("vNF") is not None else row.get("vTPrest")),
+            infer_movimento(row) if "tpNF" in row else None,
+            arquivo, _json(row),
+        ))
+        cfops = set(filter(None, (c.strip() for c in str(row.get("CFOPs_itens") or "").split(";"))))
+        pred = _text(row.get("CFOP_predominante") or row.get("CFOP"))
+        if pred:
+            cfops.add(pred)
+        self._itens.extend((key, c, int(c == pred)) for c in cfops)
+        self._touched.add(key)
+
+    def record(self, name: str, rows: Optional[List[Dict[str, Any]]], errrow: Optional[Dict[str, Any]]) -> None:
+        """Resultado de um arquivo (mesma assinatura de RunCheckpoint.record)."""
+        if rows is not None:
+            for i, row in enumerate(rows):
+                self._add_row(row, i)
+            self._ok_files.append((name,))
+            self._n += len(rows) or 1
+        if errrow is not None:
+            self._erros.append((name, _text(errrow.get("_erro")), _json(errrow)))
+            self._n += 1
+        if self._n >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._n:
+            return
+        with self.conn:  # uma transação por lote
+            if self._notas:
+                keys = [(r[0],) for r in self._notas]
+                self.conn.executemany("DELETE FROM itens WHERE doc_key = ?", keys)
+                self.conn.executemany(_UPSERT_NOTA, self._notas)
+                self.conn.executemany("INSERT OR IGNORE INTO itens VALUES (?, ?, ?)", self._itens)
+            if self._eventos:
+                self.conn.executemany(_UPSERT_EVENTO, self._eventos)
+            if self._ok_files:
+                self.conn.executemany("DELETE FROM erros WHERE arquivo = ?", self._ok_files)
+            if self._erros:
+                self.conn.executemany("INSERT OR REPLACE INTO erros VALUES (?, ?, ?)", self._erros)
+            if self._touched:
+                self.conn.executemany(_APPLY_CANCEL, [(k, k) for k in self._touched])
+        self._reset_buffers()
+
+    def ingest(self, rows: Iterable[Dict[str, Any]], erros: Iterable[Dict[str, Any]] = ()) -> None:
+        """Grava linhas já parseadas (ex.: RowStore.iter_dicts()) e linhas de erro."""
+        for row in rows:
+            self.record(row.get("_arquivo") or "", [row], None)
+        for err in erros:
+            self.record(err.get("_arquivo") or "", None, err)
+        self.flush()
+
+    def ingest_saved(self, items: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """Regrava itens de RunCheckpoint.iter_saved() (retomada; o upsert é idempotente)."""
+        for kind, data in items:
+            name = data.get("_arquivo") or ""
+            self.record(name, [data] if kind == "row" else None, data if kind == "err" else None)
+        self.flush()
+
+    # ---------------------------
+    # consulta
+    # ---------------------------
+    def notas(
+        self,
+        cnpj: Optional[str] = None,
+        inicio: Optional[str] = None,
+        fim: Optional[str] = None,
+        cfop: Optional[str] = None,
+        tipo: Optional[str] = None,
+        canceladas: bool = False,
+        limit: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Notas por CNPJ (emitente ou destinatário), período de emissão (datas
+        'AAAA-MM-DD', fim inclusivo), CFOP e tipo. Canceladas só com `canceladas`.
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        if cnpj:
+            where.append("(emit_CNPJ = ? OR dest_CNPJ = ?)")
+            params += [_digits(cnpj)] * 2
+        if inicio:
+            where.append("emissao >= ?")
+            params.append(str(inicio)[:10])
+        if fim:
+            where.append("emissao < ?")
+            params.append((date.fromisoformat(str(fim)[:10]) + timedelta(days=1)).isoformat())
+        if cfop:
+            where.append("EXISTS (SELECT 1 FROM itens i WHERE i.doc_key = notas.doc_key AND i.cfop = ?)")
+            params.append(str(cfop).strip())
+        if tipo:
+            where.append("parser = ?")
+            params.append(tipo)
+        if not canceladas:
+            where.append("cancelada = 0")
+        sql = "SELECT * FROM notas"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY emissao"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        df = pd.read_sql_query(sql, self.conn, params=params)
+        df["emissao"] = pd.to_datetime(df["emissao"], errors="coerce")
+        return df
+
+    def erros(self) -> pd.DataFrame:
+        return pd.read_sql_query("SELECT arquivo, erro FROM erros ORDER BY arquivo", self.conn)
+
+    def counts(self) -> Dict[str, int]:
+        out = {}
+        for table in ("notas", "itens", "eventos", "erros"):
+            out[table] = self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        out["canceladas"] = self.conn.execute("SELECT COUNT(*) FROM notas WHERE cancelada = 1").fetchone()[0]
+        return out
+
+
+def expand_dados(df: pd.DataFrame) -> pd.DataFrame:
+    """Acrescenta as colunas originais do parser (coluna `dados`, JSON) ao resultado de `notas()`."""
+    if df.empty or "dados" not in df.columns:
+        return df
+    extra = pd.DataFrame([json.loads(s) if s else {} for s in df["dados"]], index=df.index)
+    extra = extra[[c for c in extra.columns if c not in df.columns]]
+    return pd.concat([df.drop(columns=["dados"]), extra], axis=1)
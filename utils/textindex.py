@@ -0,0 +1,125 @@
+# utils/textindex.py
+"""
+Índice invertido dos campos de texto livre (nomes, natureza, discriminação).
+
+Montado linha a linha enquanto o RowStore recebe as linhas: cada termo
+(sem acento, minúsculo) aponta para os ids das linhas em que aparece, por
+campo. Consultas por termo exato ou por prefixo devolvem os ids, que são os
+rótulos do índice do DataFrame de resultados (ver RowStore.to_frame).
+"""
+import bisect
+import gzip
+import json
+import re
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TEXT_FIELDS = ("emit_xNome", "dest_xNome", "rem_xNome", "natOp", "discriminacao")
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+def normalize_text(s: str) -> str:
+    """Minúsculo e sem acentos ("Manutenção" -> "manutencao")."""
+    s = unicodedata.normalize("NFKD", s)
+    return "".join(ch for ch in s if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(s: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize_text(s))
+
+
+class TextIndex:
+    def __init__(self, fields: Iterable[str] = TEXT_FIELDS):
+        self.fields = tuple(fields)
+        self._post: Dict[str, Dict[str, array]] = {f: {} for f in self.fields}
+        self._vocab: Dict[str, Optional[List[str]]] = {f: None for f in self.fields}  # termos ordenados (prefixo)
+        self._tok_cache: Dict[str, Tuple[str, ...]] = {}  # nomes se repetem muito entre notas
+        self.n_rows = 0
+
+    def _tokens(self, value: str) -> Tuple[str, ...]:
+        toks = self._tok_cache.get(value)
+        if toks is None:
+            toks = tuple(dict.fromkeys(tokenize(value)))
+            if len(value) <= 200 and len(self._tok_cache) < 200_000:
+                self._tok_cache[value] = toks
+        return toks
+
+    def add(self, row_id: int, row: Dict) -> None:
+        """Indexa os campos de texto de uma linha (ids crescentes mantêm as listas ordenadas)."""
+        self.n_rows += 1
+        for f in self.fields:
+            v = row.get(f)
+            if type(v) is not str or not v:
+                continue
+            post = self._post[f]
+            for t in self._tokens(v):
+                ids = post.get(t)
+                if ids is None:
+                    ids = post[t] = array("q")
+                    self._vocab[f] = None
+                if not ids or ids[-1] != row_id:
+                    ids.append(row_id)
+
+    def _term_ids(self, term: str, prefix: bool, fields: Iterable[str]) -> set:
+        out: set = set()
+        for f in fields:
+            post = self._post.get(f)
+            if not post:
+                continue
+            if not prefix:
+                out.update(post.get(term, ()))
+                continue
+            vocab = self._vocab[f]
+            if vocab is None:
+                vocab = self._vocab[f] = sorted(post)
+            i = bisect.bisect_left(vocab, term)
+            while i < len(vocab) and vocab[i].startswith(term):
+                out.update(post[vocab[i]])
+                i += 1
+        return out
+
+    def search(self, query: str, fields: Optional[Iterable[str]] = None, prefix: bool = False) -> List[int]:
+        """
+        Ids das linhas com TODOS os termos da consulta (em qualquer um dos `fields`).
+        Termo terminado em "*" é prefixo; `prefix=True` trata todos como prefixo.
+        """
+        fields = tuple(fields) if fields else self.fields
+        result: Optional[set] = None
+        for raw in query.split():
+            is_prefix = prefix or raw.endswith("*")
+            for term in tokenize(raw):
+                ids = self._term_ids(term, is_prefix, fields)
+                result = ids if result is None else result & ids
+                if not result:
+                    return []
+        return sorted(result) if result else []
+
+    def remap(self, labels: Iterable[int]) -> "TextIndex":
+        """Novo índice com ids posicionais para a ordem de `labels` (ex.: df.index ao exportar)."""
+        pos = {int(label): i for i, label in enumerate(labels)}
+        out = TextIndex(self.fields)
+        out.n_rows = len(pos)
+        for f, post in self._post.items():
+            for t, ids in post.items():
+                new = sorted(pos[i] for i in ids if i in pos)
+                if new:
+                    out._post[f][t] = array("q", new)
+        return out
+
+    def save(self, path: str) -> None:
+        data = {"fields": list(self.fields), "n_rows": self.n_rows,
+                "post": {f: {t: ids.tolist() for t, ids in post.items()} for f, post in self._post.items()}}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "TextIndex":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        out = cls(data["fields"])
+        out.n_rows = data["n_rows"]
+        for f, post in data["post"].items():
+            out._post[f] = {t: array("q", ids) for t, ids in post.items()}
+        return out
@@ -0,0 +1,77 @@
+# utils/values.py
+"""
+Regras por linha usadas durante a ingestão (chave, movimento, cancelamento,
+valores ausentes), sem pandas: workers de parse, shards e índices em memória
+importam só isto. utils/postprocess.py reexporta os mesmos nomes.
+"""
+import re
+import sys
+from typing import Any, Dict, Optional
+
+NF_PARSERS = ["NF-e", "NFC-e"]
+EVENT_PARSER = "Evento NF-e"
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_key(val) -> Optional[str]:
+    """Mantém apenas dígitos e retorna os últimos 44. Se não der, retorna None."""
+    if val is None or (isinstance(val, float) and val != val):
+        return None
+    s = _NON_DIGITS.sub("", str(val))
+    if len(s) < 44:
+        return None
+    return s[-44:]
+
+
+def infer_movimento(row: Dict[str, Any]) -> str:
+    tp = row.get("tpNF")
+    if tp is None:
+        return "Desconhecido"
+    tp = str(tp).strip()
+    if tp == "1":
+        return "Saída"
+    if tp == "0":
+        return "Entrada"
+    return "Desconhecido"
+
+
+def is_cancel_event(row: Dict[str, Any]) -> bool:
+    """Critério de cancel_lookup para uma linha solta: tpEvento 110111 ou descrição com 'cancel'."""
+    if str(row.get("tpEvento") or "").strip() == "110111":
+        return True
+    return "cancel" in str(row.get("descEvento") or "").lower()
+
+
+def is_missing(v) -> bool:
+    """None/NaN/NaT/NA escalares (não quebra com str ou listas)."""
+    if v is None:
+        return True
+    if isinstance(v, (str, bytes, list, tuple, dict)):
+        return False
+    if isinstance(v, float):
+        return v != v
+    # NA/NaT só existem se o pandas já foi carregado por quem criou o valor
+    pd = sys.modules.get("pandas")
+    if pd is None:
+        return False
+    try:
+        return bool(pd.isna(v))
+    except (TypeError, ValueError):
+        return False
+
+
+def number_br(x) -> Optional[float]:
+    """Como postprocess.to_number_maybe_br para um valor solto: '1.234,56' -> 1234.56; inválido -> None."""
+    if is_missing(x):
+        return None
+    s = str(x).strip()
+    if "," in s and "." in s:
+        s = s.replace(".", "").replace(",", ".")
+    elif "," in s:
+        s = s.replace(",", ".")
+    try:
+        v = float(s)
+    except ValueError:
+        return None
+    return None if v != v else v
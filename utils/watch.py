@@ -0,0 +1,200 @@
+# utils/watch.py
+"""
+Modo "pasta vigiada": processa continuamente os XMLs que chegam numa pasta.
+
+- Varredura por polling com os.scandir (sem APIs de SO): uma pasta só é listada
+  de novo quando o mtime dela muda; arquivos novos só entram depois de ficarem
+  `settle_s` segundos sem alteração (o ERP pode estar escrevendo).
+- Micro-lotes: cada lote é parseado e gravado no diário da execução
+  (RunCheckpoint), então um arquivo fica consultável segundos depois de chegar
+  e um reinício não reprocessa nada.
+- Cancelamento: um evento 110111 que chega depois da nota (ou antes dela) é
+  detectado na hora; o estado final sai de `load_store`, que aplica a mesma
+  regra de cancelamento do app sobre tudo o que foi gravado.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.checkpoint import RunCheckpoint
+from utils.io import chunked
+
+XML_EXTS = (".xml", ".XML")
+
+
+class DirScanner:
+    """Lista arquivos .xml novos sob `base` a cada `poll()`."""
+
+    def __init__(self, base: str, settle_s: float = 2.0):
+        self.base = os.path.abspath(base)
+        self.settle_s = settle_s
+        # pasta -> (mtime_ns, instante da listagem, subpastas)
+        self._dirs: Dict[str, Tuple[int, float, List[str]]] = {}
+        self._known: Set[str] = set()        # já entregues por poll()
+        self._pending: Set[str] = set()      # vistos, mas ainda sendo escritos
+
+    def _list_dir(self, d: str, subdirs: List[str], found: List[str]) -> None:
+        with os.scandir(d) as it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        subdirs.append(e.path)
+                    elif e.name.endswith(XML_EXTS) and e.path not in self._known:
+                        found.append(e.path)
+                except OSError:
+                    continue
+
+    def poll(self) -> List[Tuple[str, int]]:
+        """(caminho, tamanho) dos arquivos novos e estáveis desde o último poll."""
+        now = time.time()
+        candidates = set(self._pending)
+        stack = [self.base]
+        seen_dirs = set()
+        while stack:
+            d = stack.pop()
+            seen_dirs.add(d)
+            try:
+                mtime_ns = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+            cached = self._dirs.get(d)
+            # mtime de pasta tem granularidade grosseira: só confia se a listagem
+            # foi feita bem depois da última alteração
+            if cached and cached[0] == mtime_ns and cached[1] - mtime_ns / 1e9 > 1.0:
+                stack.extend(cached[2])
+                continue
+            subdirs: List[str] = []
+            found: List[str] = []
+            try:
+                self._list_dir(d, subdirs, found)
+            except OSError:
+                continue
+            self._dirs[d] = (mtime_ns, now, subdirs)
+            candidates.update(found)
+            stack.extend(subdirs)
+        for d in set(self._dirs) - seen_dirs:
+            del self._dirs[d]
+
+        ready: List[Tuple[str, int]] = []
+        self._pending = set()
+        for p in candidates:
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue  # removido/renomeado antes de ficar pronto
+            if now - st.st_mtime < self.settle_s:
+                self._pending.add(p)
+                continue
+            self._known.add(p)
+            ready.append((p, st.st_size))
+        ready.sort()
+        return ready
+
+
+class CancelTracker:
+    """Chaves de notas ingeridas x chaves com evento de cancelamento (em memória)."""
+
+    def __init__(self):
+        self.notas: Set[str] = set()
+        self.canceladas: Set[str] = set()
+
+    def update(self, rows: Iterable[Dict[str, Any]]) -> List[str]:
+        """Registra as linhas e devolve as chaves de notas que passaram a estar canceladas."""
+        from utils.values import EVENT_PARSER, NF_PARSERS, is_cancel_event, normalize_key
+
+        novas = []
+        for r in rows:
+            parser = r.get("_parser")
+            if parser in NF_PARSERS:
+                key = normalize_key(r.get("chave"))
+                if key and key not in self.notas:
+                    self.notas.add(key)
+                    if key in self.canceladas:
+                        novas.append(key)
+            elif parser == EVENT_PARSER and is_cancel_event(r):
+                key = normalize_key(r.get("chNFe"))
+                if key and key not in self.canceladas:
+                    self.canceladas.add(key)
+                    if key in self.notas:
+                        novas.append(key)
+        return novas
+
+
+def load_store(ckpt: RunCheckpoint):
+    """(df, erros) do que já foi gravado, com normalização + cancelamento + vínculo CT-e."""
+    from utils.linkage import link_cte_nfe
+    from utils.postprocess import apply_cancellations, normalize_frame
+
+    results, erros = ckpt.load()
+    df = results.to_frame()
+    del results
+    normalize_frame(df)
+    df = apply_cancellations(df, erros)
+    df, _ = link_cte_nfe(df)
+    return df, erros
+
+
+def watch_folder(
+    base: str,
+    run_id: str,
+    tipo_ui: str = "Auto (detectar)",
+    runs_dir: Optional[str] = None,
+    poll_s: float = 1.0,
+    settle_s: float = 2.0,
+    batch_max: int = 500,
+    on_batch: Optional[Callable[[RunCheckpoint, Dict[str, Any]], None]] = None,
+    stop: Optional[threading.Event] = None,
+    store=None,
+    **parse_kwargs,
+) -> RunCheckpoint:
+    """
+    Loop de ingestão até `stop` ser sinalizado (ou Ctrl+C). Cada micro-lote vira
+    um bloco no diário de `run_id`; `on_batch(ckpt, stats)` é chamado após cada lote.
+    `store` (DocStore, opcional) recebe o mesmo lote, já com o cancelamento aplicado.
+    """
+    from utils.pipeline import iter_parse
+
+    ckpt = RunCheckpoint(run_id, runs_dir=runs_dir,
+                         params={"modo": "watch", "tipo": tipo_ui, "pasta": os.path.abspath(base)},
+                         flush_every=batch_max, flush_secs=float("inf"))
+    tracker = CancelTracker()
+    for kind, data in ckpt.iter_saved():
+        if kind == "row":
+            tracker.update((data,))
+
+    scanner = DirScanner(base, settle_s=settle_s)
+    stop = stop or threading.Event()
+    try:
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            todo = [(p, size) for p, size in scanner.poll() if p not in ckpt.completed]
+            for batch in chunked(todo, batch_max):
+                n_rows = n_err = 0
+                canceladas: List[str] = []
+                for name, rows, errrow in iter_parse(batch, tipo_ui, **parse_kwargs):
+                    ckpt.record(name, rows, errrow)
+                    if store is not None:
+                        store.record(name, rows, errrow)
+                    if rows is not None:
+                        n_rows += len(rows)
+                        canceladas.extend(tracker.update(rows))
+                    else:
+                        n_err += 1
+                ckpt.flush()
+                if store is not None:
+                    store.flush()
+                if on_batch:
+                    on_batch(ckpt, {
+                        "arquivos": len(batch), "linhas": n_rows, "erros": n_err,
+                        "canceladas": canceladas, "total_arquivos": len(ckpt.completed),
+                        "segundos": round(time.perf_counter() - t0, 2),
+                    })
+                if stop.is_set():
+                    break
+            stop.wait(poll_s)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ckpt.flush()
+    return ckpt
@@ -0,0 +1,136 @@
+# utils/xsd.py
+"""
+Validação opcional contra os esquemas XSD oficiais (pacotes de liberação da
+SEFAZ), dentro dos workers de parse e sobre a árvore que o parse já montou.
+
+Os pacotes não vêm com o programa: descompacte-os numa pasta (ex.: schemas/,
+ou a de LEITOR_XML_XSD) — subpastas são varridas. O esquema de cada documento
+sai da raiz (nfeProc -> procNFe_v4.00.xsd) e da versão do atributo `versao`;
+sem ele, vale a maior versão da pasta.
+
+Compilar um XSD custa muito mais que validar uma nota, e um XMLSchema do lxml
+não pode validar em duas threads ao mesmo tempo (o error_log é do objeto).
+Então cada thread compila cada esquema uma vez e guarda. Documento inválido
+levanta XsdError e vai para os erros; a quarentena (processos filhos) não valida.
+"""
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from lxml import etree
+
+XSD_ENV = "LEITOR_XML_XSD"
+DEFAULT_DIR = Path(__file__).resolve().parent.parent / "schemas"
+MAX_MESSAGES = 3
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+CTE_NS = "http://www.portalfiscal.inf.br/cte"
+
+# (namespace, raiz) -> prefixo do arquivo do esquema (<prefixo>_v<versão>.xsd)
+ROOT_SCHEMAS = {
+    (NFE_NS, "nfeProc"): "procNFe",
+    (NFE_NS, "NFe"): "nfe",
+    (NFE_NS, "procEventoNFe"): "procEventoNFe",
+    (NFE_NS, "evento"): "eventoNFe",
+    (CTE_NS, "cteProc"): "procCTe",
+    (CTE_NS, "CTe"): "cte",
+    (CTE_NS, "procEventoCTe"): "procEventoCTe",
+    (CTE_NS, "eventoCTe"): "eventoCTe",
+}
+
+_FILE_RE = re.compile(r"^(?P<prefixo>[A-Za-z]+)_v(?P<versao>\d+(?:\.\d+)*)\.xsd$")
+
+
+class XsdError(ValueError):
+    pass
+
+
+def _version_key(v: str) -> Tuple[int, ...]:
+    return tuple(int(p) for p in v.split("."))
+
+
+def schema_dir(path: Optional[str] = None) -> Path:
+    return Path(path or os.environ.get(XSD_ENV) or DEFAULT_DIR)
+
+
+class XsdValidator:
+    """Um por execução; compartilhado entre as threads de parse."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.dir = schema_dir(path)
+        if not self.dir.is_dir():
+            raise FileNotFoundError(f"Pasta de esquemas XSD não encontrada: {self.dir}")
+        # prefixo -> {versão: arquivo}; em pacotes repetidos fica o primeiro em ordem de caminho
+        self._files: Dict[str, Dict[str, Path]] = {}
+        for p in sorted(self.dir.rglob("*.xsd")):
+            m = _FILE_RE.match(p.name)
+            if m:
+                self._files.setdefault(m["prefixo"], {}).setdefault(m["versao"], p)
+        if not any(prefixo in self._files for prefixo in ROOT_SCHEMAS.values()):
+            raise FileNotFoundError(f"Nenhum esquema de NF-e/CT-e em {self.dir}")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.validados = 0
+        self.invalidos = 0
+        self.sem_esquema = 0
+        self.compilados = 0
+        self.segundos = 0.0
+
+    def schema_for(self, root: etree._Element) -> Optional[Path]:
+        q = etree.QName(root)
+        versions = self._files.get(ROOT_SCHEMAS.get((q.namespace, q.localname), ""))
+        if not versions:
+            return None
+        versao = (root.get("versao") or "").strip()
+        return versions.get(versao) or versions[max(versions, key=_version_key)]
+
+    def _compiled(self, path: Path) -> etree.XMLSchema:
+        cache = getattr(self._local, "schemas", None)
+        if cache is None:
+            cache = self._local.schemas = {}
+        schema = cache.get(path)
+        if schema is None:
+            try:
+                schema = etree.XMLSchema(etree.parse(str(path)))
+            except (etree.XMLSchemaParseError, etree.XMLSyntaxError) as e:
+                schema = XsdError(f"XSD {path.name}: esquema inválido ({e})")
+            cache[path] = schema
+            with self._lock:
+                self.compilados += 1
+        if isinstance(schema, XsdError):
+            raise schema
+        return schema
+
+    def validate(self, tree: etree._ElementTree) -> None:
+        """Valida a árvore já lida; levanta XsdError com as primeiras mensagens."""
+        t0 = time.perf_counter()
+        path = self.schema_for(tree.getroot())
+        if path is None:
+            with self._lock:
+                self.sem_esquema += 1
+                self.segundos += time.perf_counter() - t0
+            return
+        schema = self._compiled(path)
+        ok = schema.validate(tree)
+        msgs: List[str] = [] if ok else [f"linha {e.line}: {e.message}" for e in schema.error_log]
+        with self._lock:
+            self.validados += 1
+            self.invalidos += 0 if ok else 1
+            self.segundos += time.perf_counter() - t0
+        if not ok:
+            extra = f" (+{len(msgs) - MAX_MESSAGES} erros)" if len(msgs) > MAX_MESSAGES else ""
+            raise XsdError(f"XSD {path.name}: " + "; ".join(msgs[:MAX_MESSAGES]) + extra)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "xsd_validados": self.validados,
+                "xsd_invalidos": self.invalidos,
+                "xsd_sem_esquema": self.sem_esquema,
+                "xsd_esquemas_compilados": self.compilados,
+                "xsd_s": round(self.segundos, 3),
+                "xsd_ms_doc": round(self.segundos * 1000 / self.validados, 2) if self.validados else 0.0,
+            }